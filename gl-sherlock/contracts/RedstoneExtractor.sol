@@ -13,6 +13,17 @@ contract RedstoneExtractor is PrimaryProdDataServiceConsumerBase {
     validateTimestamp(timestamp); //!!!
     return (values[0], timestamp);
   }
+
+  // Certifies several feeds with a single signature check, feedIds are
+  // passed along to the caller as the dataFeedIds to look for.
+  function extractPrices(bytes32[] calldata feedIds, bytes calldata)
+      public view returns(uint256[] memory, uint256)
+  {
+    (uint256[] memory values, uint256 timestamp) =
+        getOracleNumericValuesAndTimestampFromTxMsg(feedIds);
+    validateTimestamp(timestamp);
+    return (values, timestamp);
+  }
 }
 
 // eof
@@ -1,5 +1,4 @@
 # yay
-import math      as Math
 import params    as Params
 import pools     as Pools
 import fees      as Fees
@@ -10,8 +9,8 @@ import positions as Positions
 #
 # The callgraph is:
 #         api --> oracle --> RedstoneExtractor.sol
-#          |
-#          |
+#          |  \
+#          |   --> pools (pool id, token decimals, oracle feed)
 #         core --> ERC20Plus
 #        /  |  \
 #       /   |   \
@@ -20,12 +19,13 @@ import positions as Positions
 #           |    |
 #           params
 #
-# math is a library called by core, pools, and positions
+# math is a library compiled into core, pools, fees, and positions
 import core   as Core
 import oracle as Oracle
 
 ORACLE: public(Oracle)
 CORE  : public(Core)
+POOLS : public(Pools)
 
 DEPLOYER   : address
 INITIALIZED: bool
@@ -38,39 +38,79 @@ def __init__():
 @external
 def __init__2(
   oracle   : address,
-  core     : address):
+  core     : address,
+  pools    : address):
   assert msg.sender == self.DEPLOYER, ERR_INVARIANTS
   assert not self.INITIALIZED       , ERR_INVARIANTS
   self.INITIALIZED = True
 
   self.ORACLE = Oracle(oracle)
   self.CORE   = Core(core)
+  self.POOLS  = Pools(pools)
 
 ########################################################################
 # We take the oracle payload and UI price and if everything checks out
 # create a context and proxy the call to core.
+# The pool is resolved from the token pair (this reverts if there is no
+# such pool), so a single set of contracts serves every pool.
 @internal
 def CONTEXT(
-    base_token : address,
-    quote_token: address,
+    pair       : Pair,
     desired    : uint256,
     slippage   : uint256,
     payload    : Bytes[224]
 ) -> Ctx:
-  base_decimals : uint256 = convert(ERC20Plus(base_token).decimals(), uint256)
-  quote_decimals: uint256 = convert(ERC20Plus(quote_token).decimals(), uint256)
   # this will revert on error
-  price         : uint256 = self.ORACLE.price(quote_decimals,
-                                              desired,
-                                              slippage,
-                                              payload)
+  price: uint256 = self.ORACLE.price(pair.feed_id,
+                                     pair.feed_decimals,
+                                     pair.quote_decimals,
+                                     desired,
+                                     slippage,
+                                     payload)
   return Ctx({
     price         : price,
-    base_decimals : base_decimals,
-    quote_decimals: quote_decimals,
+    base_decimals : pair.base_decimals,
+    quote_decimals: pair.quote_decimals,
   })
 
 ########################################################################
+@external
+def push_price(
+  base_token  : address,
+  quote_token : address,
+  payload     : Bytes[224]
+) -> uint256:
+  """
+  @notice            Lock in the oracle price for the current block, so that
+                     later transactions in the block can omit the payload
+  @dev               For keepers (anyone can push, the payload is verified)
+  @param base_token  Token representing the base coin of the pool (e.g. BTC)
+  @param quote_token Token representing the quote coin of the pool (e.g. USDT)
+  @param payload     Signed Redstone oracle payload
+  @return            The price for the current block, in the feed's precision
+                     (like push_prices, c.f. oracle.block_price)
+  """
+  pair: Pair = self.POOLS.resolve_pair(base_token, quote_token)
+  return self.ORACLE.push(pair.feed_id, payload)
+
+@external
+def push_prices(
+  feed_ids    : DynArray[bytes32, 8],
+  payload     : Bytes[2048]
+) -> DynArray[uint256, 8]:
+  """
+  @notice            Like push_price, for up to 8 oracle feeds at once, all
+                     verified from a single payload
+  @param feed_ids    The oracle feeds to lock in prices for (empty for the
+                     oracle's default feed)
+  @param payload     Signed Redstone oracle payload containing all the feeds
+                     (at most 2048 bytes, e.g. 14 packages of one data
+                     point each)
+  @return            The price of each feed for the current block, in the
+                     feeds' precision
+  """
+  return self.ORACLE.push_many(feed_ids, payload)
+
 @external
 def mint(
   base_token  : address, #ERC20
@@ -80,7 +120,7 @@ def mint(
   quote_amt   : uint256,
   desired     : uint256,
   slippage    : uint256,
-  payload     : Bytes[224]
+  payload     : Bytes[224] = b""
 ) -> uint256:
   """
   @notice            Provide liquidity to the pool
@@ -95,10 +135,12 @@ def mint(
   @param slippage    Acceptable deviaton of oracle price from desired price
                      (same units as desired e.g. to allow 5 cents of slippage,
                      send 50000).
-  @param payload     Signed Redstone oracle payload
+  @param payload     Signed Redstone oracle payload, may be omitted if a
+                     price has been pushed for this block (c.f. push_price)
   """
-  ctx: Ctx = self.CONTEXT(base_token, quote_token, desired, slippage, payload)
-  return self.CORE.mint(1, base_token, quote_token, lp_token, base_amt, quote_amt, ctx)
+  pair: Pair = self.POOLS.resolve_pair(base_token, quote_token)
+  ctx : Ctx  = self.CONTEXT(pair, desired, slippage, payload)
+  return self.CORE.mint(pair.id, base_token, quote_token, lp_token, base_amt, quote_amt, ctx)
 
 @external
 def burn(
@@ -108,7 +150,7 @@ def burn(
   lp_amt      : uint256,
   desired     : uint256,
   slippage    : uint256,
-  payload     : Bytes[224]
+  payload     : Bytes[224] = b""
 ) -> Tokens:
   """
   @notice            Withdraw liquidity from the pool
@@ -122,10 +164,12 @@ def burn(
   @param slippage    Acceptable deviaton of oracle price from desired price
                      (same units as desired e.g. to allow 5 cents of slippage,
                      send 50000).
-  @param payload     Signed Redstone oracle payload
+  @param payload     Signed Redstone oracle payload, may be omitted if a
+                     price has been pushed for this block (c.f. push_price)
   """
-  ctx: Ctx = self.CONTEXT(base_token, quote_token, desired, slippage, payload)
-  return self.CORE.burn(1, base_token, quote_token, lp_token, lp_amt, ctx)
+  pair: Pair = self.POOLS.resolve_pair(base_token, quote_token)
+  ctx : Ctx  = self.CONTEXT(pair, desired, slippage, payload)
+  return self.CORE.burn(pair.id, base_token, quote_token, lp_token, lp_amt, ctx)
 
 @external
 def open(
@@ -136,7 +180,7 @@ def open(
   leverage    : uint256,
   desired     : uint256,
   slippage    : uint256,
-  payload     : Bytes[224]
+  payload     : Bytes[224] = b""
 ) -> PositionState:
   """
   @notice            Open a position
@@ -152,10 +196,12 @@ def open(
   @param slippage    Acceptable deviaton of oracle price from desired price
                      (same units as desired e.g. to allow 5 cents of slippage,
                      send 50000).
-  @param payload     Signed Redstone oracle payload
+  @param payload     Signed Redstone oracle payload, may be omitted if a
+                     price has been pushed for this block (c.f. push_price)
   """
-  ctx: Ctx = self.CONTEXT(base_token, quote_token, desired, slippage, payload)
-  return self.CORE.open(1, base_token, quote_token, long, collateral0, leverage, ctx)
+  pair: Pair = self.POOLS.resolve_pair(base_token, quote_token)
+  ctx : Ctx  = self.CONTEXT(pair, desired, slippage, payload)
+  return self.CORE.open(pair.id, base_token, quote_token, long, collateral0, leverage, ctx)
 
 @external
 def close(
@@ -164,7 +210,7 @@ def close(
   position_id : uint256,
   desired     : uint256,
   slippage    : uint256,
-  payload     : Bytes[224]
+  payload     : Bytes[224] = b""
 ) -> PositionValue:
   """
   @notice            Close a position
@@ -177,10 +223,42 @@ def close(
   @param slippage    Acceptable deviaton of oracle price from desired price
                      (same units as desired e.g. to allow 5 cents of slippage,
                      send 50000).
-  @param payload     Signed Redstone oracle payload
+  @param payload     Signed Redstone oracle payload, may be omitted if a
+                     price has been pushed for this block (c.f. push_price)
   """
-  ctx: Ctx = self.CONTEXT(base_token, quote_token, desired, slippage, payload)
-  return self.CORE.close(1, base_token, quote_token, position_id, ctx)
+  pair: Pair = self.POOLS.resolve_pair(base_token, quote_token)
+  ctx : Ctx  = self.CONTEXT(pair, desired, slippage, payload)
+  return self.CORE.close(pair.id, base_token, quote_token, position_id, ctx)
+
+@external
+def execute(
+  base_token  : address,
+  quote_token : address,
+  lp_token    : address,
+  ops         : DynArray[Op, 10],
+  desired     : uint256,
+  slippage    : uint256,
+  payload     : Bytes[224] = b""
+):
+  """
+  @notice            Mint, burn, open and close in one transaction, at the
+                     same price
+  @param base_token  Token representing the base coin of the pool (e.g. BTC)
+  @param quote_token Token representing the quote coin of the pool (e.g. USDT)
+  @param lp_token    Token representing shares of the pool's liquidity
+  @param ops         Up to 10 operations, executed in order (c.f. types.vy/Op)
+  @param desired     Price to provide liquidity at (unit price using onchain
+                     representation for quote_token, e.g. 1.50$ would be
+                     1500000 for USDT with 6 decimals)
+  @param slippage    Acceptable deviaton of oracle price from desired price
+                     (same units as desired e.g. to allow 5 cents of slippage,
+                     send 50000).
+  @param payload     Signed Redstone oracle payload, may be omitted if a
+                     price has been pushed for this block (c.f. push_price)
+  """
+  pair: Pair = self.POOLS.resolve_pair(base_token, quote_token)
+  ctx : Ctx  = self.CONTEXT(pair, desired, slippage, payload)
+  self.CORE.execute(pair.id, base_token, quote_token, lp_token, ops, ctx)
 
 @external
 def liquidate(
@@ -189,7 +267,7 @@ def liquidate(
   position_id: uint256,
   desired     : uint256,
   slippage    : uint256,
-  payload     : Bytes[224]
+  payload     : Bytes[224] = b""
 ) -> PositionValue:
   """
   @notice            Liquidate a position
@@ -205,9 +283,42 @@ def liquidate(
   @param slippage    Acceptable deviaton of oracle price from desired price
                      (same units as desired e.g. to allow 5 cents of slippage,
                      send 50000).
-  @param payload     Signed Redstone oracle payload
+  @param payload     Signed Redstone oracle payload, may be omitted if a
+                     price has been pushed for this block (c.f. push_price)
+  """
+  pair: Pair = self.POOLS.resolve_pair(base_token, quote_token)
+  ctx : Ctx  = self.CONTEXT(pair, desired, slippage, payload)
+  return self.CORE.liquidate(pair.id, base_token, quote_token, position_id, ctx)
+
+@external
+def liquidate_many(
+  base_token  : address,
+  quote_token : address,
+  position_ids: DynArray[uint256, 50],
+  desired     : uint256,
+  slippage    : uint256,
+  payload     : Bytes[224] = b""
+) -> DynArray[Liquidation, 50]:
+  """
+  @notice             Liquidate several positions
+  @dev                Like liquidate, but positions which cannot be
+                      liquidated are skipped rather than reverting
+                      the whole batch
+  @param base_token   Token representing the base coin of the pool (e.g. BTC)
+  @param quote_token  Token representing the quote coin of the pool (e.g. USDT)
+  @param position_ids The IDs of the positions to liquidate (at most 50)
+  @param desired      Price to provide liquidity at (unit price using onchain
+                      representation for quote_token, e.g. 1.50$ would be
+                      1500000 for USDT with 6 decimals)
+  @param slippage     Acceptable deviaton of oracle price from desired price
+                      (same units as desired e.g. to allow 5 cents of slippage,
+                      send 50000).
+  @param payload      Signed Redstone oracle payload, may be omitted if a
+                      price has been pushed for this block (c.f. push_price)
+  @return             One result per position ID, in order
   """
-  ctx: Ctx = self.CONTEXT(base_token, quote_token, desired, slippage, payload)
-  return self.CORE.liquidate(1, base_token, quote_token, position_id, ctx)
+  pair: Pair = self.POOLS.resolve_pair(base_token, quote_token)
+  ctx : Ctx  = self.CONTEXT(pair, desired, slippage, payload)
+  return self.CORE.liquidate_many(pair.id, base_token, quote_token, position_ids, ctx)
 
 # eof
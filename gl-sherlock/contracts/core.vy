@@ -66,13 +66,11 @@
 
 ########################################################################
 from vyper.interfaces import ERC20
-import math           as Math
 import params         as Params
 import pools          as Pools
 import fees           as Fees
 import positions      as Positions
 
-MATH       : public(Math)
 PARAMS     : public(Params)
 POOLS      : public(Pools)
 FEES       : public(Fees)
@@ -91,7 +89,6 @@ def __init__():
 
 @external
 def __init__2(
-  math     : address,
   params   : address,
   pools    : address,
   fees     : address,
@@ -103,7 +100,6 @@ def __init__2(
   assert not self.INITIALIZED       , ERR_INVARIANTS
   self.INITIALIZED = True
 
-  self.MATH        = Math(math)
   self.PARAMS      = Params(params)
   self.POOLS       = Pools(pools)
   self.FEES        = Fees(fees)
@@ -121,36 +117,66 @@ def set_collector(new_collector: address):
   self.COLLECTOR = new_collector
 
 ########################################################################
-# this works because each pool gets its own copy of all contracts
+# Pools may share tokens (core holds the tokens of all pools), so token
+# balances are checked against what core owes all pools: OWED tracks the
+# sum of reserves and collateral over the pools using a token, and is
+# updated from the same amounts and deltas as the pools' accounting.
+OWED: public(HashMap[address, uint256])
+
+@internal
+def owe(token: address, delta: int256):
+  if delta != 0:
+    self.OWED[token] = convert(convert(self.OWED[token], int256) + delta, uint256)
+
+@internal
+def owe_deltas(base_token: address, quote_token: address, deltas: Deltas):
+  self.owe(base_token,  deltas.base_reserves  + deltas.base_collateral)
+  self.owe(quote_token, deltas.quote_reserves + deltas.quote_collateral)
+
 @internal
 def INVARIANTS(id: uint256, base_token: address, quote_token: address):
   pool         : PoolState = self.POOLS.lookup(id)
   base_balance : uint256   = ERC20(base_token).balanceOf(self)
   quote_balance: uint256   = ERC20(quote_token).balanceOf(self)
-  assert base_balance  >= (pool.base_reserves  + pool.base_collateral),  ERR_INVARIANTS
-  assert quote_balance >= (pool.quote_reserves + pool.quote_collateral), ERR_INVARIANTS
+  assert base_balance  >= self.OWED[base_token],  ERR_INVARIANTS
+  assert quote_balance >= self.OWED[quote_token], ERR_INVARIANTS
   assert pool.base_reserves  >= pool.base_interest,  ERR_INVARIANTS
   assert pool.quote_reserves >= pool.quote_interest, ERR_INVARIANTS
 
 ########################################################################
 @external
 def fresh(
-  symbol     : String[65],
-  base_token : address,
-  quote_token: address,
-  lp_token   : address):
+  symbol       : String[65],
+  base_token   : address,
+  quote_token  : address,
+  lp_token     : address,
+  feed_id      : bytes32 = empty(bytes32),
+  feed_decimals: uint256 = 0):
+  """
+  Create a pool. Its prices come from the oracle feed feed_id, with
+  feed_decimals decimals (the oracle's default FEED_ID and DECIMALS if
+  empty).
+  """
   assert msg.sender == self.DEPLOYER, ERR_PERMISSIONS
   assert not self.POOLS.exists_pair(base_token, quote_token), ERR_PRECONDITIONS
   assert not self.POOLS.exists_pair(quote_token, base_token), ERR_PRECONDITIONS
   assert not self.POOLS.exists_lp(lp_token),                  ERR_PRECONDITIONS
 
-  user: address   = msg.sender
-  pool: PoolState = self.POOLS.fresh(symbol, base_token, quote_token, lp_token)
-  fees: FeeState  = self.FEES.fresh(pool.id)
+  user    : address   = msg.sender
+  decimals: Decimals  = Decimals({
+    base : convert(ERC20Plus(base_token).decimals(),  uint256),
+    quote: convert(ERC20Plus(quote_token).decimals(), uint256),
+  })
+  pool    : PoolState = self.POOLS.fresh(symbol, base_token, quote_token, lp_token, decimals,
+                                         feed_id, feed_decimals)
+  fees    : FeeState  = self.FEES.fresh(pool.id)
 
-  log Create(user, pool.id)
+  log Create(user, pool.id, symbol, base_token, quote_token, lp_token)
 
 ########################################################################
+# The user operations below are split into an external entry point and
+# an internal function which does everything except updating fees and
+# checking invariants, so that execute() can do those once per batch.
 @external
 def mint(
   id          : uint256,
@@ -162,6 +188,20 @@ def mint(
   ctx         : Ctx) -> uint256:
 
   self._INTERNAL()
+  lp_amt: uint256 = self._mint(id, base_token, quote_token, lp_token, base_amt, quote_amt, ctx)
+  self.FEES.update(id)
+  self.INVARIANTS(id, base_token, quote_token)
+  return lp_amt
+
+@internal
+def _mint(
+  id          : uint256,
+  base_token  : address,
+  quote_token : address,
+  lp_token    : address,
+  base_amt    : uint256,
+  quote_amt   : uint256,
+  ctx         : Ctx) -> uint256:
 
   user        : address   = tx.origin
   total_supply: uint256   = ERC20(lp_token).totalSupply()
@@ -179,11 +219,10 @@ def mint(
   assert ERC20Plus(lp_token).mint(user, lp_amt), "ERR_ERC20"
 
   self.POOLS.mint(id, base_amt, quote_amt)
-  self.FEES.update(id)
+  self.owe(base_token,  convert(base_amt,  int256))
+  self.owe(quote_token, convert(quote_amt, int256))
 
-  self.INVARIANTS(id, base_token, quote_token)
-
-  log Mint(user, ctx, pool, total_supply, lp_amt, base_amt, quote_amt)
+  log Mint(user, id, ctx, total_supply, lp_amt, base_amt, quote_amt)
 
   return lp_amt
 
@@ -198,6 +237,19 @@ def burn(
   ctx         : Ctx) -> Tokens:
 
   self._INTERNAL()
+  amts: Tokens = self._burn(id, base_token, quote_token, lp_token, lp_amt, ctx)
+  self.FEES.update(id)
+  self.INVARIANTS(id, base_token, quote_token)
+  return amts
+
+@internal
+def _burn(
+  id          : uint256,
+  base_token  : address,
+  quote_token : address,
+  lp_token    : address,
+  lp_amt      : uint256,
+  ctx         : Ctx) -> Tokens:
 
   user        : address   = tx.origin
   total_supply: uint256   = ERC20(lp_token).totalSupply()
@@ -217,11 +269,10 @@ def burn(
   assert ERC20Plus(lp_token).burn(user, lp_amt), "ERR_ERC20"
 
   self.POOLS.burn(id, base_amt, quote_amt)
-  self.FEES.update(id)
+  self.owe(base_token,  -convert(base_amt,  int256))
+  self.owe(quote_token, -convert(quote_amt, int256))
 
-  self.INVARIANTS(id, base_token, quote_token)
-
-  log Burn(user, ctx, pool, total_supply, lp_amt, base_amt, quote_amt)
+  log Burn(user, id, ctx, total_supply, lp_amt, base_amt, quote_amt)
 
   return amts
 
@@ -237,6 +288,20 @@ def open(
   ctx         : Ctx) -> PositionState:
 
   self._INTERNAL()
+  position: PositionState = self._open(id, base_token, quote_token, long, collateral0, leverage, ctx)
+  self.FEES.update(id)
+  self.INVARIANTS(id, base_token, quote_token)
+  return position
+
+@internal
+def _open(
+  id          : uint256,
+  base_token  : address,
+  quote_token : address,
+  long        : bool,
+  collateral0 : uint256,
+  leverage    : uint256,
+  ctx         : Ctx) -> PositionState:
 
   user       : address   = tx.origin
   pool       : PoolState = self.POOLS.lookup(id)
@@ -259,11 +324,10 @@ def open(
 
   position: PositionState = self.POSITIONS.open(user, id, long, collateral, leverage, ctx)
   self.POOLS.open(id, position.collateral_tagged, position.interest_tagged)
-  self.FEES.update(id)
-
-  self.INVARIANTS(id, base_token, quote_token)
+  self.owe(base_token,  convert(position.collateral_tagged.base,  int256))
+  self.owe(quote_token, convert(position.collateral_tagged.quote, int256))
 
-  log Open(user, ctx, pool, position)
+  log Open(user, id, position.id, ctx, long, position.collateral, leverage, position.interest)
 
   return position
 
@@ -277,32 +341,76 @@ def close(
   ctx         : Ctx) -> PositionValue:
 
   self._INTERNAL()
+  value: PositionValue = self._close(id, base_token, quote_token, position_id, ctx)
+  self.FEES.update(id)
+  self.INVARIANTS(id, base_token, quote_token)
+  return value
+
+@internal
+def _close(
+  id          : uint256,
+  base_token  : address,
+  quote_token : address,
+  position_id : uint256,
+  ctx         : Ctx) -> PositionValue:
 
   user    : address       = tx.origin
   pool    : PoolState     = self.POOLS.lookup(id)
-  position: PositionState = self.POSITIONS.lookup(position_id)
 
   assert pool.base_token  == base_token , ERR_PRECONDITIONS
   assert pool.quote_token == quote_token, ERR_PRECONDITIONS
-  assert id   == position.pool          , ERR_PRECONDITIONS
-  assert user == position.user          , ERR_PRECONDITIONS
 
+  # position checks use the state returned by close (which reverts on error)
   value    : PositionValue = self.POSITIONS.close(position_id, ctx)
-  base_amt : uint256       = self.MATH.eval(0, value.deltas.base_transfer)
-  quote_amt: uint256       = self.MATH.eval(0, value.deltas.quote_transfer)
+  position : PositionState = value.position
+  assert id   == position.pool          , ERR_PRECONDITIONS
+  assert user == position.user          , ERR_PRECONDITIONS
+  base_amt : uint256       = value.deltas.base_transfer
+  quote_amt: uint256       = value.deltas.quote_transfer
   self.POOLS.close(id, value.deltas)
-  self.FEES.update(id)
+  self.owe_deltas(base_token, quote_token, value.deltas)
 
   if base_amt > 0:
     assert ERC20(base_token).transfer(user, base_amt, default_return_value=True), "ERR_ERC20"
   if quote_amt > 0:
     assert ERC20(quote_token).transfer(user, quote_amt, default_return_value=True), "ERR_ERC20"
 
-  self.INVARIANTS(id, base_token, quote_token)
-
-  log Close(user, ctx, pool, value)
+  log Close(user, id, position_id, ctx, value.fees, value.pnl, value.deltas)
   return value
 
+########################################################################
+@external
+def execute(
+  id          : uint256,
+  base_token  : address,
+  quote_token : address,
+  lp_token    : address,
+  ops         : DynArray[Op, 10],
+  ctx         : Ctx):
+  """
+  Runs several user operations at the same price, updating fees and
+  checking invariants once at the end. (The fee sums for this block are
+  fixed by its first update, so this is equivalent to running them in
+  separate transactions in the same block.)
+  """
+  self._INTERNAL()
+  assert len(ops) > 0, ERR_PRECONDITIONS
+
+  for op in ops:
+    if   op.action == Action.MINT:
+      self._mint(id, base_token, quote_token, lp_token, op.base_amt, op.quote_amt, ctx)
+    elif op.action == Action.BURN:
+      self._burn(id, base_token, quote_token, lp_token, op.lp_amt, ctx)
+    elif op.action == Action.OPEN:
+      self._open(id, base_token, quote_token, op.long, op.collateral0, op.leverage, ctx)
+    elif op.action == Action.CLOSE:
+      self._close(id, base_token, quote_token, op.position_id, ctx)
+    else:
+      raise ERR_PRECONDITIONS
+
+  self.FEES.update(id)
+  self.INVARIANTS(id, base_token, quote_token)
+
 ########################################################################
 @external
 def liquidate(
@@ -317,35 +425,90 @@ def liquidate(
   # identical to close()
   user    : address       = tx.origin #liquidator
   pool    : PoolState     = self.POOLS.lookup(id)
-  position: PositionState = self.POSITIONS.lookup(position_id)
 
   assert pool.base_token  == base_token                  , ERR_PRECONDITIONS
   assert pool.quote_token == quote_token                 , ERR_PRECONDITIONS
-  assert id == position.pool                             , ERR_PRECONDITIONS
-  assert self.POSITIONS.is_liquidatable(position_id, ctx), ERR_PRECONDITIONS
 
-  value    : PositionValue = self.POSITIONS.close(position_id, ctx)
-  base_amt : uint256       = self.MATH.eval(0, value.deltas.base_transfer)
-  quote_amt: uint256       = self.MATH.eval(0, value.deltas.quote_transfer)
+  # values the position once, reverts unless it is liquidatable
+  value    : PositionValue = self.POSITIONS.liquidate(position_id, ctx)
+  assert id == value.position.pool                       , ERR_PRECONDITIONS
   self.POOLS.close(id, value.deltas)
+  self.owe_deltas(base_token, quote_token, value.deltas)
+  self.FEES.update(id)
+
+  self.pay_liquidation(base_token, quote_token, user, value)
+
+  self.INVARIANTS(id, base_token, quote_token)
+
+  log Liquidate(user, id, position_id, ctx, value.fees, value.pnl, value.deltas)
+  return value
+
+@external
+def liquidate_many(
+  id          : uint256,
+  base_token  : address,
+  quote_token : address,
+  position_ids: DynArray[uint256, 50],
+  ctx         : Ctx) -> DynArray[Liquidation, 50]:
+  """
+  Liquidates each liquidatable position in position_ids, skipping the
+  rest, then updates fees and checks invariants once for the whole batch.
+  (The fee sums for this block were fixed by its first update, so the
+  positions are valued exactly as if they were liquidated one by one.)
+  """
+  self._INTERNAL()
+
+  user    : address       = tx.origin #liquidator
+  pool    : PoolState     = self.POOLS.lookup(id)
+
+  assert pool.base_token  == base_token                  , ERR_PRECONDITIONS
+  assert pool.quote_token == quote_token                 , ERR_PRECONDITIONS
+
+  res: DynArray[Liquidation, 50] = []
+  for position_id in position_ids:
+    value: PositionValue = self.POSITIONS.try_liquidate(position_id, id, ctx)
+    if value.position.id == 0:
+      res.append(Liquidation({
+        position_id: position_id,
+        liquidated : False,
+        fees       : empty(Tokens),
+        remaining  : empty(Tokens),
+      }))
+      continue
+    self.POOLS.close(id, value.deltas)
+    self.owe_deltas(base_token, quote_token, value.deltas)
+    res.append(self.pay_liquidation(base_token, quote_token, user, value))
+    log Liquidate(user, id, position_id, ctx, value.fees, value.pnl, value.deltas)
+
   self.FEES.update(id)
+  self.INVARIANTS(id, base_token, quote_token)
+  return res
 
-  base_amt_final : Fee = self.PARAMS.liquidation_fees(base_amt)
-  quote_amt_final: Fee = self.PARAMS.liquidation_fees(quote_amt)
+@internal
+def pay_liquidation(
+  base_token : address,
+  quote_token: address,
+  liquidator : address,
+  closed     : PositionValue) -> Liquidation:
+  base_amt_final : Fee = self.PARAMS.liquidation_fees(closed.deltas.base_transfer)
+  quote_amt_final: Fee = self.PARAMS.liquidation_fees(closed.deltas.quote_transfer)
+  user           : address = closed.position.user
 
   # liquidator gets liquidation fee, user gets whatever is left
   if base_amt_final.fee > 0:
-    assert ERC20(base_token).transfer(user, base_amt_final.fee, default_return_value=True), "ERR_ERC20"
+    assert ERC20(base_token).transfer(liquidator, base_amt_final.fee, default_return_value=True), "ERR_ERC20"
   if quote_amt_final.fee > 0:
-    assert ERC20(quote_token).transfer(user, quote_amt_final.fee, default_return_value=True), "ERR_ERC20"
+    assert ERC20(quote_token).transfer(liquidator, quote_amt_final.fee, default_return_value=True), "ERR_ERC20"
   if base_amt_final.remaining > 0:
-    assert ERC20(base_token).transfer(position.user, base_amt_final.remaining, default_return_value=True), "ERR_ERC20"
+    assert ERC20(base_token).transfer(user, base_amt_final.remaining, default_return_value=True), "ERR_ERC20"
   if quote_amt_final.remaining > 0:
-    assert ERC20(quote_token).transfer(position.user, quote_amt_final.remaining, default_return_value=True), "ERR_ERC20"
-
-  self.INVARIANTS(id, base_token, quote_token)
-
-  log Liquidate(user, ctx, pool, value)
-  return value
+    assert ERC20(quote_token).transfer(user, quote_amt_final.remaining, default_return_value=True), "ERR_ERC20"
+
+  return Liquidation({
+    position_id: closed.position.id,
+    liquidated : True,
+    fees       : Tokens({base: base_amt_final.fee,       quote: quote_amt_final.fee}),
+    remaining  : Tokens({base: base_amt_final.remaining, quote: quote_amt_final.remaining}),
+  })
 
 # eof
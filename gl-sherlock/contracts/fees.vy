@@ -1,10 +1,8 @@
 ########################################################################
 import fees   as Fees #self
-import math   as Math
 import params as Params
 import pools  as Pools
 
-MATH     : public(Math)
 PARAMS   : public(Params)
 POOLS    : public(Pools)
 
@@ -21,7 +19,6 @@ def __init__():
 
 @external
 def __init__2(
-  math     : address,
   params   : address,
   pools    : address,
   core     : address,
@@ -30,7 +27,6 @@ def __init__2(
   assert not self.INITIALIZED       , ERR_INVARIANTS
   self.INITIALIZED = True
 
-  self.MATH      = Math(math)
   self.PARAMS    = Params(params)
   self.POOLS     = Pools(pools)
   self.CORE      = core
@@ -44,8 +40,16 @@ def _INTERNAL():
           msg.sender == self), ERR_PERMISSIONS
 
 ########################################################################
-FEE_STORE   : HashMap[uint256, FeeState]
-FEE_STORE_AT: HashMap[uint256, HashMap[uint256, FeeState]]
+FEE_STORE  : HashMap[uint256, FeeState]
+# Cumulative sums at the blocks in which positions were opened (only
+# query() reads these), packed into four slots, c.f. checkpoint().
+struct PackedCheckpoint:
+  borrowing     : uint256 # long << 128 | short
+  funding       : uint256 # long << 128 | short
+  received_long : uint256
+  received_short: uint256
+
+CHECKPOINTS: HashMap[uint256, HashMap[uint256, PackedCheckpoint]]
 
 @external
 @view
@@ -54,17 +58,57 @@ def lookup(id: uint256) -> FeeState:
 
 @external
 @view
-def fees_at_block(height: uint256, id: uint256) -> FeeState:
-  return self.FEE_STORE_AT[height][id]
+def fees_at_block(height: uint256, id: uint256) -> Checkpoint:
+  return self.unpack(self.CHECKPOINTS[height][id])
 
 @internal
 def insert(fs: FeeState) -> FeeState:
-  # current/latest fee state
   self.FEE_STORE[fs.id] = fs
-  # historical fee state
-  self.FEE_STORE_AT[block.number][fs.id] = fs
   return fs
 
+@external
+def checkpoint(id: uint256):
+  """
+  Record the sums for the current block, called when a position is
+  opened (query() only ever looks up blocks in which a position was
+  opened).
+  The sums are fixed by the first update in a block (c.f. roll()), so
+  the checkpoint does not depend on which operation in the block
+  writes it.
+  """
+  self._INTERNAL()
+  fs: FeeState = self.roll(self.FEE_STORE[id])
+  self.CHECKPOINTS[block.number][id] = PackedCheckpoint({
+    borrowing     : self.pack(fs.borrowing_long_sum, fs.borrowing_short_sum),
+    funding       : self.pack(fs.funding_long_sum,   fs.funding_short_sum),
+    received_long : fs.received_long_sum,
+    received_short: fs.received_short_sum,
+  })
+
+# Fee sums are sums of fee numerators (c.f. math.vy/DENOM) over blocks
+# and comfortably fit into 128 bits, received sums are scaled by ZEROS
+# and get a slot each.
+MASK: constant(uint256) = 340282366920938463463374607431768211455 # 2**128-1
+
+@internal
+@pure
+def pack(hi: uint256, lo: uint256) -> uint256:
+  # convert() reverts if either sum does not fit into 128 bits
+  return ((convert(convert(hi, uint128), uint256) << 128) |
+           convert(convert(lo, uint128), uint256))
+
+@internal
+@pure
+def unpack(pc: PackedCheckpoint) -> Checkpoint:
+  return Checkpoint({
+    borrowing_long_sum : pc.borrowing >> 128,
+    borrowing_short_sum: pc.borrowing & MASK,
+    funding_long_sum   : pc.funding   >> 128,
+    funding_short_sum  : pc.funding   & MASK,
+    received_long_sum  : pc.received_long,
+    received_short_sum : pc.received_short,
+  })
+
 ########################################################################
 @external
 def fresh(id: uint256) -> FeeState:
@@ -113,7 +157,7 @@ ZEROS: constant(uint256) = 1000000000000000000000000000
 @internal
 @view
 def apply(amount: uint256, fee: uint256) -> uint256:
-  return self.MATH.apply(amount, fee).fee
+  return self.math_apply(amount, fee).fee
 
 @internal
 @pure
@@ -130,7 +174,7 @@ def multiply(ci: uint256, terms: uint256) -> uint256:
 @external
 def update(id: uint256) -> FeeState:
   self._INTERNAL()
-  return self.insert(Fees(self).current_fees(id))
+  return self.insert(self._current_fees(id))
 
 @external
 @view
@@ -138,13 +182,49 @@ def current_fees(id: uint256) -> FeeState:
   """
   Update incremental fee state, called whenever the pool state changes.
   """
-  # prev/last updated state
-  fs       : FeeState  = Fees(self).lookup(id)
+  return self._current_fees(id)
+
+@internal
+@view
+def _current_fees(id: uint256) -> FeeState:
+  # sums up to the current block
+  fs       : FeeState  = self.roll(self.FEE_STORE[id])
   # current state
   ps       : PoolState = self.POOLS.lookup(id)
   new_fees : DynFees   = self.PARAMS.dynamic_fees(ps)
+  # We also store the current sample for the current block (the final
+  # update in a block will write the final fee value for that block).
+  return FeeState({
+    id                   : fs.id,
+    t0                   : fs.t0,
+    t1                   : fs.t1,
+    # update samples
+    borrowing_long       : new_fees.borrowing_long,
+    borrowing_short      : new_fees.borrowing_short,
+    funding_long         : new_fees.funding_long,
+    funding_short        : new_fees.funding_short,
+    long_collateral      : ps.quote_collateral,
+    short_collateral     : ps.base_collateral,
+    borrowing_long_sum   : fs.borrowing_long_sum,
+    borrowing_short_sum  : fs.borrowing_short_sum,
+    funding_long_sum     : fs.funding_long_sum,
+    funding_short_sum    : fs.funding_short_sum,
+    received_long_sum    : fs.received_long_sum,
+    received_short_sum   : fs.received_short_sum,
+    })
+
+@internal
+@view
+def roll(fs: FeeState) -> FeeState:
+  """
+  Extend the sums in fs (the last updated state) up to the current block.
+  This only depends on the samples stored in fs, which is all we need to
+  value a position, whereas the new samples (which depend on the current
+  pool state) are only needed when the pool state changes.
+  """
   # number of blocks elapsed
   new_terms: uint256   = block.number - fs.t1
+  if new_terms == 0: return fs
 
   # When we value a position, we need to calculate the total amount of
   # fee obligations that position has accumulated over its lifetime.
@@ -159,8 +239,6 @@ def current_fees(id: uint256) -> FeeState:
   #    - we store the sum(f_i) term here since c is static (up to and
   #      not including this block, since during a block the pool state,
   #      and hence the fees, may change)
-  #    - we also store the current sample for the current block (the final
-  #      update in a block will write the final fee value for that block)
   borrowing_long_sum  : uint256 = self.extend(fs.borrowing_long_sum,  fs.borrowing_long,  new_terms)
   borrowing_short_sum : uint256 = self.extend(fs.borrowing_short_sum, fs.borrowing_short, new_terms)
   funding_long_sum    : uint256 = self.extend(fs.funding_long_sum,    fs.funding_long,    new_terms)
@@ -192,38 +270,16 @@ def current_fees(id: uint256) -> FeeState:
   received_long_sum   : uint256 = self.extend(fs.received_long_sum,  received_long_term,  1)
   received_short_sum  : uint256 = self.extend(fs.received_short_sum, received_short_term, 1)
 
-  if new_terms == 0:
-    return FeeState({
-    id                   : fs.id,
-    t0                   : fs.t0,
-    t1                   : fs.t1,
-    # update samples
-    borrowing_long       : new_fees.borrowing_long,
-    borrowing_short      : new_fees.borrowing_short,
-    funding_long         : new_fees.funding_long,
-    funding_short        : new_fees.funding_short,
-    long_collateral      : ps.quote_collateral,
-    short_collateral     : ps.base_collateral,
-    # no new terms
-    borrowing_long_sum   : fs.borrowing_long_sum,
-    borrowing_short_sum  : fs.borrowing_short_sum,
-    funding_long_sum     : fs.funding_long_sum,
-    funding_short_sum    : fs.funding_short_sum,
-    received_long_sum    : fs.received_long_sum,
-    received_short_sum   : fs.received_short_sum,
-    })
-  else:
-    return FeeState({
+  return FeeState({
     id                   : fs.id,
     t0                   : fs.t0,
     t1                   : block.number,
-    # update samples
-    borrowing_long       : new_fees.borrowing_long,
-    borrowing_short      : new_fees.borrowing_short,
-    funding_long         : new_fees.funding_long,
-    funding_short        : new_fees.funding_short,
-    long_collateral      : ps.quote_collateral,
-    short_collateral     : ps.base_collateral,
+    borrowing_long       : fs.borrowing_long,
+    borrowing_short      : fs.borrowing_short,
+    funding_long         : fs.funding_long,
+    funding_short        : fs.funding_short,
+    long_collateral      : fs.long_collateral,
+    short_collateral     : fs.short_collateral,
     # update sums
     borrowing_long_sum   : borrowing_long_sum,
     borrowing_short_sum  : borrowing_short_sum,
@@ -244,12 +300,12 @@ struct Period:
 
 @internal
 @view
-def query(id: uint256, opened_at: uint256) -> Period:
+def query(id: uint256, opened_at: uint256, fees_j: Checkpoint) -> Period:
   """
-  Return the total fees due from block `opened_at` to the current block.
+  Return the total fees due from block `opened_at` to the block the sums
+  in fees_j were rolled to (the current block).
   """
-  fees_i : FeeState = Fees(self).fees_at_block(opened_at, id)
-  fees_j : FeeState = Fees(self).current_fees(id)
+  fees_i : Checkpoint = self.unpack(self.CHECKPOINTS[opened_at][id])
   return Period({
     borrowing_long  : self.slice(fees_i.borrowing_long_sum,  fees_j.borrowing_long_sum),
     borrowing_short : self.slice(fees_i.borrowing_short_sum, fees_j.borrowing_short_sum),
@@ -260,10 +316,44 @@ def query(id: uint256, opened_at: uint256) -> Period:
   })
 
 ########################################################################
+@external
+@view
+def current_sums(id: uint256) -> Checkpoint:
+  """
+  The sums as of the current block, which can be passed to calc_at() to
+  value many positions in the same pool without rolling them each time.
+  """
+  return self._current_sums(id)
+
+@internal
+@view
+def _current_sums(id: uint256) -> Checkpoint:
+  fs: FeeState = self.roll(self.FEE_STORE[id])
+  return Checkpoint({
+    borrowing_long_sum : fs.borrowing_long_sum,
+    borrowing_short_sum: fs.borrowing_short_sum,
+    funding_long_sum   : fs.funding_long_sum,
+    funding_short_sum  : fs.funding_short_sum,
+    received_long_sum  : fs.received_long_sum,
+    received_short_sum : fs.received_short_sum,
+  })
+
 @external
 @view
 def calc(id: uint256, long: bool, collateral: uint256, opened_at: uint256) -> SumFees:
-    period: Period  = self.query(id, opened_at)
+    return self._calc(id, long, collateral, opened_at, self._current_sums(id))
+
+@external
+@view
+def calc_at(id: uint256, long: bool, collateral: uint256, opened_at: uint256,
+            sums: Checkpoint) -> SumFees:
+    return self._calc(id, long, collateral, opened_at, sums)
+
+@internal
+@view
+def _calc(id: uint256, long: bool, collateral: uint256, opened_at: uint256,
+          sums: Checkpoint) -> SumFees:
+    period: Period  = self.query(id, opened_at, sums)
     P_b   : uint256 = self.apply(collateral, period.borrowing_long) if long else (
                       self.apply(collateral, period.borrowing_short) )
     P_f   : uint256 = self.apply(collateral, period.funding_long) if long else (
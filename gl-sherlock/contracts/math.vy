@@ -1,12 +1,15 @@
-########################################################################
-import math as Math #self
+### BEGIN math.vy
+# Library of pure functions, concatenated into each contract which uses
+# it (c.f. GNUmakefile), i.e. every call is an internal call.
+# Functions are prefixed with math_ since they share a namespace with the
+# contract they are compiled into.
 
 ########################################################################
-# x = lower(lift(x))
+# x = math_lower(math_lift(x))
 
 @internal
 @pure
-def lift(tokens: Tokens, ctx: Ctx) -> Tokens:
+def math_lift(tokens: Tokens, ctx: Ctx) -> Tokens:
   """
   Converts tokens to the same precision (number of decimals).
   """
@@ -21,7 +24,7 @@ def lift(tokens: Tokens, ctx: Ctx) -> Tokens:
 
 @internal
 @pure
-def lower(tokens: Tokens, ctx: Ctx) -> Tokens:
+def math_lower(tokens: Tokens, ctx: Ctx) -> Tokens:
   """
   Converts lifted tokens back to their original representation.
   """
@@ -36,7 +39,7 @@ def lower(tokens: Tokens, ctx: Ctx) -> Tokens:
 
 @internal
 @pure
-def one(ctx: Ctx) -> uint256:
+def math_one(ctx: Ctx) -> uint256:
   """
   Unit in the lifted representation for Ctx.
   """
@@ -50,7 +53,7 @@ def one(ctx: Ctx) -> uint256:
 
 @internal
 @pure
-def to_amount(price: uint256, volume: uint256, one1: uint256) -> uint256:
+def math_to_amount(price: uint256, volume: uint256, one1: uint256) -> uint256:
   """
   Converts unit price to value of volume at that price.
   """
@@ -58,46 +61,45 @@ def to_amount(price: uint256, volume: uint256, one1: uint256) -> uint256:
 
 @internal
 @pure
-def from_amount(amount: uint256, price: uint256, one1: uint256) -> uint256:
+def math_from_amount(amount: uint256, price: uint256, one1: uint256) -> uint256:
   """
   Returns volume implied by price.
   """
   return (amount * one1) / price
 
 ########################################################################
-# base  = quote_to_base(base_to_quote(base))
-# quote = base_to_quote(quote_to_base(quote))
+# base  = math_quote_to_base(math_base_to_quote(base))
+# quote = math_base_to_quote(math_quote_to_base(quote))
 
-@external
+@internal
 @pure
-def base_to_quote(tokens: uint256, ctx: Ctx) -> uint256:
-  lifted : Tokens  = self.lift(Tokens({base: tokens, quote: ctx.price}), ctx)
-  amt0   : uint256 = self.to_amount(lifted.quote, lifted.base, self.one(ctx))
-  lowered: Tokens  = self.lower(Tokens({base: 0, quote: amt0}), ctx)
+def math_base_to_quote(tokens: uint256, ctx: Ctx) -> uint256:
+  lifted : Tokens  = self.math_lift(Tokens({base: tokens, quote: ctx.price}), ctx)
+  amt0   : uint256 = self.math_to_amount(lifted.quote, lifted.base, self.math_one(ctx))
+  lowered: Tokens  = self.math_lower(Tokens({base: 0, quote: amt0}), ctx)
   return lowered.quote
 
-@external
+@internal
 @pure
-def quote_to_base(tokens: uint256, ctx: Ctx) -> uint256:
-  l1     : Tokens  = self.lift(Tokens({base: 0, quote: tokens}),    ctx)
-  l2     : Tokens  = self.lift(Tokens({base: 0, quote: ctx.price}), ctx)
-  vol0   : uint256 = self.from_amount(l1.quote, l2.quote, self.one(ctx))
-  lowered: Tokens  = self.lower(Tokens({base: vol0, quote: 0}), ctx)
+def math_quote_to_base(tokens: uint256, ctx: Ctx) -> uint256:
+  l1     : Tokens  = self.math_lift(Tokens({base: 0, quote: tokens}),    ctx)
+  l2     : Tokens  = self.math_lift(Tokens({base: 0, quote: ctx.price}), ctx)
+  vol0   : uint256 = self.math_from_amount(l1.quote, l2.quote, self.math_one(ctx))
+  lowered: Tokens  = self.math_lower(Tokens({base: vol0, quote: 0}), ctx)
   return lowered.base
 
 ########################################################################
-@external
-@view
-def value(tokens: Tokens, ctx: Ctx) -> Value:
+@internal
+@pure
+def math_value(tokens: Tokens, ctx: Ctx) -> Value:
   """
   Given a bag of tokens, computes various quantities we are interested in
   in one place.
-  This should be @pure but has to be @view due to the Math(self) call.
   """
   base                  : uint256 = tokens.base
   quote                 : uint256 = tokens.quote
-  base_as_quote         : uint256 = Math(self).base_to_quote(base, ctx)
-  quote_as_base         : uint256 = Math(self).quote_to_base(quote, ctx)
+  base_as_quote         : uint256 = self.math_base_to_quote(base, ctx)
+  quote_as_base         : uint256 = self.math_quote_to_base(quote, ctx)
   total_as_base         : uint256 = base + quote_as_base
   total_as_quote        : uint256 = quote + base_as_quote
   have_more_base        : bool    = base_as_quote > quote
@@ -122,9 +124,9 @@ def value(tokens: Tokens, ctx: Ctx) -> Value:
 })
 
 ########################################################################
-@external
-@view
-def balanced(state: Value, burn_value: uint256, ctx: Ctx) -> Tokens:
+@internal
+@pure
+def math_balanced(state: Value, burn_value: uint256, ctx: Ctx) -> Tokens:
   """
   Given the current state of the pool reserves, returns a mix of tokens
   of total value burn_value which improves pool balance (we consider a
@@ -137,12 +139,12 @@ def balanced(state: Value, burn_value: uint256, ctx: Ctx) -> Tokens:
   """
   if state.have_more_base:
     if state.base_excess_as_quote >= burn_value:
-      return Tokens({base: Math(self).quote_to_base(burn_value, ctx), quote: 0})
+      return Tokens({base: self.math_quote_to_base(burn_value, ctx), quote: 0})
     else:
       base1: uint256 = state.base_excess_as_base
       left : uint256 = burn_value - state.base_excess_as_quote
       quote: uint256 = left / 2
-      base2: uint256 = Math(self).quote_to_base(quote, ctx)
+      base2: uint256 = self.math_quote_to_base(quote, ctx)
       base : uint256 = base1 + base2
       return Tokens({base: base, quote: quote})
   else:
@@ -152,7 +154,7 @@ def balanced(state: Value, burn_value: uint256, ctx: Ctx) -> Tokens:
       quote1: uint256 = state.quote_excess_as_quote
       left  : uint256 = burn_value - quote1
       quote2: uint256 = left / 2
-      base  : uint256 = Math(self).quote_to_base(quote2, ctx)
+      base  : uint256 = self.math_quote_to_base(quote2, ctx)
       quote : uint256 = quote1 + quote2
       return Tokens({base: base, quote: quote})
 
@@ -162,9 +164,9 @@ def balanced(state: Value, burn_value: uint256, ctx: Ctx) -> Tokens:
 # for an example.
 DENOM: constant(uint256) = 1_000_000_000
 
-@external
+@internal
 @pure
-def apply(x: uint256, numerator: uint256) -> Fee:
+def math_apply(x: uint256, numerator: uint256) -> Fee:
   """
   Fees are represented as numerator only, with the denominator defined
   here. This computes x*fee capped at x.
@@ -175,36 +177,12 @@ def apply(x: uint256, numerator: uint256) -> Fee:
   return Fee({x: x, fee: fee_, remaining: remaining})
 
 ########################################################################
-@external
-@pure
-def PLUS(x: uint256)  -> Instr: return Instr({op: OP.ADD_, arg: x})
-@external
-@pure
-def MINUS(x: uint256) -> Instr: return Instr({op: OP.SUB_, arg: x})
-# No constructors for MUL and DIV because we don't currently use those.
-
-@external
+@internal
 @pure
-def eval(n: uint256, instrs: DynArray[Instr, 100]) -> uint256:
+def math_add_delta(x: uint256, delta: int256) -> uint256:
   """
-  Very simple accumulator-based arithmetic DSL.
+  Applies a net change to a balance, reverts if the result is negative.
   """
-  res: uint256 = n
-  for instr in instrs:
-    res = self.eval1(res, instr)
-  return res
+  return convert(convert(x, int256) + delta, uint256)
 
-@internal
-@pure
-def eval1(n: uint256, instr: Instr) -> uint256:
-  op : OP      = instr.op
-  arg: uint256 = instr.arg
-  res: uint256 = 0
-  if   op == OP.ADD_ : res = n + arg
-  elif op == OP.SUB_ : res = n - arg
-  elif op == OP.MUL_ : res = n * arg
-  elif op == OP.DIV_ : res = n / arg
-  else               : raise "unknown_op"
-  return res
-
-# eof
+### END math.vy
@@ -5,6 +5,7 @@ INITIALIZED: bool
 EXTRACTOR  : public(Extractor)
 FEED_ID    : public(bytes32)
 DECIMALS   : public(uint256)
+MAX_AGE    : public(uint256)
 
 @external
 def __init__():
@@ -26,7 +27,7 @@ def __init__2(
   self.EXTRACTOR = Extractor(extractor)
   self.FEED_ID   = feed_id
   self.DECIMALS  = decimals
-  self.TIMESTAMP = 0
+  self.MAX_AGE   = 60
 
 @internal
 def _INTERNAL():
@@ -52,48 +53,154 @@ def set_decimals(new_decimals: uint256):
   assert msg.sender == self.DEPLOYER, ERR_PERMISSIONS
   self.DECIMALS = new_decimals
 
+@external
+def set_max_age(new_max_age: uint256):
+  assert msg.sender == self.DEPLOYER, ERR_PERMISSIONS
+  self.MAX_AGE = new_max_age
+
 ########################################################################
 @external
 def price(
+    feed_id       : bytes32,
+    feed_decimals : uint256,
     quote_decimals: uint256,
     desired       : uint256,
     slippage      : uint256,
     payload       : Bytes[224]
 ) -> uint256:
   """
-  Certify a price.
-  - parses oracle payload via an extractor contract
-  - checks that oracle price matches user expectations
+  Certify a price for feed_id, which has feed_decimals decimals (FEED_ID
+  and DECIMALS if empty, each pool may have its own feed, c.f.
+  pools.resolve_pair).
+  - locks in block price to avoid frontrunning: the first transaction in
+    each block parses the oracle payload via an extractor contract, later
+    ones reuse its price without extracting theirs
   - checks that oracle price is not older than previous oracle price
-  - locks in block price to avoid frontrunning
+  - checks that oracle price matches user expectations
   """
   self._INTERNAL()
-  price      : uint256 = self.extract_price(quote_decimals, payload)
-  block_price: uint256 = self.get_or_set_block_price(price)
+  pd         : uint256 = feed_decimals if feed_id != empty(bytes32) else self.DECIMALS
+  block_price: uint256 = self.scale(self.get_or_set_block_price(feed_id, payload),
+                                    pd, quote_decimals)
   acceptable : bool    = self.check_slippage(block_price, desired, slippage)
   valid      : bool    = self.check_price(block_price)
   assert acceptable, ERR_PRECONDITIONS
   assert valid     , ERR_PRECONDITIONS
   return block_price
 
+@external
+def push(feed_id: bytes32, payload: Bytes[224]) -> uint256:
+  """
+  Push mode: a keeper locks in the price for the current block ahead of
+  user transactions, which can then omit their payload (and save the
+  calldata). Does nothing if the block price is already locked.
+  Returns the block price in the feed's precision (like block_price(),
+  unlike price() which is in the quote token's).
+  """
+  self._INTERNAL()
+  block_price: uint256 = self.get_or_set_block_price(feed_id, payload)
+  assert self.check_price(block_price), ERR_PRECONDITIONS
+  return block_price
+
+MAX_FEEDS: constant(uint256) = 8
+
+@external
+def push_many(
+    feed_ids: DynArray[bytes32, 8],
+    payload : Bytes[2048]
+) -> DynArray[uint256, 8]:
+  """
+  Like push() for several feeds (e.g. one per market, FEED_ID for empty
+  ones), which are extracted and verified from a single payload. Feeds
+  whose price is already locked for this block keep it. Returns the
+  block prices in the feeds' precision, like push().
+  """
+  self._INTERNAL()
+  ids: DynArray[bytes32, MAX_FEEDS] = []
+  for feed_id in feed_ids:
+    ids.append(feed_id if feed_id != empty(bytes32) else self.FEED_ID)
+
+  prices: DynArray[uint256, MAX_FEEDS] = []
+  ts    : uint256                      = 0
+  (prices, ts) = self.EXTRACTOR.extractPrices(ids, payload)
+  assert len(prices) == len(ids), "ERR_ORACLE"
+
+  res: DynArray[uint256, MAX_FEEDS] = []
+  for i in range(MAX_FEEDS):
+    if i >= len(ids): break
+    last: uint256 = self.BLOCK_PRICES[ids[i]]
+    if last >> 192 == block.number:
+      res.append(last & MASK128)
+    else:
+      assert self.check_price(prices[i]), ERR_PRECONDITIONS
+      self.lock(ids[i], last, prices[i], ts)
+      res.append(prices[i])
+  return res
+
 ########################################################################
-TIMESTAMP: public(uint256)
+# Per feed, the last extracted price (in the feed's precision, c.f.
+# pools.resolve_pair), the timestamp of the payload it came from (in
+# milliseconds, as Redstone's) and the block it was locked in for,
+# packed into one slot:
+# price | timestamp << 128 | block << 192
+BLOCK_PRICES: HashMap[bytes32, uint256]
+
+MASK64 : constant(uint256) = 18446744073709551615                    # 2**64-1
+MASK128: constant(uint256) = 340282366920938463463374607431768211455 # 2**128-1
+
+@external
+@view
+def TIMESTAMP() -> uint256:
+  return (self.BLOCK_PRICES[self.FEED_ID] >> 128) & MASK64
+
+@external
+@view
+def block_price(feed_id: bytes32) -> uint256:
+  """
+  The price locked in for the current block (in the feed's precision), or
+  zero if there is none yet.
+  """
+  last: uint256 = self.BLOCK_PRICES[feed_id]
+  return last & MASK128 if last >> 192 == block.number else 0
 
 @internal
-def extract_price(
-    quote_decimals: uint256,
-    payload       : Bytes[224]
+def get_or_set_block_price(
+    feed_id0: bytes32,
+    payload : Bytes[224]
 ) -> uint256:
+  """
+  The first transaction in each block will set the price for that block.
+  Later ones reuse it (whether or not they carry a payload), as long as
+  it is not older than MAX_AGE seconds. In the feed's precision.
+  """
+  feed_id: bytes32 = feed_id0 if feed_id0 != empty(bytes32) else self.FEED_ID
+  last   : uint256 = self.BLOCK_PRICES[feed_id]
+  if last >> 192 == block.number:
+    assert block.timestamp * 1000 <= ((last >> 128) & MASK64) + self.MAX_AGE * 1000, "ERR_ORACLE"
+    return last & MASK128
+  # no price pushed for this block, fall back to pull mode
+  assert len(payload) > 0, "ERR_ORACLE"
+
   price: uint256 = 0
   ts   : uint256 = 0
-  (price, ts) = self.EXTRACTOR.extractPrice(self.FEED_ID, payload)
+  (price, ts) = self.EXTRACTOR.extractPrice(feed_id, payload)
+  self.lock(feed_id, last, price, ts)
+  return price
 
+@internal
+def lock(feed_id: bytes32, last: uint256, price: uint256, ts: uint256):
   # Redstone allows prices ~10 seconds old, discourage replay attacks
-  assert ts >= self.TIMESTAMP, "ERR_ORACLE"
-  self.TIMESTAMP = ts
+  assert ts >= (last >> 128) & MASK64, "ERR_ORACLE"
+  self.BLOCK_PRICES[feed_id] = (
+    convert(convert(price,        uint128), uint256)        |
+    convert(convert(ts,           uint64),  uint256) << 128 |
+    convert(convert(block.number, uint64),  uint256) << 192)
 
+@internal
+@pure
+def scale(price: uint256, feed_decimals: uint256, quote_decimals: uint256) -> uint256:
   # price is quote per unit base, convert to same precision as quote
-  pd   : uint256 = self.DECIMALS
+  pd   : uint256 = feed_decimals
   qd   : uint256 = quote_decimals
   s    : bool    = pd >= qd
   n    : uint256 = pd - qd if s else qd - pd
@@ -101,21 +208,6 @@ def extract_price(
   p    : uint256 = price / m if s else price * m
   return p
 
-########################################################################
-PRICES: HashMap[uint256, uint256]
-
-@internal
-def get_or_set_block_price(current: uint256) -> uint256:
-  """
-  The first transaction in each block will set the price for that block.
-  """
-  block_price: uint256 = self.PRICES[block.number]
-  if block_price == 0:
-    self.PRICES[block.number] = current
-    return current
-  else:
-    return block_price
-
 ########################################################################
 @internal
 @pure
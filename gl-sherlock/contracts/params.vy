@@ -3,6 +3,12 @@ DEPLOYER   : address
 INITIALIZED: bool
 
 PARAMS     : public(Parameters)
+# dynamic_fees runs on every fee update and needs only MIN_FEE and MAX_FEE,
+# which set_params also stores packed into one slot (min | max << 128).
+# The other views read just the fields they use: loading the whole
+# Parameters struct (13 uint256 fields, 13 slots) would cost more.
+FEE_BOUNDS : uint256
+MASK128    : constant(uint256) = 340282366920938463463374607431768211455 # 2**128-1
 
 @external
 def __init__():
@@ -14,7 +20,7 @@ def __init__2(params: Parameters):
   assert msg.sender == self.DEPLOYER, ERR_PERMISSIONS
   assert not self.INITIALIZED       , ERR_INVARIANTS
   self.INITIALIZED = True
-  self.PARAMS = params
+  self.store(params)
 
 @external
 def set_deployer(new_deployer: address):
@@ -24,7 +30,14 @@ def set_deployer(new_deployer: address):
 @external
 def set_params(new_params: Parameters):
   assert msg.sender == self.DEPLOYER, ERR_PERMISSIONS
-  self.PARAMS = new_params
+  self.store(new_params)
+
+@internal
+def store(params: Parameters):
+  self.PARAMS     = params
+  self.FEE_BOUNDS = (
+    convert(convert(params.MIN_FEE, uint128), uint256)        |
+    convert(convert(params.MAX_FEE, uint128), uint256) << 128)
 
 ########################################################################
 # fee computation (borrowing & funding fees)
@@ -37,16 +50,19 @@ def dynamic_fees(pool: PoolState) -> DynFees:
     Funding fees scale base on the utilization imbalance off of the
     borrowing fee.
     """
+    bounds           : uint256 = self.FEE_BOUNDS
+    min_fee          : uint256 = bounds & MASK128
+    max_fee          : uint256 = bounds >> 128
     long_utilization : uint256 = self.utilization(pool.base_reserves, pool.base_interest)
     short_utilization: uint256 = self.utilization(pool.quote_reserves, pool.quote_interest)
     borrowing_long   : uint256 = self.check_fee(
-      self.scale(self.PARAMS.MAX_FEE, long_utilization))
+      self.scale(max_fee, long_utilization), min_fee, max_fee)
     borrowing_short  : uint256 = self.check_fee(
-      self.scale(self.PARAMS.MAX_FEE, short_utilization))
+      self.scale(max_fee, short_utilization), min_fee, max_fee)
     funding_long     : uint256 = self.funding_fee(
-      borrowing_long, long_utilization,  short_utilization)
+      borrowing_long, long_utilization,  short_utilization, min_fee, max_fee)
     funding_short    : uint256 = self.funding_fee(
-      borrowing_short, short_utilization,  long_utilization)
+      borrowing_short, short_utilization,  long_utilization, min_fee, max_fee)
     return DynFees({
         borrowing_long : borrowing_long,
         borrowing_short: borrowing_short,
@@ -68,11 +84,11 @@ def scale(fee: uint256, utilization: uint256) -> uint256:
     return (fee * utilization) / 100
 
 @internal
-@view
-def check_fee(fee: uint256) -> uint256:
-    if self.PARAMS.MIN_FEE <= fee and fee <= self.PARAMS.MAX_FEE: return fee
-    elif fee < self.PARAMS.MIN_FEE                              : return self.PARAMS.MIN_FEE
-    else                                                        : return self.PARAMS.MAX_FEE
+@pure
+def check_fee(fee: uint256, min_fee: uint256, max_fee: uint256) -> uint256:
+    if min_fee <= fee and fee <= max_fee: return fee
+    elif fee < min_fee                  : return min_fee
+    else                                : return max_fee
 
 @internal
 @pure
@@ -80,11 +96,16 @@ def imbalance(n: uint256, m: uint256) -> uint256:
     return n - m if n >= m else 0
 
 @internal
-@view
-def funding_fee(base_fee: uint256, col1: uint256, col2: uint256) -> uint256:
+@pure
+def funding_fee(
+    base_fee: uint256,
+    col1    : uint256,
+    col2    : uint256,
+    min_fee : uint256,
+    max_fee : uint256) -> uint256:
   imb: uint256 = self.imbalance(col1, col2)
   if imb == 0: return 0
-  else       : return self.check_fee(self.scale(base_fee, imb))
+  else       : return self.check_fee(self.scale(base_fee, imb), min_fee, max_fee)
 
 ########################################################################
 # one-off protocol fee
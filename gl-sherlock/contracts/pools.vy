@@ -1,8 +1,5 @@
 ########################################################################
 import pools as Pools #self
-import math  as Math
-
-MATH: public(Math)
 
 CORE: public(address)
 
@@ -16,13 +13,11 @@ def __init__():
 
 @external
 def __init__2(
-  math: address,
   core: address):
   assert msg.sender == self.DEPLOYER, ERR_INVARIANTS
   assert not self.INITIALIZED       , ERR_INVARIANTS
   self.INITIALIZED = True
 
-  self.MATH    = Math(math)
   self.CORE    = core
   self.POOL_ID = 0
 
@@ -46,22 +41,76 @@ def get_nr_pools() -> uint256:
   return self.POOL_ID
 
 ########################################################################
-POOL_STORE: HashMap[uint256, PoolState]
-PAIR_INDEX: HashMap[address, HashMap[address, uint256]]
-LP_INDEX  : HashMap[address, uint256]
+# Pool metadata never changes after fresh() whereas the counters change
+# on every trade, so the two are stored separately and the write paths
+# below only touch the counters they actually change.
+struct PoolMeta:
+  id               : uint256
+  symbol           : String[65]
+  base_token       : address
+  quote_token      : address
+  lp_token         : address
+
+struct PoolBalances:
+  base_reserves    : uint256
+  quote_reserves   : uint256
+  base_interest    : uint256
+  quote_interest   : uint256
+  base_collateral  : uint256
+  quote_collateral : uint256
+
+POOL_META    : HashMap[uint256, PoolMeta]
+POOL_BALANCES: HashMap[uint256, PoolBalances]
+PAIR_INDEX   : HashMap[address, HashMap[address, uint256]]
+LP_INDEX     : HashMap[address, uint256]
+
+# Token decimals and the pool's oracle feed never change either. They are
+# stored by pair (the decimals, including the feed's, packed with the pool
+# id as id | feed << 64 | base << 128 | quote << 192), so that the api can
+# route each transaction to its pool and build its context without
+# calling decimals() on both tokens. The feed id is a full bytes32 and
+# gets its own slot.
+PAIR_DECIMALS: HashMap[address, HashMap[address, uint256]]
+PAIR_FEED    : HashMap[address, HashMap[address, bytes32]]
+MASK64       : constant(uint256) = 18446744073709551615 # 2**64-1
 
 @internal
-def insert(new: PoolState) -> PoolState:
-  self.POOL_STORE[new.id]                          = new
+def insert(new: PoolMeta) -> PoolMeta:
+  self.POOL_META[new.id]                           = new
   self.PAIR_INDEX[new.base_token][new.quote_token] = new.id
   self.LP_INDEX[new.lp_token]                      = new.id
   return new
 
+@internal
+@view
+def _exists(id: uint256) -> bool:
+  return self.POOL_META[id].id != 0
+
+@internal
+@view
+def _lookup(id: uint256) -> PoolState:
+  assert self._exists(id), ERR_PRECONDITIONS
+  meta: PoolMeta     = self.POOL_META[id]
+  bal : PoolBalances = self.POOL_BALANCES[id]
+  return PoolState({
+    id               : meta.id,
+    symbol           : meta.symbol,
+    base_token       : meta.base_token,
+    quote_token      : meta.quote_token,
+    lp_token         : meta.lp_token,
+    base_reserves    : bal.base_reserves,
+    quote_reserves   : bal.quote_reserves,
+    base_interest    : bal.base_interest,
+    quote_interest   : bal.quote_interest,
+    base_collateral  : bal.base_collateral,
+    quote_collateral : bal.quote_collateral,
+  })
+
 # Storage is initialized to zero.
 @external
 @view
 def exists(id: uint256) -> bool:
-  return self.POOL_STORE[id].id != 0
+  return self._exists(id)
 
 @external
 @view
@@ -76,77 +125,101 @@ def exists_lp(lp_token: address) -> bool:
 @external
 @view
 def lookup(id: uint256) -> PoolState:
-  assert Pools(self).exists(id), ERR_PRECONDITIONS
-  return self.POOL_STORE[id]
+  return self._lookup(id)
 
 @external
 @view
 def lookup_pair(base_token: address, quote_token: address) -> PoolState:
   assert Pools(self).exists_pair(base_token, quote_token), ERR_PRECONDITIONS
-  return self.POOL_STORE[self.PAIR_INDEX[base_token][quote_token]]
+  return self._lookup(self.PAIR_INDEX[base_token][quote_token])
 
 @external
 @view
 def lookup_lp(lp_token: address) -> PoolState:
   assert Pools(self).exists_lp(lp_token), ERR_PRECONDITIONS
-  return self.POOL_STORE[self.LP_INDEX[lp_token]]
+  return self._lookup(self.LP_INDEX[lp_token])
+
+@external
+@view
+def resolve_pair(base_token: address, quote_token: address) -> Pair:
+  packed: uint256 = self.PAIR_DECIMALS[base_token][quote_token]
+  assert packed != 0, ERR_PRECONDITIONS
+  return Pair({
+    id            : packed & MASK64,
+    base_decimals : (packed >> 128) & MASK64,
+    quote_decimals: packed >> 192,
+    feed_id       : self.PAIR_FEED[base_token][quote_token],
+    feed_decimals : (packed >> 64) & MASK64,
+  })
 
 ########################################################################
 @external
 def fresh(
-  symbol     : String[65],
-  base_token : address,
-  quote_token: address,
-  lp_token   : address) -> PoolState:
+  symbol       : String[65],
+  base_token   : address,
+  quote_token  : address,
+  lp_token     : address,
+  decimals     : Decimals,
+  feed_id      : bytes32,
+  feed_decimals: uint256) -> PoolState:
   self._INTERNAL()
-  return self.insert(PoolState({
-    id               : self.next_pool_id(),
-    symbol           : symbol,
-    base_token       : base_token,
-    quote_token      : quote_token,
-    lp_token         : lp_token,
+  # balances are initialized to zero
+  meta: PoolMeta = self.insert(PoolMeta({
+    id         : self.next_pool_id(),
+    symbol     : symbol,
+    base_token : base_token,
+    quote_token: quote_token,
+    lp_token   : lp_token,
+  }))
+  self.PAIR_DECIMALS[base_token][quote_token] = (
+    convert(convert(meta.id,        uint64), uint256)        |
+    convert(convert(feed_decimals,  uint64), uint256) << 64  |
+    convert(convert(decimals.base,  uint64), uint256) << 128 |
+    convert(convert(decimals.quote, uint64), uint256) << 192)
+  self.PAIR_FEED[base_token][quote_token] = feed_id
+  return PoolState({
+    id               : meta.id,
+    symbol           : meta.symbol,
+    base_token       : meta.base_token,
+    quote_token      : meta.quote_token,
+    lp_token         : meta.lp_token,
     base_reserves    : 0,
     quote_reserves   : 0,
     base_interest    : 0,
     quote_interest   : 0,
     base_collateral  : 0,
     quote_collateral : 0,
-  }))
+  })
 
 ########################################################################
 @external
 @view
 def total_reserves(id: uint256) -> Tokens:
-  ps: PoolState = Pools(self).lookup(id)
-  return Tokens({base: ps.base_reserves, quote: ps.quote_reserves})
+  assert self._exists(id), ERR_PRECONDITIONS
+  bal: PoolBalances = self.POOL_BALANCES[id]
+  return Tokens({base: bal.base_reserves, quote: bal.quote_reserves})
 
 @external
 @view
 def unlocked_reserves(id: uint256) -> Tokens:
-  ps: PoolState = Pools(self).lookup(id)
+  assert self._exists(id), ERR_PRECONDITIONS
+  return self.unlocked(self.POOL_BALANCES[id])
+
+@internal
+@pure
+def unlocked(bal: PoolBalances) -> Tokens:
   return Tokens({
-    base : ps.base_reserves  - ps.base_interest,
-    quote: ps.quote_reserves - ps.quote_interest,
+    base : bal.base_reserves  - bal.base_interest,
+    quote: bal.quote_reserves - bal.quote_interest,
   })
 
 ########################################################################
 @external
-def mint(id: uint256, base_amt: uint256, quote_amt: uint256) -> PoolState:
+def mint(id: uint256, base_amt: uint256, quote_amt: uint256):
   self._INTERNAL()
-  ps: PoolState = Pools(self).lookup(id)
-  return self.insert(PoolState({
-    id               : ps.id,
-    symbol           : ps.symbol,
-    base_token       : ps.base_token,
-    quote_token      : ps.quote_token,
-    lp_token         : ps.lp_token,
-    base_reserves    : ps.base_reserves  + base_amt,
-    quote_reserves   : ps.quote_reserves + quote_amt,
-    base_interest    : ps.base_interest,
-    quote_interest   : ps.quote_interest,
-    base_collateral  : ps.base_collateral,
-    quote_collateral : ps.quote_collateral,
-  }))
+  assert self._exists(id), ERR_PRECONDITIONS
+  self.POOL_BALANCES[id].base_reserves  += base_amt
+  self.POOL_BALANCES[id].quote_reserves += quote_amt
 
 
 # LP tokens represent shares of the pool reserves.
@@ -167,8 +240,8 @@ def calc_mint(
   total_supply: uint256,
   ctx         : Ctx) -> uint256:
 
-  pv: uint256 = self.MATH.value(Pools(self).total_reserves(id), ctx).total_as_quote
-  mv: uint256 = self.MATH.value(Tokens({base: base_amt, quote: quote_amt}), ctx).total_as_quote
+  pv: uint256 = self.math_value(Pools(self).total_reserves(id), ctx).total_as_quote
+  mv: uint256 = self.math_value(Tokens({base: base_amt, quote: quote_amt}), ctx).total_as_quote
   return Pools(self).f(mv, pv, total_supply)
 
 @external
@@ -178,22 +251,11 @@ def f(mv: uint256, pv: uint256, ts: uint256) -> uint256:
   else      : return (mv * ts) / pv
 
 @external
-def burn(id: uint256, base_amt: uint256, quote_amt: uint256) -> PoolState:
+def burn(id: uint256, base_amt: uint256, quote_amt: uint256):
   self._INTERNAL()
-  ps: PoolState = Pools(self).lookup(id)
-  return self.insert(PoolState({
-    id               : ps.id,
-    symbol           : ps.symbol,
-    base_token       : ps.base_token,
-    quote_token      : ps.quote_token,
-    lp_token         : ps.lp_token,
-    base_reserves    : ps.base_reserves  - base_amt,
-    quote_reserves   : ps.quote_reserves - quote_amt,
-    base_interest    : ps.base_interest,
-    quote_interest   : ps.quote_interest,
-    base_collateral  : ps.base_collateral,
-    quote_collateral : ps.quote_collateral,
-  }))
+  assert self._exists(id), ERR_PRECONDITIONS
+  self.POOL_BALANCES[id].base_reserves  -= base_amt
+  self.POOL_BALANCES[id].quote_reserves -= quote_amt
 
 # Burning LP tokens is not always possible, since pools are fully-backed and
 # a sufficient number of reserve tokens to pay out any open positions is locked
@@ -204,19 +266,19 @@ def max_burn(id: uint256, total_supply: uint256, ctx: Ctx) -> uint256:
   """
   Return the maximum number of LP tokens which can currently be burned.
   """
-  pv: uint256 = self.MATH.value(Pools(self).total_reserves(id),    ctx).total_as_quote
-  uv: uint256 = self.MATH.value(Pools(self).unlocked_reserves(id), ctx).total_as_quote
+  pv: uint256 = self.math_value(Pools(self).total_reserves(id),    ctx).total_as_quote
+  uv: uint256 = self.math_value(Pools(self).unlocked_reserves(id), ctx).total_as_quote
   return (uv * total_supply) / pv - 1
 
 @external
 @view
 def calc_burn(id: uint256, lp_amt: uint256, total_supply: uint256, ctx: Ctx) -> Tokens:
-  pv      : uint256 = self.MATH.value(Pools(self).total_reserves(id), ctx).total_as_quote
+  pv      : uint256 = self.math_value(Pools(self).total_reserves(id), ctx).total_as_quote
   bv      : uint256 = self.g(lp_amt, total_supply, pv)
   unlocked: Tokens  = Pools(self).unlocked_reserves(id)
-  value   : Value   = self.MATH.value(unlocked, ctx)
+  value   : Value   = self.math_value(unlocked, ctx)
   uv      : uint256 = value.total_as_quote
-  amts    : Tokens  = self.MATH.balanced(value, bv, ctx)
+  amts    : Tokens  = self.math_balanced(value, bv, ctx)
   assert uv         >= bv,             ERR_PRECONDITIONS
   assert amts.base  <= unlocked.base,  ERR_PRECONDITIONS
   assert amts.quote <= unlocked.quote, ERR_PRECONDITIONS
@@ -229,50 +291,38 @@ def g(lp: uint256, ts: uint256, pv: uint256) -> uint256:
 
 ########################################################################
 @external
-def open(id: uint256, collateral: Tokens, interest: Tokens) -> PoolState:
+def open(id: uint256, collateral: Tokens, interest: Tokens):
   """
   Update accounting to reflect a new position being opened.
   """
   self._INTERNAL()
-  ps      : PoolState = Pools(self).lookup(id)
-  reserves: Tokens    = Pools(self).unlocked_reserves(id)
+  assert self._exists(id), ERR_PRECONDITIONS
+  bal     : PoolBalances = self.POOL_BALANCES[id]
+  reserves: Tokens       = self.unlocked(bal)
   assert reserves.base  >= interest.base , ERR_PRECONDITIONS
   assert reserves.quote >= interest.quote, ERR_PRECONDITIONS
-  return self.insert(PoolState({
-    id               : ps.id,
-    symbol           : ps.symbol,
-    base_token       : ps.base_token,
-    quote_token      : ps.quote_token,
-    lp_token         : ps.lp_token,
-    base_reserves    : ps.base_reserves,
-    quote_reserves   : ps.quote_reserves,
-    # lock reserves
-    base_interest    : ps.base_interest    + interest.base,
-    quote_interest   : ps.quote_interest   + interest.quote,
-    base_collateral  : ps.base_collateral  + collateral.base,
-    quote_collateral : ps.quote_collateral + collateral.quote,
-  }))
+  # lock reserves
+  self.POOL_BALANCES[id].base_interest    = bal.base_interest    + interest.base
+  self.POOL_BALANCES[id].quote_interest   = bal.quote_interest   + interest.quote
+  self.POOL_BALANCES[id].base_collateral  = bal.base_collateral  + collateral.base
+  self.POOL_BALANCES[id].quote_collateral = bal.quote_collateral + collateral.quote
 
 ########################################################################
 @external
-def close(id: uint256, d: Deltas) -> PoolState:
+def close(id: uint256, d: Deltas):
   """
   Apply transfers resulting from a position close to pool state.
   """
   self._INTERNAL()
-  ps: PoolState = Pools(self).lookup(id)
-  return self.insert(PoolState({
-    id               : ps.id,
-    symbol           : ps.symbol,
-    base_token       : ps.base_token,
-    quote_token      : ps.quote_token,
-    lp_token         : ps.lp_token,
-    base_reserves    : self.MATH.eval(ps.base_reserves,    d.base_reserves),
-    quote_reserves   : self.MATH.eval(ps.quote_reserves,   d.quote_reserves),
-    base_interest    : self.MATH.eval(ps.base_interest,    d.base_interest),
-    quote_interest   : self.MATH.eval(ps.quote_interest,   d.quote_interest),
-    base_collateral  : self.MATH.eval(ps.base_collateral,  d.base_collateral),
-    quote_collateral : self.MATH.eval(ps.quote_collateral, d.quote_collateral),
-  }))
+  assert self._exists(id), ERR_PRECONDITIONS
+  bal: PoolBalances = self.POOL_BALANCES[id]
+  self.POOL_BALANCES[id] = PoolBalances({
+    base_reserves    : self.math_add_delta(bal.base_reserves,    d.base_reserves),
+    quote_reserves   : self.math_add_delta(bal.quote_reserves,   d.quote_reserves),
+    base_interest    : self.math_add_delta(bal.base_interest,    d.base_interest),
+    quote_interest   : self.math_add_delta(bal.quote_interest,   d.quote_interest),
+    base_collateral  : self.math_add_delta(bal.base_collateral,  d.base_collateral),
+    quote_collateral : self.math_add_delta(bal.quote_collateral, d.quote_collateral),
+  })
 
 # eof
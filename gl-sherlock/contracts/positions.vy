@@ -1,11 +1,8 @@
 ########################################################################
-import positions as Positions #self
-import math      as Math
 import params    as Params
 import pools     as Pools
 import fees      as Fees
 
-MATH  : public(Math)
 PARAMS: public(Params)
 POOLS : public(Pools)
 FEES  : public(Fees)
@@ -22,7 +19,6 @@ def __init__():
 
 @external
 def __init__2(
-  math  : address,
   params: address,
   pools : address,
   fees  : address,
@@ -31,7 +27,6 @@ def __init__2(
   assert not self.INITIALIZED       , ERR_INVARIANTS
   self.INITIALIZED = True
 
-  self.MATH        = Math(math)
   self.PARAMS      = Params(params)
   self.POOLS       = Pools(pools)
   self.FEES        = Fees(fees)
@@ -58,50 +53,220 @@ def get_nr_positions() -> uint256:
   return self.POSITION_ID
 
 ########################################################################
-POSITION_STORE: HashMap[uint256, PositionState]
+# Positions are stored packed into four slots (the tagged fields are
+# derived from long). convert() reverts if a value does not fit into
+# its width, which is well beyond anything the parameters allow.
+struct PackedPosition:
+  account: uint256 # user | pool << 160 | leverage << 224 | long << 255
+  size   : uint256 # collateral | interest << 128
+  opening: uint256 # entry_price | opened_at << 128 | user index << 192 | pool index << 224
+  closing: uint256 # exit_price | closed_at << 128 | status << 192
+
+POSITION_STORE: HashMap[uint256, PackedPosition]
+
+MASK24 : constant(uint256) = 16777215                                                   # 2**24-1
+MASK32 : constant(uint256) = 4294967295                                                 # 2**32-1
+MASK64 : constant(uint256) = 18446744073709551615                                       # 2**64-1
+MASK128: constant(uint256) = 340282366920938463463374607431768211455                    # 2**128-1
+MASK160: constant(uint256) = 1461501637330902918203684832716283019655932542975          # 2**160-1
+
+USER_INDEX: constant(uint256) = 192 # offsets of the set indices in the opening slot
+POOL_INDEX: constant(uint256) = 224
 
 @internal
-def insert(new: PositionState) -> PositionState:
-  self.POSITION_STORE[new.id] = new
+def insert(new: PositionState, user_index: uint256, pool_index: uint256) -> PositionState:
+  self.POSITION_STORE[new.id] = PackedPosition({
+    account: self.pack_account(new),
+    size   : self.pack2(new.collateral,  new.interest),
+    opening: self.pack_opening(new, user_index, pool_index),
+    closing: self.pack_closing(new),
+  })
   return new
 
+@internal
+@pure
+def pack2(lo: uint256, hi: uint256) -> uint256:
+  return (convert(convert(lo, uint128), uint256) |
+          convert(convert(hi, uint128), uint256) << 128)
+
+@internal
+@pure
+def pack_account(pos: PositionState) -> uint256:
+  return (convert(pos.user, uint256)                             |
+          convert(convert(pos.pool,     uint64), uint256) << 160 |
+          convert(convert(pos.leverage, uint24), uint256) << 224 |
+          convert(pos.long, uint256)                      << 255)
+
+@internal
+@pure
+def pack_opening(pos: PositionState, user_index: uint256, pool_index: uint256) -> uint256:
+  return (convert(convert(pos.entry_price, uint128), uint256)              |
+          convert(convert(pos.opened_at,   uint64),  uint256) << 128        |
+          convert(convert(user_index,      uint32),  uint256) << USER_INDEX |
+          convert(convert(pool_index,      uint32),  uint256) << POOL_INDEX)
+
+@internal
+@pure
+def pack_closing(pos: PositionState) -> uint256:
+  return (convert(convert(pos.exit_price, uint128), uint256)       |
+          convert(convert(pos.closed_at,  uint64),  uint256) << 128 |
+          convert(pos.status, uint256)                       << 192)
+
+@internal
+@pure
+def unpack(id: uint256, pp: PackedPosition) -> PositionState:
+  long      : bool    = (pp.account >> 255) == 1
+  collateral: uint256 = pp.size & MASK128
+  interest  : uint256 = pp.size >> 128
+  return PositionState({
+    id         : id,
+    pool       : (pp.account >> 160) & MASK64,
+    user       : convert(pp.account & MASK160, address),
+    status     : convert(pp.closing >> 192, Status),
+    long       : long,
+    collateral : collateral,
+    leverage   : (pp.account >> 224) & MASK24,
+    interest   : interest,
+    entry_price: pp.opening & MASK128,
+    exit_price : pp.closing & MASK128,
+    opened_at  : (pp.opening >> 128) & MASK64,
+    closed_at  : (pp.closing >> 128) & MASK64,
+
+    collateral_tagged: Tokens({base: 0, quote: collateral}) if long else (
+                       Tokens({base: collateral, quote: 0}) ),
+    interest_tagged  : Tokens({base: interest, quote: 0}) if long else (
+                       Tokens({base: 0, quote: interest}) ),
+  })
+
+@internal
+@view
+def _exists(id: uint256) -> bool:
+  # user is never empty
+  return self.POSITION_STORE[id].account != 0
+
+@internal
+@view
+def _lookup(id: uint256) -> PositionState:
+  assert self._exists(id), ERR_PRECONDITIONS
+  return self.unpack(id, self.POSITION_STORE[id])
+
 @external
 @view
 def exists(id: uint256) -> bool:
-  return self.POSITION_STORE[id].id != 0
+  return self._exists(id)
 
 @external
 @view
 def lookup(id: uint256) -> PositionState:
-  assert Positions(self).exists(id), ERR_PRECONDITIONS
-  return self.POSITION_STORE[id]
+  return self._lookup(id)
 
 ########################################################################
 # UI helpers
-MAX_POSITIONS : constant(uint256) = 500
-USER_POSITIONS: HashMap[address, DynArray[uint256, 500]]
+# Per-user and per-pool sets of open positions: arrays in mappings, with
+# each position's index in them stored in its opening slot (c.f.
+# PackedPosition), so that both insertion and removal (swap with the last
+# element) are constant time. (The paging views spell out MAX_PAGE in
+# their signatures, c.f. MAX_BATCH.)
+MAX_POSITIONS    : constant(uint256) = 500 # open positions per user
+MAX_PAGE         : constant(uint256) = 100
+USER_POSITIONS   : HashMap[address, HashMap[uint256, uint256]]
+NR_USER_POSITIONS: HashMap[address, uint256]
+POOL_POSITIONS   : HashMap[uint256, HashMap[uint256, uint256]]
+NR_POOL_POSITIONS: HashMap[uint256, uint256]
+
+@internal
+@view
+def get_index(id: uint256, offset: uint256) -> uint256:
+  return (self.POSITION_STORE[id].opening >> offset) & MASK32
+
+@internal
+def set_index(id: uint256, offset: uint256, i: uint256):
+  opening: uint256 = self.POSITION_STORE[id].opening
+  self.POSITION_STORE[id].opening = ((opening & ~(MASK32 << offset)) |
+                                     convert(convert(i, uint32), uint256) << offset)
+
+@internal
+def insert_user_position(user: address, id: uint256) -> uint256:
+  n: uint256 = self.NR_USER_POSITIONS[user]
+  assert n < MAX_POSITIONS, ERR_PRECONDITIONS
+  self.USER_POSITIONS[user][n] = id
+  self.NR_USER_POSITIONS[user] = n + 1
+  return n
 
 @internal
-def insert_user_position(user: address, id: uint256) -> bool:
-  # initialized to empty
-  ids: DynArray[uint256, 500] = self.USER_POSITIONS[user]
-  ids.append(id)
-  self.USER_POSITIONS[user] = ids
-  return True
+def remove_user_position(user: address, id: uint256):
+  i   : uint256 = self.get_index(id, USER_INDEX)
+  last: uint256 = self.NR_USER_POSITIONS[user] - 1
+  if i != last:
+    moved: uint256 = self.USER_POSITIONS[user][last]
+    self.USER_POSITIONS[user][i] = moved
+    self.set_index(moved, USER_INDEX, i)
+  self.USER_POSITIONS[user][last] = 0
+  self.NR_USER_POSITIONS[user]    = last
+
+@internal
+def insert_pool_position(pool: uint256, id: uint256) -> uint256:
+  n: uint256 = self.NR_POOL_POSITIONS[pool]
+  self.POOL_POSITIONS[pool][n] = id
+  self.NR_POOL_POSITIONS[pool] = n + 1
+  return n
+
+@internal
+def remove_pool_position(pool: uint256, id: uint256):
+  i   : uint256 = self.get_index(id, POOL_INDEX)
+  last: uint256 = self.NR_POOL_POSITIONS[pool] - 1
+  if i != last:
+    moved: uint256 = self.POOL_POSITIONS[pool][last]
+    self.POOL_POSITIONS[pool][i] = moved
+    self.set_index(moved, POOL_INDEX, i)
+  self.POOL_POSITIONS[pool][last] = 0
+  self.NR_POOL_POSITIONS[pool]    = last
 
 @external
 @view
-def lookup_user_positions(user: address) -> DynArray[PositionState, 500]:
-  ids: DynArray[uint256, 500] = self.USER_POSITIONS[user]
-  res: DynArray[PositionState, 500] = []
-  for id in ids:
-    res.append(Positions(self).lookup(id))
+def lookup_user_positions(
+  user  : address,
+  offset: uint256,
+  limit : uint256) -> DynArray[PositionState, 100]: # MAX_PAGE
+  """
+  Returns up to limit (at most MAX_PAGE) of user's open positions,
+  starting at offset. The order changes when positions are closed.
+  """
+  n  : uint256                      = self.NR_USER_POSITIONS[user]
+  res: DynArray[PositionState, 100] = []
+  if offset >= n: return res
+  for i in range(MAX_PAGE):
+    if i >= limit or offset + i >= n: break
+    res.append(self._lookup(self.USER_POSITIONS[user][offset + i]))
   return res
 
 @external
 @view
 def get_nr_user_positions(user: address) -> uint256:
-  return len(self.USER_POSITIONS[user])
+  return self.NR_USER_POSITIONS[user]
+
+@external
+@view
+def open_positions(
+  pool  : uint256,
+  offset: uint256,
+  limit : uint256) -> DynArray[PositionState, 100]: # MAX_PAGE
+  """
+  Returns up to limit (at most MAX_PAGE) of the pool's open positions,
+  starting at offset. The order changes when positions are closed.
+  """
+  n  : uint256                      = self.NR_POOL_POSITIONS[pool]
+  res: DynArray[PositionState, 100] = []
+  if offset >= n: return res
+  for i in range(MAX_PAGE):
+    if i >= limit or offset + i >= n: break
+    res.append(self._lookup(self.POOL_POSITIONS[pool][offset + i]))
+  return res
+
+@external
+@view
+def nr_open_positions(pool: uint256) -> uint256:
+  return self.NR_POOL_POSITIONS[pool]
 
 ########################################################################
 @external
@@ -119,8 +284,8 @@ def open(
   # Longs buy base tokens with quote collateral and shorts buy quote
   # tokens with base collateral (alternatively, longs buy base and shorts
   # sell base).
-  virtual_tokens: uint256 = self.MATH.quote_to_base(collateral, ctx) if long else (
-                            self.MATH.base_to_quote(collateral, ctx) )
+  virtual_tokens: uint256 = self.math_quote_to_base(collateral, ctx) if long else (
+                            self.math_base_to_quote(collateral, ctx) )
   interest      : uint256 = virtual_tokens * leverage
 
   pos: PositionState      = PositionState({
@@ -144,23 +309,31 @@ def open(
   })
   ps: PoolState = self.POOLS.lookup(pool)
 
-  assert Positions(self).get_nr_user_positions(user) <= MAX_POSITIONS
   assert self.PARAMS.is_legal_position(ps, pos)
 
-  self.insert_user_position(user, pos.id)
-  return self.insert(pos)
+  user_index: uint256 = self.insert_user_position(user, pos.id)
+  pool_index: uint256 = self.insert_pool_position(pool, pos.id)
+  self.FEES.checkpoint(pool)
+  return self.insert(pos, user_index, pool_index)
 
 ########################################################################
+# The external views below are thin wrappers around internal functions
+# which take an already loaded position, so that a valuation reads each
+# position from storage only once.
 @external
 @view
 def value(id: uint256, ctx: Ctx) -> PositionValue:
   """
   Value a position at a point in time (the current block).
   """
-  pos   : PositionState = Positions(self).lookup(id)
+  return self._value(self._lookup(id), ctx)
+
+@internal
+@view
+def _value(pos: PositionState, ctx: Ctx) -> PositionValue:
   # All positions will eventually become liquidatable due to fees.
-  fees  : FeesPaid      = Positions(self).calc_fees(id)
-  pnl   : PnL           = Positions(self).calc_pnl(id, ctx, fees.remaining)
+  fees  : FeesPaid      = self._calc_fees(pos)
+  pnl   : PnL           = self._calc_pnl(pos, ctx, fees.remaining)
   # Accounting steps needed to close position at this time:
   # - reduce open interest
   # - take all collateral and move to reserves
@@ -192,41 +365,44 @@ def value(id: uint256, ctx: Ctx) -> PositionValue:
   #
   # Positions which go negative due to price fluctuations cost the pool
   # EV profits since the most it can make is available collateral.
-  deltas: Deltas        = Deltas({
-    base_interest   : [self.MATH.MINUS(pos.interest)],
-    quote_interest  : [],
-
-    base_transfer   : [self.MATH.PLUS(pnl.payout),
-                       # funding_received is capped at collateral and we
-                       # already have those tokens
-                       self.MATH.PLUS(fees.funding_received)],
-    base_reserves   : [self.MATH.MINUS(pnl.payout)],
-    base_collateral : [self.MATH.MINUS(fees.funding_received)], # ->
-
-    quote_transfer  : [],
-                      # in the worst case describe above, reserves
-                      # dont change
-    quote_reserves  : [self.MATH.PLUS(pos.collateral), #does not need min()
-                       self.MATH.MINUS(fees.funding_paid)],
-    quote_collateral: [self.MATH.PLUS(fees.funding_paid),
-                       self.MATH.MINUS(pos.collateral)],
-  }) if pos.long else  Deltas({
-    base_interest   : [],
-    quote_interest  : [self.MATH.MINUS(pos.interest)],
-
-    base_transfer   : [],
-    base_reserves   : [self.MATH.PLUS(pos.collateral),
-                       self.MATH.MINUS(fees.funding_paid)],
-    base_collateral : [self.MATH.PLUS(fees.funding_paid), # <-
-                       self.MATH.MINUS(pos.collateral)],
-
-    quote_transfer  : [self.MATH.PLUS(pnl.payout),
-                       self.MATH.PLUS(fees.funding_received)],
-    quote_reserves  : [self.MATH.MINUS(pnl.payout)],
-    quote_collateral: [self.MATH.MINUS(fees.funding_received)],
-  })
-
-  return PositionValue({position: pos, fees: fees, pnl: pnl, deltas: deltas})
+  #
+  # (The two branches build the result in place, rather than selecting
+  # between two Deltas, to avoid allocating memory for both.)
+  if pos.long:
+    return PositionValue({position: pos, fees: fees, pnl: pnl, deltas: Deltas({
+      base_interest   : -convert(pos.interest, int256),
+      quote_interest  : 0,
+
+      base_transfer   : pnl.payout +
+                        # funding_received is capped at collateral and we
+                        # already have those tokens
+                        fees.funding_received,
+      base_reserves   : -convert(pnl.payout, int256),
+      base_collateral : -convert(fees.funding_received, int256), # ->
+
+      quote_transfer  : 0,
+                        # in the worst case describe above, reserves
+                        # dont change
+      quote_reserves  : convert(pos.collateral, int256) - #does not need min()
+                        convert(fees.funding_paid, int256),
+      quote_collateral: convert(fees.funding_paid, int256) -
+                        convert(pos.collateral, int256),
+    })})
+  else:
+    return PositionValue({position: pos, fees: fees, pnl: pnl, deltas: Deltas({
+      base_interest   : 0,
+      quote_interest  : -convert(pos.interest, int256),
+
+      base_transfer   : 0,
+      base_reserves   : convert(pos.collateral, int256) -
+                        convert(fees.funding_paid, int256),
+      base_collateral : convert(fees.funding_paid, int256) - # <-
+                        convert(pos.collateral, int256),
+
+      quote_transfer  : pnl.payout + fees.funding_received,
+      quote_reserves  : -convert(pnl.payout, int256),
+      quote_collateral: -convert(fees.funding_received, int256),
+    })})
 
 ########################################################################
 struct Val:
@@ -242,11 +418,21 @@ def deduct(x: uint256, y: uint256) -> Val:
 @external
 @view
 def calc_fees(id: uint256) -> FeesPaid:
-  pos             : PositionState = Positions(self).lookup(id)
+  return self._calc_fees(self._lookup(id))
+
+@internal
+@view
+def _calc_fees(pos: PositionState) -> FeesPaid:
   pool            : PoolState     = self.POOLS.lookup(pos.pool)
   fees            : SumFees       = self.FEES.calc(
                                     pos.pool, pos.long, pos.collateral, pos.opened_at)
-  c0              : uint256       = pos.collateral
+  return self.fees_paid(pos.collateral, fees, pool.base_collateral if pos.long else (
+                                              pool.quote_collateral ))
+
+@internal
+@pure
+def fees_paid(collateral: uint256, fees: SumFees, avail: uint256) -> FeesPaid:
+  c0              : uint256       = collateral
   c1              : Val           = self.deduct(c0,           fees.funding_paid)
   c2              : Val           = self.deduct(c1.remaining, fees.borrowing_paid)
   # Funding fees prioritized over borrowing fees.
@@ -254,8 +440,6 @@ def calc_fees(id: uint256) -> FeesPaid:
   borrowing_paid  : uint256       = c2.deducted
   remaining       : uint256       = c2.remaining
   # When there are negative positions (liquidation bot failure):
-  avail           : uint256       = pool.base_collateral if pos.long else (
-                                    pool.quote_collateral )
   # 1) we penalize negative positions by setting their funding_received to zero
   funding_received: uint256       = 0 if remaining == 0 else (
     # 2) funding_received may add up to more than available collateral, and
@@ -275,19 +459,33 @@ def calc_fees(id: uint256) -> FeesPaid:
 @external
 @view
 def calc_pnl(id: uint256, ctx: Ctx, remaining: uint256) -> PnL:
-  if Positions(self).lookup(id).long: return Positions(self).calc_pnl_long( id, ctx, remaining)
-  else                              : return Positions(self).calc_pnl_short(id, ctx, remaining)
+  return self._calc_pnl(self._lookup(id), ctx, remaining)
 
 @external
 @view
 def calc_pnl_long(id: uint256, ctx: Ctx, remaining: uint256) -> PnL:
-  pos    : PositionState = Positions(self).lookup(id)
+  return self._calc_pnl_long(self._lookup(id), ctx, remaining)
+
+@external
+@view
+def calc_pnl_short(id: uint256, ctx: Ctx, remaining_as_base: uint256) -> PnL:
+  return self._calc_pnl_short(self._lookup(id), ctx, remaining_as_base)
+
+@internal
+@view
+def _calc_pnl(pos: PositionState, ctx: Ctx, remaining: uint256) -> PnL:
+  if pos.long: return self._calc_pnl_long( pos, ctx, remaining)
+  else       : return self._calc_pnl_short(pos, ctx, remaining)
+
+@internal
+@pure
+def _calc_pnl_long(pos: PositionState, ctx: Ctx, remaining: uint256) -> PnL:
   ctx0   : Ctx           = Ctx({price         : pos.entry_price,
                                 base_decimals : ctx.base_decimals,
                                 quote_decimals: ctx.quote_decimals})
   vtokens: uint256       = pos.interest
-  val0   : uint256       = self.MATH.base_to_quote(vtokens, ctx0)
-  val1   : uint256       = self.MATH.base_to_quote(vtokens, ctx)
+  val0   : uint256       = self.math_base_to_quote(vtokens, ctx0)
+  val1   : uint256       = self.math_base_to_quote(vtokens, ctx)
   loss   : uint256       = val0 - val1 if val0 > val1 else 0
   profit : uint256       = val1 - val0 if val1 > val0 else 0
   # Positions whose collateral drops to zero due to fee obligations
@@ -297,7 +495,7 @@ def calc_pnl_long(id: uint256, ctx: Ctx, remaining: uint256) -> PnL:
                                remaining - loss if loss > 0 else (
                                remaining + profit ) ) )
   # Accounting in quote, payout in base.
-  payout : uint256       = self.MATH.quote_to_base(final, ctx)
+  payout : uint256       = self.math_quote_to_base(final, ctx)
   assert payout <= pos.interest, ERR_INVARIANTS
   return PnL({
     loss     : loss,
@@ -312,17 +510,16 @@ def calc_pnl_long(id: uint256, ctx: Ctx, remaining: uint256) -> PnL:
     payout   : payout,
   })
 
-@external
-@view
-def calc_pnl_short(id: uint256, ctx: Ctx, remaining_as_base: uint256) -> PnL:
-  pos      : PositionState = Positions(self).lookup(id)
+@internal
+@pure
+def _calc_pnl_short(pos: PositionState, ctx: Ctx, remaining_as_base: uint256) -> PnL:
   ctx0     : Ctx           = Ctx({price         : pos.entry_price,
                                   base_decimals : ctx.base_decimals,
                                   quote_decimals: ctx.quote_decimals})
   # Slightly different from long because short collateral is in base.
   vtokens  : uint256       = pos.leverage * pos.collateral
-  val0     : uint256       = self.MATH.base_to_quote(vtokens, ctx0)
-  val1     : uint256       = self.MATH.base_to_quote(vtokens, ctx)
+  val0     : uint256       = self.math_base_to_quote(vtokens, ctx0)
+  val1     : uint256       = self.math_base_to_quote(vtokens, ctx)
   loss     : uint256       = val1 - val0 if val1 > val0 else 0
   profit   : uint256       = val0 - val1 if val0 > val1 else 0
   # Notice we value the remaining collateral at the _current_ price.
@@ -330,14 +527,14 @@ def calc_pnl_short(id: uint256, ctx: Ctx, remaining_as_base: uint256) -> PnL:
   # for winning short positions, and slightly higher payouts for losing
   # short positions (makes shorts a little bit more of an insurance
   # product).
-  remaining: uint256       = self.MATH.base_to_quote(remaining_as_base, ctx)
+  remaining: uint256       = self.math_base_to_quote(remaining_as_base, ctx)
   final    : uint256       = 0 if remaining == 0 else (
                                0 if loss > remaining else (
                                  remaining - loss if loss > 0 else (
                                  remaining + profit ) ) )
   # accounting in quote, payout in quote.
   payout   : uint256 = final
-  left     : uint256 = self.MATH.quote_to_base(0 if loss > remaining else remaining - loss, ctx)
+  left     : uint256 = self.math_quote_to_base(0 if loss > remaining else remaining - loss, ctx)
   assert payout <= pos.interest, ERR_INVARIANTS
   return PnL({
     loss     : loss,
@@ -353,39 +550,153 @@ def is_liquidatable(id: uint256, ctx: Ctx) -> bool:
   """
   Determines whether position `id` is liquidatable at `ctx.price`.
   """
-  v: PositionValue = Positions(self).value(id, ctx)
-  return self.PARAMS.is_liquidatable(v.position, v.pnl)
+  return self._is_liquidatable(self._lookup(id), ctx)
+
+@internal
+@view
+def _is_liquidatable(pos: PositionState, ctx: Ctx) -> bool:
+  # Same as value() minus the deltas, which we don't need here.
+  fees: FeesPaid = self._calc_fees(pos)
+  pnl : PnL      = self._calc_pnl(pos, ctx, fees.remaining)
+  return self.PARAMS.is_liquidatable(pos, pnl)
 
 @external
 @view
 def status(id: uint256, ctx: Ctx) -> Status:
-  if Positions(self).is_liquidatable(id, ctx): return Status.LIQUIDATABLE
-  else                                       : return Positions(self).lookup(id).status
+  pos: PositionState = self._lookup(id)
+  if self._is_liquidatable(pos, ctx): return Status.LIQUIDATABLE
+  else                              : return pos.status
+
+########################################################################
+# Batched views for keepers, which value up to MAX_BATCH positions in one
+# call. The pool state and the current fee sums are loaded once per run
+# of ids in the same pool (so ids are best sorted by pool). Unlike the
+# single views these don't revert: ids which do not exist are returned
+# empty (id == 0, status 0, which is none of Status' flags, so that they
+# can't be taken for closed positions), and closed positions are
+# returned without a value. (The external signatures spell out
+# MAX_BATCH: the compiler does not resolve constants when core imports
+# this contract as an interface.)
+MAX_BATCH: constant(uint256) = 500
+
+@external
+@view
+def value_many(ids: DynArray[uint256, 500], ctx: Ctx) -> DynArray[Valuation, 500]: # MAX_BATCH
+  return self._value_many(ids, ctx)
+
+@external
+@view
+def status_many(ids: DynArray[uint256, 500], ctx: Ctx) -> DynArray[Status, 500]: # MAX_BATCH
+  vs : DynArray[Valuation, MAX_BATCH] = self._value_many(ids, ctx)
+  res: DynArray[Status, MAX_BATCH]    = []
+  for v in vs:
+    res.append(v.status)
+  return res
+
+@external
+@view
+def is_liquidatable_many(ids: DynArray[uint256, 500], ctx: Ctx) -> DynArray[bool, 500]: # MAX_BATCH
+  vs : DynArray[Valuation, MAX_BATCH] = self._value_many(ids, ctx)
+  res: DynArray[bool, MAX_BATCH]      = []
+  for v in vs:
+    res.append(v.liquidatable)
+  return res
+
+@internal
+@view
+def _value_many(ids: DynArray[uint256, MAX_BATCH], ctx: Ctx) -> DynArray[Valuation, MAX_BATCH]:
+  res  : DynArray[Valuation, MAX_BATCH] = []
+  pool : uint256                        = 0
+  avail: Tokens                         = empty(Tokens)
+  sums : Checkpoint                     = empty(Checkpoint)
+
+  for id in ids:
+    if not self._exists(id):
+      res.append(empty(Valuation))
+      continue
+    pos: PositionState = self.unpack(id, self.POSITION_STORE[id])
+    if pos.status != Status.OPEN:
+      res.append(Valuation({
+        id: id, status: pos.status, remaining: 0, pnl: empty(PnL), liquidatable: False}))
+      continue
+
+    if pos.pool != pool:
+      pool = pos.pool
+      ps: PoolState = self.POOLS.lookup(pool)
+      avail = Tokens({base: ps.base_collateral, quote: ps.quote_collateral})
+      sums  = self.FEES.current_sums(pool)
+
+    # same as _is_liquidatable()
+    fees: FeesPaid = self.fees_paid(
+      pos.collateral,
+      self.FEES.calc_at(pool, pos.long, pos.collateral, pos.opened_at, sums),
+      avail.base if pos.long else avail.quote)
+    pnl         : PnL  = self._calc_pnl(pos, ctx, fees.remaining)
+    liquidatable: bool = self.PARAMS.is_liquidatable(pos, pnl)
+    res.append(Valuation({
+      id          : id,
+      status      : Status.LIQUIDATABLE if liquidatable else Status.OPEN,
+      remaining   : fees.remaining,
+      pnl         : pnl,
+      liquidatable: liquidatable,
+    }))
+
+  return res
 
 ########################################################################
 @external
 def close(id: uint256, ctx: Ctx) -> PositionValue:
   self._INTERNAL()
-  pos: PositionState = Positions(self).lookup(id)
+  return self._value(self._close(self._lookup(id), ctx), ctx)
+
+@external
+def liquidate(id: uint256, ctx: Ctx) -> PositionValue:
+  """
+  Like close() but the position must be liquidatable, which is checked
+  against the same valuation used to close it.
+  """
+  self._INTERNAL()
+  value: PositionValue = self._value(self._close(self._lookup(id), ctx), ctx)
+  assert self.PARAMS.is_liquidatable(value.position, value.pnl), ERR_PRECONDITIONS
+  return value
+
+@external
+def try_liquidate(id: uint256, pool: uint256, ctx: Ctx) -> PositionValue:
+  """
+  Like liquidate() but for batches: instead of reverting, returns an
+  empty value (position.id == 0) if the position does not exist,
+  belongs to a different pool or cannot be liquidated.
+  """
+  self._INTERNAL()
+  # read once, c.f. _exists()
+  pp: PackedPosition = self.POSITION_STORE[id]
+  if pp.account == 0: return empty(PositionValue)
+  pos: PositionState = self.unpack(id, pp)
+  if (pos.pool   != pool        or
+      pos.status != Status.OPEN or
+      block.number <= pos.opened_at): return empty(PositionValue)
+  # the deltas do not depend on the closing fields
+  value: PositionValue = self._value(pos, ctx)
+  if not self.PARAMS.is_liquidatable(value.position, value.pnl):
+    return empty(PositionValue)
+  value.position = self._close(pos, ctx)
+  return value
+
+@internal
+def _close(pos: PositionState, ctx: Ctx) -> PositionState:
+  """
+  Closes pos, as already loaded by the caller.
+  """
   assert pos.status   == Status.OPEN  , ERR_PRECONDITIONS
   assert block.number  > pos.opened_at, ERR_PRECONDITIONS
-  self.insert(PositionState({
-    id         : pos.id,
-    pool       : pos.pool,
-    user       : pos.user,
-    status     : Status.CLOSED,
-    long       : pos.long,
-    collateral : pos.collateral,
-    leverage   : pos.leverage,
-    interest   : pos.interest,
-    entry_price: pos.entry_price,
-    exit_price : ctx.price,
-    opened_at  : pos.opened_at,
-    closed_at  : block.number,
-
-    collateral_tagged: pos.collateral_tagged,
-    interest_tagged  : pos.interest_tagged,
-  }))
-  return Positions(self).value(id, ctx)
+  closed: PositionState = pos
+  closed.status     = Status.CLOSED
+  closed.exit_price = ctx.price
+  closed.closed_at  = block.number
+  # only the closing slot changes
+  self.POSITION_STORE[pos.id].closing = self.pack_closing(closed)
+  self.remove_user_position(pos.user, pos.id)
+  self.remove_pool_position(pos.pool, pos.id)
+  return closed
 
 # eof
@@ -0,0 +1,35 @@
+########################################################################
+# Exposes the math.vy library (which is only ever compiled into other
+# contracts) so that it can be tested on its own.
+
+@external
+@pure
+def base_to_quote(tokens: uint256, ctx: Ctx) -> uint256:
+  return self.math_base_to_quote(tokens, ctx)
+
+@external
+@pure
+def quote_to_base(tokens: uint256, ctx: Ctx) -> uint256:
+  return self.math_quote_to_base(tokens, ctx)
+
+@external
+@pure
+def value(tokens: Tokens, ctx: Ctx) -> Value:
+  return self.math_value(tokens, ctx)
+
+@external
+@pure
+def balanced(state: Value, burn_value: uint256, ctx: Ctx) -> Tokens:
+  return self.math_balanced(state, burn_value, ctx)
+
+@external
+@pure
+def apply(x: uint256, numerator: uint256) -> Fee:
+  return self.math_apply(x, numerator)
+
+@external
+@pure
+def add_delta(x: uint256, delta: int256) -> uint256:
+  return self.math_add_delta(x, delta)
+
+# eof
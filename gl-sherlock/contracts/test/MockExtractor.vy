@@ -1,6 +1,7 @@
 
 interface Extractor:
   def extractPrice(feed_id: bytes32, payload: Bytes[224]) -> (uint256, uint256): view
+  def extractPrices(feed_ids: DynArray[bytes32, 8], payload: Bytes[2048]) -> (DynArray[uint256, 8], uint256): view
 
 implements: Extractor
 
@@ -8,4 +9,55 @@ implements: Extractor
 @view
 def extractPrice(feed_id: bytes32, payload: Bytes[224]) -> (uint256, uint256):
   price: bytes32 = convert(slice(payload, 192, 32), bytes32)
-  return (convert(price, uint256), block.timestamp)
+  # in milliseconds, like Redstone's
+  return (convert(price, uint256), block.timestamp * 1000)
+
+# c.f. tests/conftest.py:redstone_payload
+MARKER_BS    : constant(uint256) = 9
+META_SIZE_BS : constant(uint256) = 3
+COUNT_BS     : constant(uint256) = 2
+SIGNATURE_BS : constant(uint256) = 65
+POINT_BS     : constant(uint256) = 64 # feed id, value
+# timestamp, value size, number of points
+PACKAGE_BS   : constant(uint256) = 13
+
+
+@external
+@view
+def extractPrices(feed_ids: DynArray[bytes32, 8], payload: Bytes[2048]) -> (DynArray[uint256, 8], uint256):
+  """
+  Looks the feeds up in a Redstone payload like the real extractor (the
+  prices are returned in the order of feed_ids, with the packages'
+  timestamp), but does not check signatures.
+  """
+  end     : uint256 = len(payload) - MARKER_BS - META_SIZE_BS
+  end               = end - convert(slice(payload, end, 3), uint256) - COUNT_BS
+  packages: uint256 = convert(slice(payload, end, 2), uint256)
+
+  prices: DynArray[uint256, 8] = []
+  found : DynArray[bool, 8]    = []
+  for i in range(8):
+    if i >= len(feed_ids): break
+    prices.append(0)
+    found.append(False)
+
+  ts: uint256 = 0
+  for p in range(8):
+    if p >= packages: break
+    end                = end - SIGNATURE_BS - PACKAGE_BS
+    ts                 = convert(slice(payload, end, 6), uint256)
+    points   : uint256 = convert(slice(payload, end + 10, 3), uint256)
+    end                = end - points * POINT_BS
+    for j in range(8):
+      if j >= points: break
+      feed_id: bytes32 = convert(slice(payload, end + j * POINT_BS, 32), bytes32)
+      for i in range(8):
+        if i >= len(feed_ids): break
+        if feed_ids[i] == feed_id:
+          prices[i] = convert(slice(payload, end + j * POINT_BS + 32, 32), uint256)
+          found[i]  = True
+
+  for i in range(8):
+    if i >= len(feed_ids): break
+    assert found[i], "feed not in payload"
+  return (prices, ts)
@@ -0,0 +1,26 @@
+pragma solidity ^0.8.4;
+
+import "../RedstoneExtractor.sol";
+
+// RedstoneExtractor trusting a single test signer instead of Redstone's
+// (c.f. tests/conftest.py:redstone_payload).
+contract TestRedstoneExtractor is RedstoneExtractor {
+  address public signer;
+
+  constructor(address signer_) {
+    signer = signer_;
+  }
+
+  function getUniqueSignersThreshold() public view override returns (uint8) {
+    return 1;
+  }
+
+  function getAuthorisedSignerIndex(address receivedSigner)
+      public view override returns (uint8)
+  {
+    require(receivedSigner == signer, "unauthorised signer");
+    return 0;
+  }
+}
+
+// eof
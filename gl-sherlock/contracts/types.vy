@@ -17,6 +17,19 @@ struct Ctx:
   base_decimals : uint256
   quote_decimals: uint256
 
+struct Decimals:
+  base : uint256
+  quote: uint256
+
+# What the api needs to know about a pool to build a context and route
+# a call to it (c.f. pools.resolve_pair).
+struct Pair:
+  id            : uint256
+  base_decimals : uint256
+  quote_decimals: uint256
+  feed_id       : bytes32
+  feed_decimals : uint256
+
 struct Value:
   base                  : uint256
   quote                 : uint256
@@ -35,16 +48,6 @@ struct Fee:
   fee      : uint256
   remaining: uint256
 
-enum OP:
-  ADD_
-  SUB_
-  MUL_
-  DIV_
-
-struct Instr:
-  op : OP
-  arg: uint256
-
 # params.vy
 struct Parameters:
   # Fees are stored as a numerator, with the denominator defined in math.vy.
@@ -124,6 +127,15 @@ struct FeeState:
   received_long_sum    : uint256
   received_short_sum   : uint256
 
+# cumulative sums at a block
+struct Checkpoint:
+  borrowing_long_sum   : uint256
+  borrowing_short_sum  : uint256
+  funding_long_sum     : uint256
+  funding_short_sum    : uint256
+  received_long_sum    : uint256
+  received_short_sum   : uint256
+
 struct SumFees:
   funding_paid    : uint256
   funding_received: uint256
@@ -167,15 +179,25 @@ struct PnL:
   remaining: uint256
   payout   : uint256
 
+# Compact result of positions.value_many(), for keepers.
+struct Valuation:
+  id          : uint256
+  status      : Status
+  remaining   : uint256 # collateral left after fees
+  pnl         : PnL
+  liquidatable: bool
+
+# Net changes to pool balances (c.f. math.vy/math_add_delta) and the
+# amounts paid out to the user when a position is closed.
 struct Deltas:
-  base_interest   : DynArray[Instr, 100]
-  quote_interest  : DynArray[Instr, 100]
-  base_transfer   : DynArray[Instr, 100]
-  base_reserves   : DynArray[Instr, 100]
-  base_collateral : DynArray[Instr, 100]
-  quote_transfer  : DynArray[Instr, 100]
-  quote_reserves  : DynArray[Instr, 100]
-  quote_collateral: DynArray[Instr, 100]
+  base_interest   : int256
+  quote_interest  : int256
+  base_transfer   : uint256
+  base_reserves   : int256
+  base_collateral : int256
+  quote_transfer  : uint256
+  quote_reserves  : int256
+  quote_collateral: int256
 
 struct PositionValue:
   position: PositionState
@@ -184,19 +206,49 @@ struct PositionValue:
   deltas  : Deltas
 
 # core.vy
+# batched user operations (c.f. api.execute), each one uses the fields
+# named after the arguments of the corresponding api function
+enum Action:
+  MINT
+  BURN
+  OPEN
+  CLOSE
+
+struct Op:
+  action     : Action
+  base_amt   : uint256 # mint
+  quote_amt  : uint256 # mint
+  lp_amt     : uint256 # burn
+  long       : bool    # open
+  collateral0: uint256 # open
+  leverage   : uint256 # open
+  position_id: uint256 # close
+
+struct Liquidation:
+  position_id: uint256
+  liquidated : bool     # false if the position was skipped
+  fees       : Tokens   # paid to the liquidator
+  remaining  : Tokens   # paid to the position's owner
+
 interface ERC20Plus:
   def decimals()                         -> uint8: view
   def mint(to: address, amt: uint256)    -> bool: nonpayable
   def burn(_from: address, amt: uint256) -> bool: nonpayable
 
+# Events carry what changed (pool state and positions can be rebuilt
+# from them, c.f. tools/events.py).
 event Create:
-  user: indexed(address)
-  pool: indexed(uint256)
+  user       : indexed(address)
+  pool       : indexed(uint256)
+  symbol     : String[65]
+  base_token : address
+  quote_token: address
+  lp_token   : address
 
 event Mint:
   user        : indexed(address)
+  pool        : indexed(uint256)
   ctx         : Ctx
-  pool        : PoolState
   total_supply: uint256
   lp_amt      : uint256
   base_amt    : uint256
@@ -204,33 +256,44 @@ event Mint:
 
 event Burn:
   user        : indexed(address)
+  pool        : indexed(uint256)
   ctx         : Ctx
-  pool        : PoolState
   total_supply: uint256
   lp_amt      : uint256
   base_amt    : uint256
   quote_amt   : uint256
 
 event Open:
-  user    : indexed(address)
-  ctx     : Ctx
-  pool    : PoolState
-  position: PositionState
+  user       : indexed(address)
+  pool       : indexed(uint256)
+  position_id: indexed(uint256)
+  ctx        : Ctx
+  long       : bool
+  collateral : uint256
+  leverage   : uint256
+  interest   : uint256
 
 event Close:
-  user : indexed(address)
-  ctx  : Ctx
-  pool : PoolState
-  value: PositionValue
+  user       : indexed(address)
+  pool       : indexed(uint256)
+  position_id: indexed(uint256)
+  ctx        : Ctx
+  fees       : FeesPaid
+  pnl        : PnL
+  deltas     : Deltas
 
 event Liquidate:
-  user : indexed(address)
-  ctx  : Ctx
-  pool : PoolState
-  value: PositionValue
+  user       : indexed(address) # liquidator
+  pool       : indexed(uint256)
+  position_id: indexed(uint256)
+  ctx        : Ctx
+  fees       : FeesPaid
+  pnl        : PnL
+  deltas     : Deltas
 
 # oracle.vy
 interface Extractor:
   def extractPrice(feed_id: bytes32, payload: Bytes[224]) -> (uint256, uint256): view
+  def extractPrices(feed_ids: DynArray[bytes32, 8], payload: Bytes[2048]) -> (DynArray[uint256, 8], uint256): view
 
 ### END types.vy
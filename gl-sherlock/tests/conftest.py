@@ -1,9 +1,18 @@
+import os
+import sys
 import pytest
-from ape import accounts
+from ape import accounts, chain
 from web3 import Web3, EthereumTesterProvider
+from hexbytes import HexBytes
+from eth_keys import keys
+from eth_utils import keccak
 
 w3 = Web3(EthereumTesterProvider())
 
+# tools/ lives next to tests/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from tools.events import Decoder, EVENTS, sort
+
 SCOPE = "function"
 
 # accounts
@@ -91,7 +100,7 @@ FEED_ID = b"BTC"
 
 @pytest.fixture(scope=SCOPE)
 def math(owner, project):
-    return owner.deploy(project.math)
+    return owner.deploy(project.Math)
 
 @pytest.fixture(scope=SCOPE)
 def params_(owner, project): return owner.deploy(project.params)
@@ -132,35 +141,65 @@ def oracle(owner, oracle_, api_, extractor):
     return oracle_
 
 @pytest.fixture(scope=SCOPE)
-def fees(owner, fees_, math, params, pools_, core_, positions_):
-    fees_.__init__2(math, params, pools_, core_, positions_, sender=owner)
+def fees(owner, fees_, params, pools_, core_, positions_):
+    fees_.__init__2(params, pools_, core_, positions_, sender=owner)
     return fees_
 
 @pytest.fixture(scope=SCOPE)
-def pools(owner, pools_, math, core_):
-    pools_.__init__2(math, core_, sender=owner)
+def pools(owner, pools_, core_):
+    pools_.__init__2(core_, sender=owner)
     return pools_
 
 @pytest.fixture(scope=SCOPE)
-def positions(owner, positions_, math, params, pools_, fees_, core_):
-    positions_.__init__2(math, params, pools_, fees_, core_, sender=owner)
+def positions(owner, positions_, params, pools_, fees_, core_):
+    positions_.__init__2(params, pools_, fees_, core_, sender=owner)
     return positions_
 
 # NOTE: dummy collector address
 @pytest.fixture(scope=SCOPE)
-def core(owner, core_, math, params, pools_, fees_, positions_, api_):
-    core_.__init__2(math, params, pools_, fees_, positions_, owner, api_, sender=owner)
+def core(owner, core_, params, pools_, fees_, positions_, api_):
+    core_.__init__2(params, pools_, fees_, positions_, owner, api_, sender=owner)
     return core_
 
 @pytest.fixture(scope=SCOPE)
-def api(owner, api_, core_, oracle_):
-    api_.__init__2(oracle_, core_, sender=owner)
+def api(owner, api_, core_, oracle_, pools_):
+    api_.__init__2(oracle_, core_, pools_, sender=owner)
     return api_
 
 # ---------------- API ------------------------
 
 def payload(price): return (price).to_bytes(224, "big")
 
+# Redstone's payload format (c.f. the evm-connector's CalldataExtractor):
+# data packages, the number of packages (2 bytes), unsigned metadata, its
+# size (3 bytes) and a marker. A package is data points (feed id, 32 byte
+# value), a timestamp in milliseconds (6 bytes), the value size (4 bytes),
+# the number of points (3 bytes) and a signature over all that.
+# Payloads are passed as bytes arguments, which the ABI pads to 32 bytes,
+# but Redstone reads them from the end of the calldata, so the metadata
+# pads them instead.
+REDSTONE_MARKER = bytes.fromhex("000002ed57011e0000")
+REDSTONE_SIGNER = keys.PrivateKey(keccak(b"redstone test signer"))
+
+def redstone_package(prices, timestamp, signer=REDSTONE_SIGNER):
+    points = b"".join(feed.ljust(32, b"\0") + value.to_bytes(32, "big")
+                      for feed, value in prices)
+    signed = (points + timestamp.to_bytes(6, "big") +
+              (32).to_bytes(4, "big") + len(prices).to_bytes(3, "big"))
+    sig    = signer.sign_msg_hash(keccak(signed)).to_bytes()
+    return signed + sig[:64] + bytes([sig[64] + 27])
+
+def redstone_payload(prices, timestamp, signer=REDSTONE_SIGNER):
+    """
+    A payload certifying prices ([(feed_id, value)]) at timestamp (in
+    milliseconds) with a single package, i.e. one signature.
+    """
+    package = redstone_package(prices, timestamp, signer)
+    size    = len(package) + 2 + 3 + len(REDSTONE_MARKER)
+    meta    = bytes(-size % 32)
+    return (package + (1).to_bytes(2, "big") +
+            meta + len(meta).to_bytes(3, "big") + REDSTONE_MARKER)
+
 def with_context(fun):
     def x(*args, **kwargs):
       price   = kwargs.get("price")
@@ -183,6 +222,36 @@ def close(api): return with_context(api.close)
 @pytest.fixture
 def liquidate(api): return with_context(api.liquidate)
 
+@pytest.fixture
+def liquidate_many(api): return with_context(api.liquidate_many)
+
+@pytest.fixture
+def execute(api): return with_context(api.execute)
+
+# ----------------------------------------------
+
+# events
+
+@pytest.fixture
+def verbose(core):
+    """
+    Decodes the events emitted by core in tx (replaying all logs up to
+    tx, c.f. tools/events.py).
+    """
+    def verbose(tx):
+      # a single eth_getLogs call (ContractEvent.range() pages over blocks)
+      raw    = chain.provider.web3.eth.get_logs({
+        "address"  : core.address,
+        "fromBlock": 0,
+        "toBlock"  : tx.block_number,
+      })
+      abis   = [getattr(core, name).abi for name in EVENTS]
+      logs   = sort(chain.provider.network.ecosystem.decode_logs(raw, *abis))
+      events = Decoder().decode_all(logs)
+      return [e for (log, e) in zip(logs, events)
+                if HexBytes(log.transaction_hash) == HexBytes(tx.txn_hash)]
+    return verbose
+
 # ----------------------------------------------
 
 # helpers
@@ -206,3 +275,13 @@ def tokens(b, q):
 def d(x): return x * 10**6
 
 def eth(x): return x*10**18
+
+def same(m, e):
+    """
+    Compares a namedtuple (e.g. from tools/model or tools/indexer) with
+    the corresponding ape struct.
+    """
+    for i, field in enumerate(m._fields):
+      mv, ev = getattr(m, field), e[i]
+      if hasattr(mv, "_fields"): same(mv, ev)
+      else                     : assert mv == ev, (type(m).__name__, field, mv, ev)
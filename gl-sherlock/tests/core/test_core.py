@@ -1,7 +1,7 @@
 import ape
 from ape import chain
 import pytest
-from conftest import d
+from conftest import d, payload, redstone_payload, FEED_ID
 import re
 
 ERR_PERMISSIONS   = re.compile("PERMISSIONS")
@@ -41,8 +41,7 @@ def setup(core, api, oracle, pools, positions, fees,
 
 # test
 
-def test_init(core, api, oracle, extractor, math, params, pools, fees, positions, owner):
-    assert core.MATH()      == math
+def test_init(core, api, oracle, extractor, params, pools, fees, positions, owner):
     assert core.PARAMS()    == params
     assert core.POOLS()     == pools
     assert core.FEES()      == fees
@@ -67,8 +66,12 @@ def test_create(core,
     assert not tx.failed
 
     logs = core.Create.from_receipt(tx)
-    assert logs[0].user == owner
-    assert logs[0].pool == 1
+    assert logs[0].user        == owner
+    assert logs[0].pool        == 1
+    assert logs[0].symbol      == "VEL-STX"
+    assert logs[0].base_token  == VEL
+    assert logs[0].quote_token == STX
+    assert logs[0].lp_token    == LP
 
     # TODO: obsolete now
     with ape.reverts(ERR_PRECONDITIONS):
@@ -148,7 +151,7 @@ def test_burn(core,
 
 
 def test_open(setup, core,
-              open,
+              open, verbose,
               long, short,
               VEL, STX, USD):
 
@@ -163,14 +166,14 @@ def test_open(setup, core,
     # long position
     tx = open(VEL, STX, True, d(2), 1, price=d(5), sender=long)
     assert not tx.failed
-    logs = core.Open.from_receipt(tx)
+    logs = verbose(tx)
     assert logs[0].position[2]        == long
     assert logs[0].position[3]        == 1             # status
     assert logs[0].position[5]        == 1_998_000     # collateral
     assert logs[0].position[7]        == 399_600       # interest
     assert logs[0].position[8]        == 5_000_000
     assert logs[0].position[9]        == 0
-    assert logs[0].position[10]       == 37            # opened-at
+    assert logs[0].position[10]       == 36            # opened-at
     assert logs[0].position[11]       == 0
     assert logs[0].position[12][0]    == 0
     assert logs[0].position[12][1]    == 1_998_000
@@ -187,7 +190,7 @@ def test_open(setup, core,
     # short position
     tx = open(VEL, STX, False, d(2), 1, price=d(5), sender=short)
     assert not tx.failed
-    logs = core.Open.from_receipt(tx)
+    logs = verbose(tx)
     assert logs[0].position[2]        == short
     assert logs[0].position[3]        == 1             # status
     assert logs[0].position[4]        == False         # long
@@ -195,7 +198,7 @@ def test_open(setup, core,
     assert logs[0].position[7]        == 9_990_000     # interest
     assert logs[0].position[8]        == 5_000_000
     assert logs[0].position[9]        == 0
-    assert logs[0].position[10]       == 38            # opened-at
+    assert logs[0].position[10]       == 37            # opened-at
     assert logs[0].position[11]       == 0
     assert logs[0].position[12][0]    == 1_998_000
     assert logs[0].position[12][1]    == 0
@@ -235,8 +238,10 @@ def test_close_long(setup, core,
     assert not tx.failed
     logs = core.Close.from_receipt(tx)
     fee = 10_000
-    assert logs[0].value[1]             == [0, 0, 0, 0, 99, 99, 9989901]       # FeesPaid
-    assert logs[0].value[2]             == [0, 0, 9989901, 1997980]            # [loss, profit, remaining, payout]
+    assert logs[0].fees                 == [0, 0, 0, 0, 99, 99, 9989901]       # FeesPaid
+    assert logs[0].pnl                  == [0, 0, 9989901, 1997980]            # [loss, profit, remaining, payout]
+    assert logs[0].deltas               == [-3996000, 0, 1997980, -1997980, 0, # Deltas
+                                            0, 9990000, -9990000]
     assert VEL.balanceOf(long)          == 10_000_000_000 + 1997980
     assert STX.balanceOf(long)          == 10_000_000_000 - 10_000_000
     assert VEL.balanceOf(core.address)  == 10_000_000_000 - 1997980
@@ -257,8 +262,8 @@ def test_close_short(setup, core, oracle,
     logs = core.Close.from_receipt(tx)
     fee = 10_000
     payout_as_base = 9989901 * 5
-    assert logs[0].value[1]             == [0, 0, 0, 0, 99, 99, 9989901]                # FeesPaid
-    assert logs[0].value[2]             == [0, 0, 9989901, payout_as_base]              # [loss, profit, remaining, payout]
+    assert logs[0].fees                 == [0, 0, 0, 0, 99, 99, 9989901]                # FeesPaid
+    assert logs[0].pnl                  == [0, 0, 9989901, payout_as_base]              # [loss, profit, remaining, payout]
     assert VEL.balanceOf(short)         == 10_000_000_000 - 10_000_000
     assert STX.balanceOf(short)         == 10_000_000_000 + payout_as_base
     assert VEL.balanceOf(core.address)  == 10_000_000_000 + 10_000_000  - fee
@@ -276,10 +281,10 @@ def test_close_long_profit(setup, core,
     tx = close(VEL, STX, 1, price=d(6), sender=long)
     assert not tx.failed
     logs = core.Close.from_receipt(tx)
-    assert logs[0].value[1][6]          == 9989901
-    assert logs[0].value[1]             == [0, 0, 0, 0, 99, 99, 9989901]         # FeesPaid
+    assert logs[0].fees[6]              == 9989901
+    assert logs[0].fees                 == [0, 0, 0, 0, 99, 99, 9989901]         # FeesPaid
     # payout = 3996000 + 9989901 / new_price
-    assert logs[0].value[2]             == [0, 3996000, 9989901, 2330983]        # [loss, profit, remaining, payout]
+    assert logs[0].pnl                  == [0, 3996000, 9989901, 2330983]        # [loss, profit, remaining, payout]
     assert VEL.balanceOf(long)          == 10_000_000_000 + 2330983
     assert STX.balanceOf(long)          == 10_000_000_000 - 10_000_000
     assert VEL.balanceOf(core.address)  == 10_000_000_000 - 2330983
@@ -305,8 +310,8 @@ def test_close_short_profit(setup, core,
     # payout = remaining * p1 + (p0 - p1)(collateral * leverage)
     profit = (p0 - p1) * (C * leverage)
     payout_as_base = remaining * p1 + profit
-    assert logs[0].value[1]             == [0, 0, 0, 0, 99, 99, 9989901]              # FeesPaid
-    assert logs[0].value[2]             == [0, profit, 9989901, payout_as_base]       # [loss, profit, remaining, payout]
+    assert logs[0].fees                 == [0, 0, 0, 0, 99, 99, 9989901]              # FeesPaid
+    assert logs[0].pnl                  == [0, profit, 9989901, payout_as_base]       # [loss, profit, remaining, payout]
     assert VEL.balanceOf(short)         == 10_000_000_000 - 10_000_000
     assert STX.balanceOf(short)         == 10_000_000_000 + payout_as_base
     assert VEL.balanceOf(core.address)  == 10_000_000_000 + 10_000_000 - 10_000
@@ -325,8 +330,8 @@ def test_close_long_loss(setup, core,
     logs = core.Close.from_receipt(tx)
     fee = 10_000
     # payout = 9989901 - 3996000 / p1
-    assert logs[0].value[1]             == [0, 0, 0, 0, 99, 99, 9989901]
-    assert logs[0].value[2]             == [3996000, 0, 5993901, 1498475]         # [loss, profit, remaining, payout]
+    assert logs[0].fees                 == [0, 0, 0, 0, 99, 99, 9989901]
+    assert logs[0].pnl                  == [3996000, 0, 5993901, 1498475]         # [loss, profit, remaining, payout]
     assert VEL.balanceOf(long)          == 10_000_000_000 + 1498475
     assert STX.balanceOf(long)          == 10_000_000_000 - 10_000_000
     assert VEL.balanceOf(core.address)  == 10_000_000_000 - 1498475
@@ -344,7 +349,7 @@ def test_close_short_loss(setup, core,
     tx = close(VEL, STX, 1, price=d(6), sender=short)
     assert not tx.failed
     logs = core.Close.from_receipt(tx)
-    print(logs[0].value[2])
+    print(logs[0].pnl)
 
     C = 10_000_000 - 10_000
     leverage = 2
@@ -362,10 +367,261 @@ def test_close_short_loss(setup, core,
     assert left == 6659901
 
     fee = 10_000
-    assert logs[0].value[1]             == [0, 0, 0, 0, 99, 99, 9989901]
-    assert logs[0].value[2]             == [loss, 0, left, payout_as_base]         # [loss, profit, remaining, payout]
+    assert logs[0].fees                 == [0, 0, 0, 0, 99, 99, 9989901]
+    assert logs[0].pnl                  == [loss, 0, left, payout_as_base]         # [loss, profit, remaining, payout]
     assert VEL.balanceOf(short)         == 10_000_000_000 - 10_000_000
     assert STX.balanceOf(short)         == 10_000_000_000 + payout_as_base
     assert VEL.balanceOf(core.address)  == 10_000_000_000 + 10_000_000 - fee
     assert STX.balanceOf(core.address)  == 50_000_000_000 - payout_as_base
 
+
+def test_liquidate(setup, core, positions,
+                   open, liquidate, verbose,
+                   long, short,
+                   VEL, STX):
+    setup()
+
+    tx = open(VEL, STX, True, d(10), 10, price=d(5), sender=long)
+    chain.mine(10_000)
+
+    with ape.reverts(ERR_PRECONDITIONS):
+        liquidate(VEL, STX, 1, price=d(5), sender=short)    # not liquidatable
+
+    tx = liquidate(VEL, STX, 1, price=d(4), sender=short)
+    assert not tx.failed
+    logs = core.Liquidate.from_receipt(tx)
+    assert logs[0].user                 == short
+    assert logs[0].position_id          == 1
+    assert verbose(tx)[0].value.position.status == 2        # closed
+    assert positions.lookup(1).status   == 2
+
+    with ape.reverts(ERR_PRECONDITIONS):
+        liquidate(VEL, STX, 1, price=d(4), sender=short)    # already closed
+
+def test_liquidate_many(setup, core, positions, fees,
+                        open, liquidate_many,
+                        long, short, lp_provider,
+                        VEL, STX):
+    setup()
+
+    open(VEL, STX, True , d(10), 10, price=d(5), sender=long)    # 1
+    open(VEL, STX, False, d(10), 2 , price=d(5), sender=short)   # 2
+    open(VEL, STX, True , d(10), 10, price=d(5), sender=long)    # 3
+    chain.mine(10_000)
+
+    # 2 is not liquidatable, 99 does not exist, 3 is liquidated twice
+    tx = liquidate_many(VEL, STX, [1, 2, 99, 3, 3], price=d(4), sender=lp_provider)
+    assert not tx.failed
+    logs = core.Liquidate.from_receipt(tx)
+    assert [log.position_id for log in logs] == [1, 3]
+    assert all(log.user == lp_provider for log in logs)
+
+    assert positions.lookup(1).status == 2
+    assert positions.lookup(2).status == 1
+    assert positions.lookup(3).status == 2
+    assert positions.get_nr_user_positions(long) == 0
+    assert fees.lookup(1).t1 == tx.block_number
+
+# api.execute operations (c.f. types.vy/Op)
+MINT, BURN, OPEN, CLOSE = 1, 2, 4, 8
+def op(action, base_amt=0, quote_amt=0, lp_amt=0,
+       long=False, collateral0=0, leverage=0, position_id=0):
+    return (action, base_amt, quote_amt, lp_amt,
+            long, collateral0, leverage, position_id)
+
+def test_execute(setup, core, positions, fees,
+                 open, execute,
+                 long, lp_provider,
+                 VEL, STX, LP):
+    setup()
+
+    open(VEL, STX, True, d(10), 10, price=d(5), sender=long)     # 1
+    chain.mine(10)
+
+    tx = execute(VEL, STX, LP, [
+        op(MINT , base_amt=d(100), quote_amt=d(500)),
+        op(OPEN , long=True , collateral0=d(10), leverage=2),   # 2
+        op(OPEN , long=False, collateral0=d(10), leverage=3),   # 3
+        op(CLOSE, position_id=1),
+    ], price=d(5), sender=long)
+    assert not tx.failed
+
+    assert [log.lp_amt > 0  for log in core.Mint.from_receipt(tx)]       == [True]
+    assert [log.position_id for log in core.Open.from_receipt(tx)]       == [2, 3]
+    assert [log.position_id for log in core.Close.from_receipt(tx)]      == [1]
+    assert all(log.ctx[0] == d(5) for log in core.Open.from_receipt(tx))
+    assert LP.balanceOf(long) > 0
+
+    assert positions.lookup(1).status == 2
+    assert positions.lookup(2).status == 1
+    assert positions.lookup(3).status == 1
+    assert positions.get_nr_user_positions(long) == 2
+    assert fees.lookup(1).t1 == tx.block_number
+
+    # ops are checked like the corresponding single operations
+    # (e.g. positions cannot be closed in the block they were opened in)
+    with ape.reverts(ERR_PRECONDITIONS):
+        execute(VEL, STX, LP, [
+            op(OPEN , long=True, collateral0=d(10), leverage=2), # 4
+            op(CLOSE, position_id=4),
+        ], price=d(5), sender=long)
+    with ape.reverts(ERR_PRECONDITIONS):
+        execute(VEL, STX, LP, [op(CLOSE, position_id=1)], price=d(5), sender=long)
+    with ape.reverts(ERR_PRECONDITIONS):
+        execute(VEL, STX, LP, [op(CLOSE, position_id=2)], price=d(5), sender=lp_provider)
+    with ape.reverts(ERR_PRECONDITIONS):
+        execute(VEL, STX, LP, [], price=d(5), sender=long)
+
+def send_in_one_block(*calls):
+    """
+    Sends (sender, method, args) calls in a single block and returns the
+    receipts (the test provider only takes one pending transaction per
+    sender, so each call needs its own sender).
+    """
+    provider = chain.provider
+    provider.auto_mine = False
+    try:
+        txs = [provider.web3.eth.send_transaction({
+                   'from': sender.address,
+                   'to'  : method.contract.address,
+                   'gas' : 2_000_000,
+                   'data': method.encode_input(*args),
+               }) for sender, method, args in calls]
+        provider.tester.ethereum_tester.mine_blocks()
+    finally:
+        provider.auto_mine = True
+    receipts = [provider.get_receipt(tx) for tx in txs]
+    assert len(set(r.block_number for r in receipts)) == 1
+    return receipts
+
+def test_block_price(setup, core, api, long, short, VEL, STX):
+    setup()
+
+    receipts = send_in_one_block(
+        (long,  api.open, (VEL, STX, True, d(10), 2, d(5), d(1), payload(d(5)))),
+        # this payload is not extracted (the price is locked)
+        (short, api.open, (VEL, STX, True, d(10), 2, d(6), d(1), payload(d(6)))),
+    )
+    assert not any(r.failed for r in receipts)
+    assert [log.ctx[0] for r in receipts for log in core.Open.from_receipt(r)] == [d(5), d(5)]
+    assert receipts[1].gas_used < receipts[0].gas_used
+
+def test_push_price(setup, core, api, lp_provider, long, short, VEL, STX):
+    setup()
+
+    # without a pushed price the payload is required
+    with ape.reverts("ERR_ORACLE"):
+        api.open(VEL, STX, True, d(10), 2, d(5), d(1), sender=long)
+    with ape.reverts(ERR_PRECONDITIONS):
+        api.push_price(STX, VEL, payload(d(5)), sender=lp_provider)
+
+    receipts = send_in_one_block(
+        (lp_provider, api.push_price, (VEL, STX, payload(d(5)))),
+        (long,        api.open, (VEL, STX, True,  d(10), 2, d(5), d(1))),
+        (short,       api.open, (VEL, STX, False, d(10), 2, d(5), d(1))),
+    )
+    assert not any(r.failed for r in receipts)
+    assert [log.ctx[0] for r in receipts for log in core.Open.from_receipt(r)] == [d(5), d(5)]
+
+    # pushed prices are subject to the same slippage checks
+    receipts = send_in_one_block(
+        (lp_provider, api.push_price, (VEL, STX, payload(d(5)))),
+        (long,        api.open, (VEL, STX, True, d(10), 2, d(7), d(1))),
+    )
+    assert [r.failed for r in receipts] == [False, True]
+
+def test_push_prices(setup, core, api, oracle, lp_provider, long, VEL, STX):
+    setup()
+
+    # the mock extractor looks the feeds up in a Redstone payload (without
+    # checking its signature), in any order
+    feeds    = [FEED_ID, b"ETH"]
+    ts       = chain.blocks.head.timestamp * 1000
+    prices   = redstone_payload([(b"ETH", d(3000)), (FEED_ID, d(5))], ts)
+    receipts = send_in_one_block(
+        (lp_provider, api.push_prices, (feeds, prices)),
+        (long,        api.open, (VEL, STX, True, d(10), 2, d(5), d(1))),
+    )
+    assert not any(r.failed for r in receipts)
+    assert [log.ctx[0] for log in core.Open.from_receipt(receipts[1])] == [d(5)]
+    assert oracle.TIMESTAMP() == ts
+
+    with ape.reverts(ERR_PRECONDITIONS):
+        api.push_prices(feeds, redstone_payload([(FEED_ID, d(5)), (b"ETH", 0)], ts),
+                        sender=lp_provider)
+
+    # an empty feed id is the oracle's default feed, as for pools
+    receipts = send_in_one_block(
+        (lp_provider, api.push_prices, ([b""], redstone_payload([(FEED_ID, d(6))], ts))),
+        (long,        api.open, (VEL, STX, True, d(10), 2, d(6), d(1))),
+    )
+    assert not any(r.failed for r in receipts)
+    assert [log.ctx[0] for log in core.Open.from_receipt(receipts[1])] == [d(6)]
+
+def test_max_age(setup, core, api, oracle, owner, lp_provider, long, VEL, STX):
+    setup()
+
+    # a locked price is only reused while its payload is at most MAX_AGE
+    # seconds old (payload timestamps are in milliseconds)
+    oracle.set_max_age(0, sender=owner)
+    ts       = chain.blocks.head.timestamp * 1000
+    receipts = send_in_one_block(
+        (lp_provider, api.push_prices, ([FEED_ID], redstone_payload([(FEED_ID, d(5))], ts))),
+        (long,        api.open, (VEL, STX, True, d(10), 2, d(5), d(1))),
+    )
+    assert [r.failed for r in receipts] == [False, True]
+
+def test_multiple_pools(setup, core, api, pools, mint, open, close,
+                        owner, lp_provider, long, short, VEL, STX, USD, LP, LP2, mint_token):
+    setup()
+
+    # a second pool sharing STX, priced by its own feed
+    core.fresh("USD-STX", USD, STX, LP2, b"USD", 6, sender=owner)
+    mint_token(USD, d(100_000), lp_provider)
+    mint_token(USD, d(10_000) , short)
+    USD.approve(core.address, d(100_000), sender=lp_provider)
+    USD.approve(core.address, d(10_000) , sender=short)
+    tx = mint(USD, STX, LP2, d(10_000), d(20_000), price=d(2), sender=lp_provider)
+    assert [log.pool for log in core.Mint.from_receipt(tx)] == [2]
+    assert LP2.balanceOf(lp_provider) > 0
+
+    tx1 = open(VEL, STX, True,  d(10), 2, price=d(5), sender=long)
+    tx2 = open(USD, STX, False, d(10), 2, price=d(2), sender=short)
+    assert [log.pool for log in core.Open.from_receipt(tx1)] == [1]
+    assert [log.pool for log in core.Open.from_receipt(tx2)] == [2]
+
+    # core holds both pools' tokens
+    pool1, pool2 = pools.lookup(1), pools.lookup(2)
+    assert core.OWED(STX) == (pool1.quote_reserves + pool1.quote_collateral +
+                              pool2.quote_reserves + pool2.quote_collateral)
+    assert core.OWED(USD) == pool2.base_reserves + pool2.base_collateral
+    assert STX.balanceOf(core) >= core.OWED(STX)
+
+    # each pool's feed is locked separately (pushed in the same block)
+    feeds    = [b"BTC", b"USD"]
+    prices   = redstone_payload([(b"BTC", d(5)), (b"USD", d(2))],
+                                chain.blocks.head.timestamp * 1000)
+    receipts = send_in_one_block(
+        (lp_provider, api.push_prices, (feeds, prices)),
+        (long,        api.close, (VEL, STX, 1, d(5), d(1))),
+        (short,       api.close, (USD, STX, 2, d(2), d(1))),
+    )
+    assert not any(r.failed for r in receipts)
+    assert [(log.pool, log.ctx[0]) for r in receipts[1:]
+            for log in core.Close.from_receipt(r)] == [(1, d(5)), (2, d(2))]
+
+    # positions can't be closed through another pool
+    tx = open(USD, STX, True, d(10), 2, price=d(2), sender=long)
+    with ape.reverts(ERR_PRECONDITIONS):
+        close(VEL, STX, 3, price=d(5), sender=long)
+
+def test_feed_decimals(setup, core, api, owner, lp_provider, USD, STX, LP2, mint_token):
+    setup()
+
+    # a feed with more decimals than the quote token (and the default feed)
+    core.fresh("USD-STX", USD, STX, LP2, b"USD", 8, sender=owner)
+    mint_token(USD, d(10_000), lp_provider)
+    USD.approve(core.address, d(10_000), sender=lp_provider)
+    tx = api.mint(USD, STX, LP2, d(10_000), d(20_000), d(2), d(1), payload(2 * 10**8),
+                  sender=lp_provider)
+    assert [log.ctx[0] for log in core.Mint.from_receipt(tx)] == [d(2)]
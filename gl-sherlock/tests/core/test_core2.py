@@ -39,7 +39,7 @@ def setup(core,
 # test
 
 def test_mint_open_open_close_burn(setup, core,
-                                   mint, burn, open, close,
+                                   mint, burn, open, close, verbose,
                                    owner, lp_provider, long, short,
                                    VEL, STX, LP):
     setup()
@@ -61,7 +61,7 @@ def test_mint_open_open_close_burn(setup, core,
     # open long position
 
     tx  = open(VEL, STX, True, d(2), 2, price=d(5), sender=long)
-    log = core.Open.from_receipt(tx)[0]
+    log = verbose(tx)[0]
     logger.info(tx.model_computed_fields)
     logger.info(tx.decode_logs(core.Open))
     assert not tx.failed, "open long"
@@ -74,7 +74,7 @@ def test_mint_open_open_close_burn(setup, core,
     assert log.pool[8]  == 0
     assert log.pool[9]  == 0
     assert log.pool[10] == 0
-    assert log.pool     == [1, "VEL-STX", VEL, STX, LP, d(10_000), d(50_000), 0, 0, 0, 0]
+    assert log.pool     == (1, "VEL-STX", VEL, STX, LP, d(10_000), d(50_000), 0, 0, 0, 0)
 
     assert log.position[4]  == True
     assert log.position[5]  == 1998000
@@ -82,7 +82,7 @@ def test_mint_open_open_close_burn(setup, core,
     assert log.position[7]  == 799200
     assert log.position[8]  == d(5)
     assert log.position[9]  == 0
-    assert log.position[10] == 35
+    assert log.position[10] == 34
     assert log.position[11] == 0
     assert log.position[12] == (0, 1998000)
     assert log.position[13] == (799200, 0)
@@ -91,7 +91,7 @@ def test_mint_open_open_close_burn(setup, core,
 
     tx = open(VEL, STX, False, d(1), 2, price=d(5), sender=short)
     assert not tx.failed, "open short"
-    log = core.Open.from_receipt(tx)[0]
+    log = verbose(tx)[0]
 
     assert log.pool[5]  == d(10_000)
     assert log.pool[6]  == d(50_000)
@@ -106,7 +106,7 @@ def test_mint_open_open_close_burn(setup, core,
     assert log.position[7]  == 9990000
     assert log.position[8]  == d(5)
     assert log.position[9]  == 0
-    assert log.position[10] == 10036
+    assert log.position[10] == 10035
     assert log.position[11] == 0
     assert log.position[12] == (999000, 0)
     assert log.position[13] == (0, 9990000)
@@ -124,7 +124,7 @@ def test_mint_open_open_close_burn(setup, core,
     # burn
 
     tx  = burn(VEL, STX, LP, d(10_000), price=d(5), sender=lp_provider)
-    log = core.Burn.from_receipt(tx)[0]
+    log = verbose(tx)[0]
 
     assert log.base_amt   == 1000599404
     assert log.quote_amt  == 4997002982
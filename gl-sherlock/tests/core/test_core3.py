@@ -90,13 +90,13 @@ def test_open_twice(setup, core,
     tx   = open(VEL, STX, True, d(100), 2, price=d(5), sender=long)
     logs = core.Open.from_receipt(tx)
 
-    assert logs[0].position[5]    == 99_900_000
-    assert logs[0].position[7]    == 39_960_000
+    assert logs[0].collateral     == 99_900_000
+    assert logs[0].interest       == 39_960_000
 
     tx   = open(VEL, STX, False, d(100), 2, price=d(5), sender=short)
     logs = core.Open.from_receipt(tx)
-    assert logs[0].position[5]    ==  99_900_000
-    assert logs[0].position[7]    == 999_000_000
+    assert logs[0].collateral     ==  99_900_000
+    assert logs[0].interest       == 999_000_000
 
     assert VEL.balanceOf(long)   == 10_000_000_000, "long VEL"
     assert STX.balanceOf(long)   ==  9_900_000_000, "long STX"
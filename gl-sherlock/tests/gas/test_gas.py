@@ -0,0 +1,147 @@
+"""
+Gas benchmarks for the api entry points.
+
+Each scenario records the gas used by one call and checks it against its
+budget in budgets.json (every scenario must have one). The suite only
+runs with GAS_BENCHMARKS set, so that gas drift does not fail the main
+suite:
+
+    $ GAS_BENCHMARKS=1 ape test tests/gas
+
+The measurements are written to a JSON report (GAS_REPORT,
+gas-report.json in the temporary directory by default):
+
+    {"scenario": {"gas": used, "budget": budget}, ...}
+
+After an intended change in gas costs, update budgets.json from the
+report (budgets are the measured cost plus ~2% headroom).
+"""
+import json
+import os
+import tempfile
+import pytest
+from ape import chain
+from conftest import d
+
+BUDGETS = json.load(open(os.path.join(os.path.dirname(__file__), "budgets.json")))
+REPORT  = os.environ.get("GAS_REPORT",
+                         os.path.join(tempfile.gettempdir(), "gas-report.json"))
+RESULTS = {}
+
+pytestmark = pytest.mark.skipif(not os.environ.get("GAS_BENCHMARKS"),
+                                reason="set GAS_BENCHMARKS to run")
+
+# fixtures
+
+@pytest.fixture(scope="module", autouse=True)
+def report():
+    yield
+    with open(REPORT, "w") as f:
+      json.dump(RESULTS, f, indent=2, sort_keys=True)
+
+@pytest.fixture
+def record():
+    def record(scenario, tx):
+      assert not tx.failed
+      RESULTS[scenario] = {'gas': tx.gas_used, 'budget': BUDGETS.get(scenario)}
+      assert scenario in BUDGETS, f"no budget for {scenario}"
+      assert tx.gas_used <= BUDGETS[scenario], \
+        f"{scenario}: {tx.gas_used} gas > budget {BUDGETS[scenario]}"
+    return record
+
+@pytest.fixture
+def setup(core, api, oracle, pools, positions, fees, mint,
+          owner, lp_provider, long, short, VEL, STX, LP, mint_token):
+    def setup(liquidity=True):
+      core.fresh("VEL-STX", VEL, STX, LP, sender=owner)
+      for user, amt in [(lp_provider, 100_000), (long, 10_000), (short, 10_000)]:
+        mint_token(VEL, d(amt), user)
+        mint_token(STX, d(amt), user)
+        VEL.approve(core.address, d(amt), sender=user)
+        STX.approve(core.address, d(amt), sender=user)
+      if liquidity:
+        mint(VEL, STX, LP, d(10_000), d(50_000), price=d(5), sender=lp_provider)
+        chain.mine(10)
+    return setup
+
+# liquidity
+
+def test_mint(setup, mint, record, lp_provider, VEL, STX, LP):
+    setup(liquidity=False)
+    record("mint_first", mint(VEL, STX, LP, d(10_000), d(50_000), price=d(5), sender=lp_provider))
+    chain.mine(10)
+    record("mint", mint(VEL, STX, LP, d(100), d(500), price=d(5), sender=lp_provider))
+
+def test_burn(setup, burn, record, lp_provider, VEL, STX, LP):
+    setup()
+    record("burn", burn(VEL, STX, LP, d(1000), price=d(5), sender=lp_provider))
+
+# positions
+
+SIDES = {"long": True, "short": False}
+
+def trader(side, long, short): return long if side == "long" else short
+
+@pytest.mark.parametrize("side", SIDES)
+def test_open(setup, open, record, long, short, side, VEL, STX):
+    setup()
+    user = trader(side, long, short)
+    record(f"open_{side}",       open(VEL, STX, SIDES[side], d(100), 2,  price=d(5), sender=user))
+    chain.mine(10)
+    record(f"open_{side}_10x",   open(VEL, STX, SIDES[side], d(100), 10, price=d(5), sender=user))
+
+@pytest.mark.parametrize("side", SIDES)
+def test_open_crowded(setup, open, record, long, short, side, VEL, STX):
+    """
+    Cost growth with the number of open positions (in the pool and the
+    user's own).
+    """
+    setup()
+    user = trader(side, long, short)
+    for _ in range(20):
+      open(VEL, STX, SIDES[side], d(10), 2, price=d(5), sender=user)
+    chain.mine(10)
+    record(f"open_{side}_after_20", open(VEL, STX, SIDES[side], d(100), 2, price=d(5), sender=user))
+
+AGES = {"fresh": 1, "aged": 10_000}
+
+@pytest.mark.parametrize("side", SIDES)
+@pytest.mark.parametrize("age", AGES)
+def test_close(setup, open, close, record, long, short, side, age, VEL, STX):
+    setup()
+    user = trader(side, long, short)
+    open(VEL, STX, SIDES[side], d(100), 2, price=d(5), sender=user)
+    chain.mine(AGES[age])
+    record(f"close_{side}_{age}", close(VEL, STX, 1, price=d(5), sender=user))
+
+# the price at which a 10x position is wiped out
+LIQUIDATION_PRICE = {"long": d(4), "short": d(6)}
+
+@pytest.mark.parametrize("side", SIDES)
+def test_liquidate(setup, open, liquidate, liquidate_many, record,
+                   lp_provider, long, short, side, VEL, STX):
+    setup()
+    user = trader(side, long, short)
+    for _ in range(3):
+      open(VEL, STX, SIDES[side], d(100), 10, price=d(5), sender=user)
+    chain.mine(10)
+    price = LIQUIDATION_PRICE[side]
+    record(f"liquidate_{side}",   liquidate(VEL, STX, 1, price=price, sender=lp_provider))
+    chain.mine(10)
+    record(f"liquidate_many_{side}_2",
+           liquidate_many(VEL, STX, [2, 3], price=price, sender=lp_provider))
+
+@pytest.mark.parametrize("side", SIDES)
+def test_liquidate_healthy(setup, open, liquidate_many, record,
+                           lp_provider, long, short, side, VEL, STX):
+    """
+    A liquidation bot's miss: the position is valued, then skipped.
+    """
+    setup()
+    user = trader(side, long, short)
+    open(VEL, STX, SIDES[side], d(100), 10, price=d(5), sender=user)
+    chain.mine(10)
+    record(f"liquidate_many_{side}_healthy",
+           liquidate_many(VEL, STX, [1], price=d(5), sender=lp_provider))
+
+# eof
@@ -1,4 +1,5 @@
-from conftest import eth
+import ape
+from conftest import d, eth, redstone_payload, REDSTONE_SIGNER
 
 def test_fresh(chain, fees, core, owner, networks):
   core.balance += eth(1)                # fund contract
@@ -22,3 +23,26 @@ def test_fresh(chain, fees, core, owner, networks):
     'received_short_sum'   : 0,
   }
   assert fees.lookup(1, sender=owner) == res.return_value
+
+def test_extract_prices(chain, project, owner):
+  # the real extractor (with a test signer), needs the solidity plugin
+  extractor = owner.deploy(project.TestRedstoneExtractor,
+                           REDSTONE_SIGNER.public_key.to_checksum_address())
+  mock      = owner.deploy(project.MockExtractor)
+  ts        = chain.blocks.head.timestamp * 1000
+  feeds     = [b"BTC", b"ETH", b"USD"]
+  # one package, i.e. a single signature over all three feeds
+  payload   = redstone_payload([(b"USD", d(1)), (b"BTC", d(60_000)), (b"ETH", d(3_000))], ts)
+
+  prices, t = extractor.extractPrices(feeds, payload)
+  assert (list(prices), t) == ([d(60_000), d(3_000), d(1)], ts)
+  assert extractor.extractPrice(b"ETH", payload) == (d(3_000), ts)
+  # the mock reads the same payloads (without checking the signature)
+  prices, t = mock.extractPrices(feeds, payload)
+  assert (list(prices), t) == ([d(60_000), d(3_000), d(1)], ts)
+
+  # the signature covers every value
+  tampered      = bytearray(payload)
+  tampered[63] ^= 1 # the first value's last byte
+  with ape.reverts():
+    extractor.extractPrices(feeds, bytes(tampered))
@@ -0,0 +1,92 @@
+import random
+import pytest
+from conftest import d
+from tools.backtest import Backtest, LP, Trader, Liquidator, load_prices, main
+from tools.model.params import DEFAULTS
+
+# Backtests run on the reference model (tools/model), only visiting the
+# blocks which have a price.
+
+def agents(every, hold):
+    return [LP("lp", d(10_000), d(50_000)),
+            Trader("long",  True,  d(100), 5, every, hold),
+            Trader("short", False, d(500), 5, every, hold),
+            Liquidator("keeper")]
+
+def final(rows):
+    last = rows[-1].block
+    return [r for r in rows if r.block == last]
+
+def test_idle_blocks():
+    # the same operations at the same blocks, with and without the prices
+    # in between
+    dense  = Backtest(DEFAULTS, [(b, d(5)) for b in range(1, 2002)], agents(1_000, 1_000))
+    sparse = Backtest(DEFAULTS, [(b, d(5)) for b in [1, 1001, 2001]], agents(1_000, 1_000))
+    dense.run()
+    sparse.run()
+    closed = lambda bt: [r for r in bt.positions if r.status != "open"]
+    assert len(closed(dense)) == 4
+    assert closed(dense)      == closed(sparse)
+    assert final(dense.lps)   == final(sparse.lps)
+    assert dense.revenue[-1]  == sparse.revenue[-1]
+    assert dense.revenue[-1].borrowing > 0
+
+def test_timelines():
+    prices = [(1, d(5)), (100, d(5)), (200, d(6)), (300, d(4)), (400, d(2))]
+    bt     = Backtest(DEFAULTS, prices, agents(100, 150)).run()
+
+    # a row per open position and price, and one when closed
+    rows = [r for r in bt.positions if r.id == 1]
+    assert [r.status for r in rows] == ["open", "open", "closed"]
+    assert [r.block  for r in rows] == [1, 100, 200]
+    # the leveraged longs do not survive the crash (the trader opens
+    # another one right after)
+    crash = [r for r in bt.positions if r.long and r.block == 400 and r.entry_price > d(2)]
+    assert crash and {r.status for r in crash} == {"liquidated"}
+    assert bt.revenue[-1].liquidation > 0
+
+    for r in bt.lps:
+      assert r.pnl == r.value + r.withdrawn - r.deposited
+    assert [r.block for r in bt.revenue] == [b for b, _ in prices]
+
+class BruteForce(Liquidator):
+    def act(self, bt):
+        for pos in bt.open_positions():
+            if bt.model.positions.is_liquidatable(pos.id, bt.ctx):
+                bt.liquidate(self.user, pos.id)
+
+def test_liquidator():
+    # the liquidator only looks at the positions a price crosses, but
+    # must liquidate the same ones as one revaluing every position
+    rng    = random.Random(1)
+    prices = [(1, d(5))]
+    for block in range(12, 24_000, 12):
+      prices.append((block, max(prices[-1][1] * rng.randint(96, 104) // 100, 1)))
+    def run(liquidator):
+      return Backtest(DEFAULTS, prices, agents(60, 1_200)[:-1] + [liquidator], sample=600).run()
+    fast, slow = run(Liquidator("keeper")), run(BruteForce("keeper"))
+    assert sum(r.status == "liquidated" for r in fast.positions) > 10
+    assert fast.positions   == slow.positions
+    assert fast.revenue[-1] == slow.revenue[-1]
+
+def test_main(tmp_path):
+    prices = tmp_path / "prices.csv"
+    prices.write_text("block,price\n1,5\n1000,5.5\n20000,4.75\n")
+    script = tmp_path / "agents.py"
+    script.write_text("from tools.backtest import LP\n"
+                      "def agents(bt): return [LP('lp', 10**9, 5 * 10**9)]\n")
+    assert load_prices(str(prices)) == [(1, d(5)), (1000, 5_500_000), (20000, 4_750_000)]
+
+    main([str(prices), "--out", str(tmp_path / "out"), "--script", str(script)])
+    lps = (tmp_path / "out" / "lps.csv").read_text().splitlines()
+    assert lps[0] == "block,price,user,lp_tokens,value,deposited,withdrawn,pnl"
+    assert len(lps) == 1 + 3
+
+    main([str(prices), "--out", str(tmp_path / "out")])
+    positions = (tmp_path / "out" / "positions.csv").read_text().splitlines()
+    assert len(positions) > 1
+
+    with pytest.raises(ValueError):
+      Backtest(DEFAULTS, [(2, d(5)), (1, d(5))], [])
+
+# eof
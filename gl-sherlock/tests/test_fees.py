@@ -33,8 +33,7 @@ def setup_pool(core, mint, owner, lp_provider, long, short, VEL, STX, LP, mint_t
 
 # test
 
-def test_init(fees, math, params, pools, positions, core):
-    assert fees.MATH()       == math
+def test_init(fees, params, pools, positions, core):
     assert fees.PARAMS()     == params
     assert fees.POOLS()      == pools
     assert fees.POSITIONS()  == positions
@@ -61,15 +60,6 @@ def test_lookup(fees):
 
 def test_fees_at_block(fees, owner):
     assert fees.fees_at_block(2, 1, sender=owner) == {
-      'id'                   : 0,
-      't0'                   : 0,
-      't1'                   : 0,
-      'borrowing_long'       : 0,
-      'borrowing_short'      : 0,
-      'funding_long'         : 0,
-      'funding_short'        : 0,
-      'long_collateral'      : 0,
-      'short_collateral'     : 0,
       'borrowing_long_sum'   : 0,
       'borrowing_short_sum'  : 0,
       'funding_long_sum'     : 0,
@@ -78,6 +68,10 @@ def test_fees_at_block(fees, owner):
       'received_short_sum'   : 0,
     }
 
+def test_checkpoint(fees, owner):
+    with reverts(ERR_PERMISSIONS):
+        fees.checkpoint(1, sender=owner)
+
 # NOTE: does not capture 2nd revert with hardhat
 def test_update(fees, api, positions, pools, params, core, owner):
     with reverts(ERR_PERMISSIONS):
@@ -0,0 +1,91 @@
+import pytest
+from ape import chain
+from conftest import d, same
+from tools.indexer import Indexer, Store, ApeSource
+
+# The indexer replays core's logs from the dev chain into SQLite and must
+# agree with pools.lookup, positions.lookup and lookup_user_positions.
+
+# helpers
+
+@pytest.fixture
+def setup(core, api, oracle, pools, positions, fees,
+          mint,
+          owner, lp_provider, long, short, VEL, STX, LP, mint_token):
+    def setup():
+      core.fresh("VEL-STX", VEL, STX, LP, sender=owner)
+      for user in [lp_provider, long, short]:
+        mint_token(VEL, d(100_000), user)
+        mint_token(STX, d(100_000), user)
+        VEL.approve(core.address, d(100_000), sender=user)
+        STX.approve(core.address, d(100_000), sender=user)
+      mint(VEL, STX, LP, d(10_000), d(50_000), price=d(5), sender=lp_provider)
+    return setup
+
+@pytest.fixture
+def check(pools, positions, long, short):
+    def check(store):
+      assert store.last_block == chain.blocks.head.number
+      same(store.pool(1), pools.lookup(1))
+      for id in range(1, positions.get_nr_positions() + 1):
+        same(store.position(id), positions.lookup(id))
+      for user in [long, short]:
+        mine   = store.user_positions(user.address)
+        theirs = positions.lookup_user_positions(user, 0, 100)
+        # the contract's order changes when positions are closed
+        assert sorted(p.id for p in mine) == sorted(p.id for p in theirs)
+        for p in mine:
+          same(p, positions.lookup(p.id))
+    return check
+
+# test
+
+def test_sync(setup, check, core, open, close, burn, lp_provider, long, short, VEL, STX, LP,
+              tmp_path):
+    setup()
+    path    = str(tmp_path / "index.db")
+    indexer = Indexer(Store(path), ApeSource(core), snapshot_every=5)
+    open(VEL, STX, True,  d(100), 2, price=d(5), sender=long)
+    open(VEL, STX, False, d(100), 3, price=d(5), sender=short)
+    indexer.sync()
+    check(indexer.store)
+
+    # incrementally
+    close(VEL, STX, 1, price=d(6), sender=long)
+    open(VEL, STX, True, d(50), 5, price=d(6), sender=long)
+    burn(VEL, STX, LP, d(1_000), price=d(6), sender=lp_provider)
+    indexer.sync()
+    check(indexer.store)
+    lp = indexer.store.lp(1, lp_provider.address)
+    assert (lp.minted, lp.burned) == (LP.balanceOf(lp_provider) + d(1_000), d(1_000))
+    assert [l.event_name for l in indexer.store.logs()] == \
+           ["Create", "Mint", "Open", "Open", "Close", "Open", "Burn"]
+
+    # restarting picks up where the last run stopped
+    close(VEL, STX, 2, price=d(6), sender=short)
+    restarted = Indexer(Store(path), ApeSource(core), snapshot_every=5)
+    assert restarted.decoder.pools == indexer.decoder.pools
+    restarted.sync()
+    check(restarted.store)
+    assert len(restarted.store.logs()) == 8
+
+def test_reorg(setup, check, core, open, long, short, VEL, STX, tmp_path):
+    setup()
+    indexer = Indexer(Store(str(tmp_path / "index.db")), ApeSource(core), snapshot_every=1)
+    open(VEL, STX, False, d(100), 3, price=d(5), sender=short)
+    indexer.sync()
+    snapshot = chain.snapshot()
+    open(VEL, STX, True, d(100), 2, price=d(5), sender=long)
+    open(VEL, STX, True, d(100), 2, price=d(5), sender=long)
+    indexer.sync()
+    assert len(indexer.store.user_positions(long.address)) == 2
+
+    # a different history from the snapshot on
+    chain.restore(snapshot)
+    open(VEL, STX, False, d(200), 4, price=d(5), sender=short)
+    indexer.sync()
+    check(indexer.store)
+    assert indexer.store.user_positions(long.address) == []
+    assert [l.event_name for l in indexer.store.logs()] == ["Create", "Mint", "Open", "Open"]
+
+# eof
@@ -0,0 +1,87 @@
+import random
+from hypothesis import given, settings, strategies as st
+from conftest import d
+from tools.model import Core, Revert
+from tools.model.params import DEFAULTS
+from tools.liquidations import LiquidationIndex, NEVER, COMPACT
+
+# The index must return exactly the positions the reference model
+# (tools/model) considers liquidatable, without revaluing all of them.
+
+PARAMS = dict(DEFAULTS, MIN_FEE=10, MAX_FEE=1_000)
+
+def setup():
+    model = Core(PARAMS)
+    model.fresh("VEL-STX", "VEL", "STX", "LP")
+    model.mint("lp", 1, d(10_000), d(50_000), d(5))
+    return model
+
+def brute_force(model, ids, price):
+    return sorted(id for id in ids
+                  if model.positions.is_liquidatable(id, model.ctx(1, price)))
+
+@settings(max_examples=200, deadline=None)
+@given(long       = st.booleans(),
+       collateral = st.integers(min_value=1_000, max_value=d(500)),
+       leverage   = st.integers(min_value=1, max_value=10),
+       blocks     = st.integers(min_value=1, max_value=50_000))
+def test_boundary(long, collateral, leverage, blocks):
+    model = setup()
+    id    = model.open("user", 1, long, collateral, leverage, d(5)).id
+    model.mine(blocks)
+    index = LiquidationIndex(model, 1)
+    p     = index.boundary(id)
+    def liq(price):
+      # near zero, closing an unleveraged long reverts (payout > interest)
+      try:
+        return model.positions.is_liquidatable(id, model.ctx(1, price))
+      except Revert:
+        return None
+    # liquidatable from the boundary on, not before
+    if long:
+      if 0 < p < NEVER: assert liq(p) in [True, None]
+      if p < NEVER    : assert liq(p + 1) in [False, None]
+    else:
+      if p < NEVER: assert liq(p) in [True, None]
+      if p > 1    : assert liq(p - 1) in [False, None]
+
+def test_crossed():
+    rng   = random.Random(1)
+    model = setup()
+    index = LiquidationIndex(model, 1, horizon=500)
+    ids   = []
+    price = d(5)
+    for _ in range(200):
+      model.mine(rng.randint(1, 300))
+      price = max(price * rng.randint(90, 110) // 100, 1)
+      if rng.random() < 0.5:
+        long = rng.random() < 0.5
+        pos  = model.open("user", 1, long, rng.randint(d(1), d(50)), rng.randint(1, 10), price)
+        index.add(pos.id)
+        ids.append(pos.id)
+      res = index.crossed(price)
+      assert res == brute_force(model, ids, price)
+      # liquidate some of them
+      for id in res[::2]:
+        model.liquidate("keeper", 1, id, price)
+        index.remove(id)
+        ids.remove(id)
+    assert len(index) == len(ids)
+    assert any(model.positions.lookup(id).long for id in ids)
+
+def test_compact():
+    # re-indexing leaves superseded entries behind, which must not pile up
+    model = setup()
+    index = LiquidationIndex(model, 1, horizon=10)
+    for i in range(50):
+      index.add(model.open("user", 1, i % 2 == 0, d(10), 2, d(5)).id)
+    for i in range(200):
+      model.mine(10)
+      assert index.crossed(d(5)) == []
+      n = len(index.longs) + len(index.shorts)
+      assert n <= COMPACT * len(index) + 1
+      assert len(index.expiries) <= n
+      if i % 20 == 0: index.remove(1 + i // 20)
+    assert len(index) == 40
+
+# eof
@@ -142,26 +142,11 @@ def test_apply(math):
     assert math.apply(   100_000_000,         10_000)     == { 'x':    100_000_000, 'fee':          1000, 'remaining':    99_999_000 }
     assert math.apply( 2_000_000_000,         10_000).fee == 20_000
 
-def plus(x):  return { 'op': 1, 'arg': x }
-def minus(x): return { 'op': 2, 'arg': x }
-def mul(x):   return { 'op': 4, 'arg': x }
-def div(x):   return { 'op': 8, 'arg': x }
-
-def test_ops(math):
-    assert math.MINUS(20) == { 'op': 2, 'arg': 20 }
-    assert math.PLUS(20)  == { 'op': 1, 'arg': 20 }
-
-def test_eval(math):
-    assert math.eval(0,   [plus(10)])  == 10
-    assert math.eval(100, [minus(50)]) == 50
-    assert math.eval(10,  [mul(2)])    == 20
-    assert math.eval(10,  [div(2)])    == 5
-
-    assert math.eval(0, [plus(10), mul(10)])                   == 100
-    assert math.eval(0, [mul(10), plus(10)])                   == 10
-    assert math.eval(0, [plus(10), plus(10), plus(2)])         == 22
-    assert math.eval(0, [plus(10), mul(10), div(2), minus(2)]) == 48
-
-    with ape.reverts("unknown_op"):
-        math.eval(0, [{ 'op': 3, 'arg': 10}])
-
+def test_add_delta(math):
+    assert math.add_delta(0,   10)  == 10
+    assert math.add_delta(100, -50) == 50
+    assert math.add_delta(100, 0)   == 100
+    assert math.add_delta(50,  -50) == 0
+
+    with ape.reverts():
+        math.add_delta(10, -11)
@@ -0,0 +1,125 @@
+import os
+import pytest
+from ape import chain
+from ape.exceptions import VirtualMachineError
+from hypothesis import given, settings, strategies as st, HealthCheck
+from conftest import d, payload, same, PARAMS
+from tools.model import Core, Revert
+
+# Differential tests: random operation sequences are run through the api
+# and through the reference model (tools/model), which must agree on
+# which operations revert and on the resulting state. Set MODEL_EXAMPLES
+# for a longer run (e.g. MODEL_EXAMPLES=1000 ape test tests/test_model.py).
+
+EXAMPLES = int(os.environ.get("MODEL_EXAMPLES", 50))
+
+# helpers
+
+@pytest.fixture
+def setup(core, api, oracle, pools, fees, positions, owner, lp_provider, long, short,
+          VEL, STX, LP, mint_token):
+    users = [lp_provider, long, short]
+    def setup():
+      for user in users:
+        mint_token(VEL, d(100_000), user)
+        mint_token(STX, d(100_000), user)
+        VEL.approve(core.address, d(100_000), sender=user)
+        STX.approve(core.address, d(100_000), sender=user)
+      model = Core(PARAMS, block=chain.blocks.head.number + 1)
+      core.fresh("VEL-STX", VEL, STX, LP, sender=owner)
+      model.fresh("VEL-STX", VEL.address, STX.address, LP.address)
+      return model
+    return setup
+
+@pytest.fixture
+def step(core, api, pools, fees, positions, lp_provider, long, short, VEL, STX, LP):
+    users = [lp_provider, long, short]
+    def step(model, op):
+      """
+      Runs op on both and checks that they agree.
+      """
+      name, user, args, price = op[0], users[op[1]], op[2:-1], op[-1]
+      if name == "mine":
+        chain.mine(op[2])
+        return
+      if name == "burn":
+        # a percentage of the user's LP tokens
+        args = (LP.balanceOf(user) * args[0] // 100,)
+
+      model.chain.block = chain.blocks.head.number + 1
+      try:
+        res = getattr(model, name)(user.address, 1, *args, price)
+      except Revert:
+        res = None
+      try:
+        if name in ["mint", "burn"]:
+          tx = getattr(api, name)(VEL, STX, LP, *args, price, 0, payload(price), sender=user)
+        else:
+          tx = getattr(api, name)(VEL, STX, *args, price, 0, payload(price), sender=user)
+      except VirtualMachineError as e:
+        tx, err = None, e
+      assert (tx is None) == (res is None), (op, res, tx or err)
+
+      same(model.pools.lookup(1), pools.lookup(1))
+      same(model.fees.lookup(1),  fees.lookup(1))
+      assert model.LP.get((LP.address, user.address), 0) == LP.balanceOf(user)
+      assert model.BALANCES.get(VEL.address, 0)           == VEL.balanceOf(core)
+      assert model.BALANCES.get(STX.address, 0)           == STX.balanceOf(core)
+      assert model.OWED.get(VEL.address, 0)               == core.OWED(VEL)
+      if tx is not None and name == "open":
+        same(res, positions.lookup(res.id))
+      if tx is not None and name in ["close", "liquidate"]:
+        log = getattr(core, name.capitalize()).from_receipt(tx)[0]
+        same(res.position, positions.lookup(res.position.id))
+        same(res.fees,     log.fees)
+        same(res.pnl,      log.pnl)
+        same(res.deltas,   log.deltas)
+    return step
+
+# Prices around 5 (and far enough from it for positions to be
+# liquidatable), amounts well within the users' balances.
+prices = st.integers(d(3), d(8))
+users  = st.integers(0, 2)
+ops    = st.one_of(
+  st.tuples(st.just("mint"), users, st.integers(0, d(1_000)), st.integers(0, d(5_000)), prices),
+  st.tuples(st.just("burn"), users, st.integers(0, 100), prices),
+  st.tuples(st.just("open"), users, st.booleans(), st.integers(0, d(100)), st.integers(0, 11), prices),
+  st.tuples(st.just("close"), users, st.integers(1, 8), prices),
+  st.tuples(st.just("liquidate"), users, st.integers(1, 8), prices),
+  st.tuples(st.just("mine"), users, st.integers(1, 1_000)),
+)
+
+# test
+
+def test_scenario(setup, step):
+    model = setup()
+    for op in [
+        ("mint",      0, d(10_000), d(50_000), d(5)),
+        ("open",      1, True,  d(100), 2,  d(5)),
+        ("open",      2, False, d(100), 10, d(5)),
+        ("open",      1, True,  d(100), 11, d(5)),  # over-leveraged
+        ("close",     1, 1, d(5)),                  # same block as open
+        ("mine",      0, 100),
+        ("close",     2, 1, d(6)),                  # not the owner
+        ("liquidate", 0, 2, d(5)),                  # not liquidatable
+        ("liquidate", 0, 2, d(6)),
+        ("mine",      0, 1_000),
+        ("close",     1, 1, d(6)),
+        ("burn",      0, 50, d(6)),
+    ]:
+      step(model, op)
+
+@settings(max_examples=EXAMPLES, deadline=None, database=None,
+          suppress_health_check=[HealthCheck.function_scoped_fixture])
+@given(sequence=st.lists(ops, min_size=1, max_size=30))
+def test_random(setup, step, sequence):
+    snapshot = chain.snapshot()
+    try:
+      model = setup()
+      step(model, ("mint", 0, d(10_000), d(50_000), d(5)))
+      for op in sequence:
+        step(model, op)
+    finally:
+      chain.restore(snapshot)
+
+# eof
@@ -1,7 +1,8 @@
 from ape import accounts
 import pytest
 from ape.logging import logger
-from conftest import tokens
+from conftest import tokens, PARAMS
+import ape
 
 # Params.vy
 
@@ -129,6 +130,26 @@ def test_dynamic_fees_biased(params):
         'funding_short'   : 0,
     }
 
+def test_set_params(params, owner, long):
+    p = {
+        **POOL,
+        'base_interest'   : 100000000000,
+        'base_reserves'   : 1000000000000,
+        'quote_interest'  : 50000000,
+        'quote_reserves'  : 1000000000000,
+    }
+    with ape.reverts("PERMISSIONS"):
+        params.set_params({**PARAMS, 'MIN_FEE': 2}, sender=long)
+    params.set_params({**PARAMS, 'MIN_FEE': 2, 'MAX_FEE': 10}, sender=owner)
+    assert params.PARAMS().MIN_FEE == 2
+    assert params.PARAMS().MAX_FEE == 10
+    assert params.dynamic_fees(p) == {
+        'borrowing_long'  : 2,
+        'borrowing_short' : 2,
+        'funding_long'    : 2,
+        'funding_short'   : 0,
+    }
+
 # uses position long, interest, leverage
 def test_is_legal_position(params):
     assert params.is_legal_position(
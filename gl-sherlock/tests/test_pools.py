@@ -36,6 +36,25 @@ def test_exists_before_creation(pools, accounts):
         pools.lookup(1)
         pools.lookup_lp(accounts[1])
 
+def test_resolve_pair(setup, project, core, pools, owner, VEL, STX, USD, LP2):
+    with reverts("PRECONDITIONS"):
+        pools.resolve_pair(VEL, STX)
+    setup()
+    assert pools.resolve_pair(VEL, STX) == {
+        'id': 1, 'base_decimals': 6, 'quote_decimals': 6,
+        'feed_id': b'\x00' * 32, 'feed_decimals': 0}
+    BTC = owner.deploy(project.ERC20, "btc", "btc", 8, 1)
+    FEED = b'BTC'.ljust(32, b'\x00')
+    core.fresh("BTC-USD", BTC, USD, LP2, FEED, 8, sender=owner)
+    assert pools.resolve_pair(BTC, USD) == {
+        'id': 2, 'base_decimals': 8, 'quote_decimals': 6,
+        'feed_id': FEED, 'feed_decimals': 8}
+    # pairs are ordered
+    with reverts("PRECONDITIONS"):
+        pools.resolve_pair(STX, VEL)
+    with reverts("PRECONDITIONS"):
+        pools.resolve_pair(VEL, USD)
+
 def test_f(pools):
     assert pools.f(0, 0, 0) == 0, "f(0,0,0)"
     assert pools.f(1, 1, 1) == 1, "f(1,1,1)"
@@ -46,19 +46,54 @@ def setup(core, api, oracle, pools, positions, fees,
 def test_lookups_initial(positions, long, owner):
     assert positions.get_nr_positions(sender=owner) == 0
     assert positions.exists(1, sender=owner)        == False
-    assert positions.lookup_user_positions(long, sender=owner) == []
+    assert positions.lookup_user_positions(long, 0, 10, sender=owner) == []
+    assert positions.nr_open_positions(1, sender=owner)  == 0
+    assert positions.open_positions(1, 0, 10, sender=owner) == []
     with reverts("PRECONDITIONS"):
         positions.lookup(1, sender=owner)
 
-def test_lookups(setup, positions, params, pools, open, long, VEL, STX):
+def test_lookups(setup, positions, params, pools, open, close, long, short, VEL, STX):
     assert positions.get_nr_positions() == 0
     assert positions.exists(1) == False
-    assert len(positions.lookup_user_positions(long)) == 0
+    assert len(positions.lookup_user_positions(long, 0, 10)) == 0
     setup()
     open(VEL, STX, True, d(2), 2, price=d(5), sender=long)
 
     assert positions.get_nr_positions() == 1
-    assert len(positions.lookup_user_positions(long)) == 1
+    assert len(positions.lookup_user_positions(long, 0, 10)) == 1
+
+    open(VEL, STX, True, d(2), 2, price=d(5), sender=long)
+    open(VEL, STX, True, d(2), 2, price=d(5), sender=long)
+    assert positions.get_nr_user_positions(long) == 3
+    ids = lambda ps: [p.id for p in ps]
+    assert ids(positions.lookup_user_positions(long, 0, 2))  == [1, 2]
+    assert ids(positions.lookup_user_positions(long, 2, 2))  == [3]
+    assert ids(positions.lookup_user_positions(long, 3, 2))  == []
+    assert ids(positions.lookup_user_positions(long, 2**256 - 1, 2)) == []
+
+    # the pool's set holds everyone's open positions
+    open(VEL, STX, False, d(2), 2, price=d(5), sender=short)
+    assert positions.nr_open_positions(1) == 4
+    assert ids(positions.open_positions(1, 0, 10)) == [1, 2, 3, 4]
+    assert ids(positions.open_positions(1, 1, 2))  == [2, 3]
+    assert ids(positions.open_positions(2, 0, 10)) == []
+    assert ids(positions.open_positions(1, 2**256 - 1, 2)) == []
+
+    # closed positions are removed (the last one takes their place)
+    close(VEL, STX, 1, price=d(5), sender=long)
+    assert positions.get_nr_user_positions(long) == 2
+    assert ids(positions.lookup_user_positions(long, 0, 10)) == [3, 2]
+    assert ids(positions.open_positions(1, 0, 10))           == [4, 2, 3]
+    close(VEL, STX, 2, price=d(5), sender=long)
+    assert ids(positions.lookup_user_positions(long, 0, 10)) == [3]
+    assert ids(positions.open_positions(1, 0, 10))           == [4, 3]
+    close(VEL, STX, 3, price=d(5), sender=long)
+    assert positions.get_nr_user_positions(long) == 0
+    assert ids(positions.open_positions(1, 0, 10)) == [4]
+    # the moved positions' indices are still correct
+    close(VEL, STX, 4, price=d(5), sender=short)
+    assert positions.nr_open_positions(1) == 0
+    assert positions.get_nr_positions()   == 4
 
 def test_calc_pnl(setup, positions, params, pools, open, VEL, STX, long):
     setup()
@@ -136,3 +171,34 @@ def test_value(setup, positions, open, VEL, STX, owner, long):
         'borrowing_paid_want'  : 0,
         'remaining'            : 1998000
     }
+
+def test_value_many(setup, positions, open, close, VEL, STX, owner, long, short):
+    setup()
+    open(VEL, STX, True , d(2), 10, price=d(5), sender=long)    # 1
+    open(VEL, STX, False, d(2), 2 , price=d(5), sender=short)   # 2
+    open(VEL, STX, True , d(2), 2 , price=d(5), sender=long)    # 3
+    close(VEL, STX, 3, price=d(5), sender=long)
+
+    ids = [1, 2, 3, 99]
+    for price in [d(5), 3]:
+        vs = positions.value_many(ids, ctx(price), sender=owner)
+        assert [v.id for v in vs] == [1, 2, 3, 0]
+
+        # open positions agree with the single views
+        for i in [1, 2]:
+            value = positions.value(i, ctx(price))
+            assert vs[i-1].remaining    == value.fees.remaining
+            assert vs[i-1].pnl          == value.pnl
+            assert vs[i-1].liquidatable == positions.is_liquidatable(i, ctx(price))
+            assert vs[i-1].status       == positions.status(i, ctx(price))
+
+        # closed positions are not valued, missing ones are empty (status
+        # 0 is none of the enum's flags, so they can't pass for closed)
+        assert vs[2].status == Status.CLOSED.value
+        assert vs[3].status == 0
+        assert not vs[2].liquidatable and not vs[3].liquidatable
+
+        assert positions.status_many(ids, ctx(price)) == [v.status for v in vs]
+        assert positions.is_liquidatable_many(ids, ctx(price)) == [v.liquidatable for v in vs]
+
+    assert positions.is_liquidatable_many(ids, ctx(3)) == [True, False, False, False]
@@ -0,0 +1,121 @@
+import pytest
+from hypothesis import given, settings, strategies as st
+from conftest import d
+
+np = pytest.importorskip("numpy") # c.f. tools/risk.py
+from tools import risk
+from tools.model import Core, Revert, PoolState
+from tools.model.params import Params
+
+# The vectorized formulas in tools/risk must agree with the reference
+# model (tools/model), which is checked against the contracts.
+
+PARAMS = {**risk.DEFAULTS, 'MIN_FEE': 10, 'MAX_FEE': 1_000, 'LIQUIDATION_THRESHOLD': 5}
+P      = risk.Parameters(**PARAMS)
+ONE    = 10**6
+POOL   = risk.Pool(10_000 * ONE, 50_000 * ONE, 6, 6)
+
+# helpers
+
+def arr(*xs): return [np.array([x], float) for x in xs]
+
+def at(v, k):
+    """
+    The values of position k (on the first path) in v.
+    """
+    return type(v)(*[np.broadcast_to(x, v.remaining.shape)[0, k] for x in v])
+
+# test
+
+@settings(max_examples=200, deadline=None, database=None)
+@given(reserves=st.tuples(st.integers(0, d(100_000)), st.integers(0, d(100_000))),
+       interest=st.tuples(st.integers(0, d(100_000)), st.integers(0, d(100_000))))
+def test_dynamic_fees(reserves, interest):
+    pool = PoolState(1, "", "", "", "", reserves[0], reserves[1], interest[0], interest[1], 0, 0)
+    try:
+      want = Params(PARAMS).dynamic_fees(pool)
+    except Revert:
+      return
+    got  = risk.dynamic_fees(P, *arr(reserves[0], reserves[1], interest[0], interest[1]))
+    assert [int(x[0]) for x in got] == list(want)
+
+positions = st.lists(st.tuples(st.booleans(), st.integers(0, d(100)), st.integers(0, 12)),
+                     min_size=1, max_size=10)
+
+@settings(max_examples=50, deadline=None, database=None)
+@given(portfolio=positions, price=st.integers(d(2), d(10)), blocks=st.integers(1, 10_000))
+def test_value(portfolio, price, blocks):
+    # small enough for the positions to move utilization (and hence fees)
+    pool  = risk.Pool(d(1_000), d(5_000), 6, 6)
+    model = Core(PARAMS)
+    model.fresh("VEL-STX", "VEL", "STX", "LP")
+    model.mint("lp", 1, pool.base_reserves, pool.quote_reserves, d(5))
+    opened = []
+    for long, collateral, leverage in portfolio:
+      try:
+        opened.append(model.open("user", 1, long, collateral, leverage, d(5)).id)
+      except Revert:
+        opened.append(None)
+    model.mine(blocks)
+
+    long, collateral, leverage = [np.array(x) for x in zip(*portfolio)]
+    ok, collateral, leverage, interest = risk.open_positions(
+      P, pool, risk.Portfolio(long, collateral, leverage), d(5))
+    assert list(ok) == [id is not None for id in opened]
+
+    # pool state after the opens, rolled forward
+    pool = model.pools.lookup(1)
+    fees = risk.dynamic_fees(P, *arr(pool.base_reserves, pool.quote_reserves,
+                                     pool.base_interest, pool.quote_interest))
+    sums = risk.roll(np.zeros((6, 1)), fees, *arr(pool.base_collateral, pool.quote_collateral),
+                     blocks)
+    assert list(sums[:4, 0]) == list(model.fees.current_sums(1)[:4])
+
+    v = risk.value(long, collateral, leverage, interest, d(5), price, ONE, sums[:, :, None])
+    for k, id in enumerate(opened):
+      if id is None: continue
+      try:
+        want = model.positions.value(id, model.ctx(1, price))
+      except Revert:
+        # rounding can push tiny payouts over the interest (c.f. calc_pnl_long)
+        continue
+      got = at(v, k)
+      assert (got.funding_paid, got.borrowing_paid, got.remaining) == \
+             (want.fees.funding_paid, want.fees.borrowing_paid, want.fees.remaining)
+      # received sums are computed with 10**27 in float
+      assert abs(got.funding_received_want - want.fees.funding_received_want) <= 1
+      assert (got.loss, got.profit, got.pnl_remaining, got.payout) == tuple(want.pnl)
+
+def test_simulate():
+    rng       = np.random.default_rng(0)
+    portfolio = risk.random_portfolio(50, d(100), 10, rng)
+
+    # flat prices: positions pay fees and nobody gets liquidated
+    flat   = risk.simulate(P, POOL, portfolio, np.full((3, 11), float(d(5))), 100)
+    assert list(flat.liquidated) == [0, 0, 0]
+    assert list(flat.negative)   == [0, 0, 0]
+    assert list(flat.drawdown)   == [0, 0, 0]
+
+    # every path sees a crash of the base token: leveraged longs are wiped out
+    crash  = np.tile(np.concatenate([np.linspace(d(5), d(1), 6), np.full(5, d(1))]), (3, 1))
+    report = risk.simulate(P, POOL, portfolio, crash, 100)
+    assert all(report.liquidated >= (portfolio.long & (portfolio.leverage > 1)).sum())
+    assert all(report.drawdown > 0)
+
+def test_sweep():
+    rng       = np.random.default_rng(0)
+    portfolio = risk.random_portfolio(20, d(100), 10, rng)
+    grid      = {'LIQUIDATION_THRESHOLD': [1, 10]}
+    args      = (PARAMS, POOL, portfolio, d(5), 0.5, 30, 10, 100)
+    a         = dict((p['LIQUIDATION_THRESHOLD'], r) for p, r in
+                     risk.sweep(grid, *args, chunk=10, workers=2))
+    b         = dict((p['LIQUIDATION_THRESHOLD'], r) for p, r in
+                     risk.sweep(grid, *args, chunk=10, workers=1))
+    # the paths only depend on the seed (and chunk size)
+    for t in [1, 10]:
+      assert len(a[t].drawdown) == 30
+      for x, y in zip(a[t], b[t]): assert list(x) == list(y)
+    # liquidating earlier leaves less bad debt
+    assert a[10].bad_debt.sum() < a[1].bad_debt.sum()
+
+# eof
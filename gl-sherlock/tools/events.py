@@ -0,0 +1,173 @@
+"""
+Rebuilds the verbose view of core's events from the lean logs core emits.
+
+Core only logs what changed (c.f. types.vy), so the pool state before each
+operation and the full position state are reconstructed here by replaying
+every log in order, starting from the pool's Create event. The result has
+the same shape as the events used to have (pool state, position state and
+position value as structs), as namedtuples so that fields can be accessed
+by name or by index.
+
+Logs are expected to look like ape's ContractLog (event_name, block_number,
+log_index and event_arguments).
+"""
+from collections import namedtuple
+
+########################################################################
+# mirrors contracts/types.vy
+
+Ctx           = namedtuple("Ctx", "price base_decimals quote_decimals")
+Tokens        = namedtuple("Tokens", "base quote")
+PoolState     = namedtuple("PoolState", [
+    "id", "symbol", "base_token", "quote_token", "lp_token",
+    "base_reserves", "quote_reserves",
+    "base_interest", "quote_interest",
+    "base_collateral", "quote_collateral",
+])
+PositionState = namedtuple("PositionState", [
+    "id", "pool", "user", "status", "long",
+    "collateral", "leverage", "interest",
+    "entry_price", "exit_price", "opened_at", "closed_at",
+    "collateral_tagged", "interest_tagged",
+])
+FeesPaid      = namedtuple("FeesPaid", [
+    "funding_paid", "funding_paid_want",
+    "funding_received", "funding_received_want",
+    "borrowing_paid", "borrowing_paid_want",
+    "remaining",
+])
+PnL           = namedtuple("PnL", "loss profit remaining payout")
+Deltas        = namedtuple("Deltas", [
+    "base_interest", "quote_interest",
+    "base_transfer", "base_reserves", "base_collateral",
+    "quote_transfer", "quote_reserves", "quote_collateral",
+])
+PositionValue = namedtuple("PositionValue", "position fees pnl deltas")
+
+# Status enum values (vyper enums are bit flags)
+OPEN   = 1
+CLOSED = 2
+
+# verbose events
+Create    = namedtuple("Create", "user pool state")
+Mint      = namedtuple("Mint", "user ctx pool total_supply lp_amt base_amt quote_amt")
+Burn      = namedtuple("Burn", "user ctx pool total_supply lp_amt base_amt quote_amt")
+Open      = namedtuple("Open", "user ctx pool position")
+Close     = namedtuple("Close", "user ctx pool value")
+Liquidate = namedtuple("Liquidate", "user ctx pool value")
+
+EVENTS = ["Create", "Mint", "Burn", "Open", "Close", "Liquidate"]
+
+def struct(cls, x):
+    return cls(*[x[i] for i in range(len(cls._fields))])
+
+########################################################################
+class Decoder:
+    """
+    Replays core's logs, keeping track of pools and positions.
+    Logs must be passed in chain order, starting with the pool's Create.
+    """
+
+    def __init__(self):
+        self.pools     = {}
+        self.positions = {}
+
+    def decode_all(self, logs):
+        return [self.decode(log) for log in sort(logs)]
+
+    def decode(self, log):
+        args = log.event_arguments
+        return getattr(self, "_" + log.event_name)(log, args)
+
+    def pool(self, args):
+        # ape's decoded integers are not hashable
+        return self.pools[int(args["pool"])]
+
+    def _Create(self, log, args):
+        pool = PoolState(int(args["pool"]), args["symbol"],
+                         args["base_token"], args["quote_token"], args["lp_token"],
+                         0, 0, 0, 0, 0, 0)
+        self.pools[pool.id] = pool
+        return Create(args["user"], pool.id, pool)
+
+    def _Mint(self, log, args):
+        pool = self.pool(args)
+        self.pools[pool.id] = pool._replace(
+            base_reserves  = pool.base_reserves  + args["base_amt"],
+            quote_reserves = pool.quote_reserves + args["quote_amt"])
+        return Mint(args["user"], struct(Ctx, args["ctx"]), pool,
+                    args["total_supply"], args["lp_amt"],
+                    args["base_amt"], args["quote_amt"])
+
+    def _Burn(self, log, args):
+        pool = self.pool(args)
+        self.pools[pool.id] = pool._replace(
+            base_reserves  = pool.base_reserves  - args["base_amt"],
+            quote_reserves = pool.quote_reserves - args["quote_amt"])
+        return Burn(args["user"], struct(Ctx, args["ctx"]), pool,
+                    args["total_supply"], args["lp_amt"],
+                    args["base_amt"], args["quote_amt"])
+
+    def _Open(self, log, args):
+        pool     = self.pool(args)
+        ctx      = struct(Ctx, args["ctx"])
+        long     = args["long"]
+        position = PositionState(
+            id                = int(args["position_id"]),
+            pool              = pool.id,
+            user              = args["user"],
+            status            = OPEN,
+            long              = long,
+            collateral        = args["collateral"],
+            leverage          = args["leverage"],
+            interest          = args["interest"],
+            entry_price       = ctx.price,
+            exit_price        = 0,
+            opened_at         = log.block_number,
+            closed_at         = 0,
+            # longs put up quote collateral and lock base reserves
+            collateral_tagged = Tokens(0, args["collateral"]) if long else (
+                                Tokens(args["collateral"], 0) ),
+            interest_tagged   = Tokens(args["interest"], 0) if long else (
+                                Tokens(0, args["interest"]) ),
+        )
+        self.positions[position.id] = position
+        self.pools[pool.id] = pool._replace(
+            base_interest    = pool.base_interest    + position.interest_tagged.base,
+            quote_interest   = pool.quote_interest   + position.interest_tagged.quote,
+            base_collateral  = pool.base_collateral  + position.collateral_tagged.base,
+            quote_collateral = pool.quote_collateral + position.collateral_tagged.quote)
+        return Open(args["user"], ctx, pool, position)
+
+    def _close(self, log, args):
+        pool     = self.pool(args)
+        ctx      = struct(Ctx, args["ctx"])
+        deltas   = struct(Deltas, args["deltas"])
+        position = self.positions[int(args["position_id"])]._replace(
+            status     = CLOSED,
+            exit_price = ctx.price,
+            closed_at  = log.block_number)
+        self.positions[position.id] = position
+        self.pools[pool.id] = pool._replace(
+            base_reserves    = pool.base_reserves    + deltas.base_reserves,
+            quote_reserves   = pool.quote_reserves   + deltas.quote_reserves,
+            base_interest    = pool.base_interest    + deltas.base_interest,
+            quote_interest   = pool.quote_interest   + deltas.quote_interest,
+            base_collateral  = pool.base_collateral  + deltas.base_collateral,
+            quote_collateral = pool.quote_collateral + deltas.quote_collateral)
+        value = PositionValue(position,
+                              struct(FeesPaid, args["fees"]),
+                              struct(PnL, args["pnl"]),
+                              deltas)
+        return args["user"], ctx, pool, value
+
+    def _Close(self, log, args):
+        return Close(*self._close(log, args))
+
+    def _Liquidate(self, log, args):
+        return Liquidate(*self._close(log, args))
+
+def sort(logs):
+    return sorted(logs, key=lambda log: (log.block_number, log.log_index))
+
+# eof
@@ -0,0 +1,397 @@
+"""
+Indexes core's events into a local SQLite database, so that dashboards
+and bots can read pools, positions and per-user state from it instead of
+calling pools.lookup, positions.lookup and lookup_user_positions over
+RPC (c.f. Store).
+
+Logs are fetched in batches from the last processed block on and
+replayed with tools/events.py's Decoder. Each batch (its logs, the state
+they touched and the last processed block) is written in one SQLite
+transaction, so a restart resumes where the last run stopped.
+
+Reorgs: the hashes of the blocks with logs and of the last processed
+block are kept. When one no longer matches the chain, the indexer rolls
+back to the newest block which still matches: it drops the logs after
+it, restores the newest snapshot of the state at or before it (one is
+taken every `snapshot_every` blocks) and replays the stored logs in
+between (from genesis if there is no such snapshot).
+
+    $ python -m tools.indexer index.db --core 0x... --network bob:testnet:node
+
+Amounts are uint256 and do not fit SQLite integers, they are stored as
+decimal strings (Store converts them back).
+"""
+import argparse
+import json
+import sqlite3
+import time
+from collections import namedtuple
+
+from .events import Decoder, PoolState, PositionState, Tokens, EVENTS, OPEN, sort
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+  key   TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+  number INTEGER PRIMARY KEY,
+  hash   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS logs (
+  block_number INTEGER NOT NULL,
+  log_index    INTEGER NOT NULL,
+  event        TEXT    NOT NULL,
+  args         TEXT    NOT NULL,
+  PRIMARY KEY (block_number, log_index)
+);
+CREATE TABLE IF NOT EXISTS pools (
+  id               INTEGER PRIMARY KEY,
+  symbol           TEXT,
+  base_token       TEXT,
+  quote_token      TEXT,
+  lp_token         TEXT,
+  base_reserves    TEXT,
+  quote_reserves   TEXT,
+  base_interest    TEXT,
+  quote_interest   TEXT,
+  base_collateral  TEXT,
+  quote_collateral TEXT
+);
+CREATE TABLE IF NOT EXISTS positions (
+  id          INTEGER PRIMARY KEY,
+  pool        INTEGER,
+  user        TEXT,
+  status      INTEGER,
+  long        INTEGER,
+  collateral  TEXT,
+  leverage    TEXT,
+  interest    TEXT,
+  entry_price TEXT,
+  exit_price  TEXT,
+  opened_at   INTEGER,
+  closed_at   INTEGER
+);
+CREATE INDEX IF NOT EXISTS positions_user ON positions (user, status, id);
+CREATE TABLE IF NOT EXISTS lp (
+  pool   INTEGER,
+  user   TEXT,
+  minted TEXT,
+  burned TEXT,
+  PRIMARY KEY (pool, user)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+  block INTEGER PRIMARY KEY,
+  state TEXT NOT NULL
+);
+"""
+
+# the columns stored as text
+AMOUNTS = {"base_reserves", "quote_reserves", "base_interest", "quote_interest",
+           "base_collateral", "quote_collateral", "collateral", "leverage", "interest",
+           "entry_price", "exit_price", "minted", "burned"}
+
+POSITION = PositionState._fields[:12] # without the tagged fields
+Position = namedtuple("Position", POSITION)
+LP       = namedtuple("LP", "pool user minted burned")
+Log      = namedtuple("Log", "event_name block_number log_index event_arguments")
+
+def to_hex(x):
+    return x if isinstance(x, str) else "0x" + bytes(x).hex()
+
+def plain(x):
+    """
+    Decoded event arguments as JSON values (structs are lists).
+    """
+    if isinstance(x, bool)              : return x
+    if isinstance(x, int)               : return int(x)
+    if isinstance(x, (bytes, bytearray)): return to_hex(x)
+    if isinstance(x, (list, tuple))     : return [plain(y) for y in x]
+    return x
+
+def row(fields, x):
+    """
+    The values of x's fields as stored (ape's integers are int subclasses).
+    """
+    values = [getattr(x, f) for f in fields]
+    return [str(int(v)) if f in AMOUNTS else
+            int(v)      if isinstance(v, int) else v for f, v in zip(fields, values)]
+
+def unrow(cls, fields, r):
+    return cls(**{f: int(v) if f in AMOUNTS else v for f, v in zip(fields, r)})
+
+def position(r):
+    pos = unrow(Position, POSITION, r)
+    # longs put up quote collateral and lock base reserves
+    return PositionState(
+        *pos,
+        collateral_tagged = Tokens(0, pos.collateral) if pos.long else Tokens(pos.collateral, 0),
+        interest_tagged   = Tokens(pos.interest, 0)   if pos.long else Tokens(0, pos.interest))
+
+########################################################################
+class Store:
+    """
+    Read access to an index (also used by Indexer to write it).
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def meta(self, key, default=None):
+        r = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if r is None else r[0]
+
+    @property
+    def last_block(self):
+        """
+        The last block indexed (None if nothing has been yet).
+        """
+        return self.meta("last_block")
+
+    def pool(self, id):
+        r = self.db.execute(f"SELECT {','.join(PoolState._fields)} FROM pools WHERE id = ?",
+                            (id,)).fetchone()
+        return None if r is None else unrow(PoolState, PoolState._fields, r)
+
+    def pools(self):
+        return [unrow(PoolState, PoolState._fields, r) for r in self.db.execute(
+            f"SELECT {','.join(PoolState._fields)} FROM pools ORDER BY id")]
+
+    def position(self, id):
+        r = self.db.execute(f"SELECT {','.join(POSITION)} FROM positions WHERE id = ?",
+                            (id,)).fetchone()
+        return None if r is None else position(r)
+
+    def user_positions(self, user, open=True, offset=0, limit=-1):
+        """
+        user's (open) positions by id (c.f. positions.lookup_user_positions).
+        """
+        where = "user = ? AND status = ?" if open else "user = ?"
+        args  = (user, OPEN) if open else (user,)
+        return [position(r) for r in self.db.execute(
+            f"SELECT {','.join(POSITION)} FROM positions WHERE {where} "
+            f"ORDER BY id LIMIT ? OFFSET ?", (*args, limit, offset))]
+
+    def lp(self, pool, user):
+        """
+        LP tokens minted and burned by user (transfers are not indexed).
+        """
+        r = self.db.execute(f"SELECT {','.join(LP._fields)} FROM lp WHERE pool = ? AND user = ?",
+                            (pool, user)).fetchone()
+        return LP(pool, user, 0, 0) if r is None else unrow(LP, LP._fields, r)
+
+    def logs(self, from_block=0, to_block=None):
+        """
+        The stored logs (with their arguments as plain JSON values).
+        """
+        return [Log(e, b, i, json.loads(a)) for b, i, e, a in self.db.execute(
+            "SELECT block_number, log_index, event, args FROM logs "
+            "WHERE block_number >= ? AND block_number <= ? ORDER BY block_number, log_index",
+            (from_block, 2**62 if to_block is None else to_block))]
+
+########################################################################
+class ApeSource:
+    """
+    Fetches core's logs through ape (e.g. from a local dev chain).
+    """
+
+    def __init__(self, core):
+        from ape import chain # optional, only needed here
+        self.chain = chain
+        self.core  = core
+        self.abis  = [getattr(core, name).abi for name in EVENTS]
+
+    def head(self):
+        return self.chain.blocks.head.number
+
+    def block_hash(self, number):
+        return to_hex(self.chain.provider.web3.eth.get_block(number)["hash"])
+
+    def logs(self, from_block, to_block):
+        # a single eth_getLogs call (ContractEvent.range() pages over blocks)
+        raw = self.chain.provider.web3.eth.get_logs({
+            "address"  : self.core.address,
+            "fromBlock": from_block,
+            "toBlock"  : to_block,
+        })
+        return self.chain.provider.network.ecosystem.decode_logs(raw, *self.abis)
+
+class Indexer:
+    """
+    Keeps a Store in sync with the chain (c.f. sync()). source provides
+    head(), block_hash(number) and logs(from_block, to_block), the latter
+    returning ape ContractLogs or anything with the same attributes.
+    """
+
+    def __init__(self, store, source, start_block=0, batch=1_000, snapshot_every=1_000):
+        self.store          = store
+        self.db             = store.db
+        self.source         = source
+        self.start_block    = start_block
+        self.batch          = batch
+        self.snapshot_every = snapshot_every
+        self.load()
+
+    ####################################################################
+    # state
+    def load(self):
+        """
+        The decoder state from the store (as of store.last_block).
+        """
+        self.decoder           = Decoder()
+        self.decoder.pools     = {p.id: p for p in self.store.pools()}
+        self.decoder.positions = {p.id: p for p in map(position, self.db.execute(
+                                  f"SELECT {','.join(POSITION)} FROM positions"))}
+        self.lps               = {(l.pool, l.user): l for l in (unrow(LP, LP._fields, r)
+                                  for r in self.db.execute(
+                                  f"SELECT {','.join(LP._fields)} FROM lp"))}
+
+    def state(self):
+        return {"pools"    : [list(p) for p in self.decoder.pools.values()],
+                "positions": [row(POSITION, p) for p in self.decoder.positions.values()],
+                "lp"       : [list(l) for l in self.lps.values()]}
+
+    def restore(self, state):
+        self.db.execute("DELETE FROM pools")
+        self.db.execute("DELETE FROM positions")
+        self.db.execute("DELETE FROM lp")
+        self.decoder           = Decoder()
+        self.decoder.pools     = {p[0]: PoolState(*p) for p in state["pools"]}
+        self.decoder.positions = {p[0]: position(p) for p in state["positions"]}
+        self.lps               = {(l[0], l[1]): LP(*l) for l in state["lp"]}
+        self.write(self.decoder.pools, self.decoder.positions, self.lps)
+
+    def write(self, pools, positions, lps):
+        """
+        Writes the given keys of the decoder state to the store.
+        """
+        for id in pools:
+            self.db.execute(f"INSERT OR REPLACE INTO pools VALUES ({','.join('?' * 11)})",
+                            row(PoolState._fields, self.decoder.pools[id]))
+        for id in positions:
+            self.db.execute(f"INSERT OR REPLACE INTO positions VALUES ({','.join('?' * 12)})",
+                            row(POSITION, self.decoder.positions[id]))
+        for key in lps:
+            self.db.execute("INSERT OR REPLACE INTO lp VALUES (?,?,?,?)",
+                            row(LP._fields, self.lps[key]))
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    ####################################################################
+    def apply(self, logs):
+        """
+        Replays logs (in chain order), returns the keys of what changed.
+        """
+        pools, positions, lps = set(), set(), set()
+        for log in logs:
+            event = self.decoder.decode(log)
+            args  = log.event_arguments
+            pools.add(int(args["pool"]))
+            if "position_id" in args:
+                positions.add(int(args["position_id"]))
+            if log.event_name in ["Mint", "Burn"]:
+                key = (int(args["pool"]), args["user"])
+                lp  = self.lps.get(key, LP(*key, 0, 0))
+                self.lps[key] = lp._replace(**{
+                    "minted" if log.event_name == "Mint" else "burned":
+                    (lp.minted if log.event_name == "Mint" else lp.burned) + int(args["lp_amt"])})
+                lps.add(key)
+        return pools, positions, lps
+
+    def sync(self, to_block=None):
+        """
+        Indexes up to to_block (default: the chain head), rolling back
+        first if the chain reorganized. Returns the last block indexed.
+        """
+        head = self.source.head() if to_block is None else to_block
+        self.check_reorg(head)
+        last = self.store.last_block
+        b    = self.start_block if last is None else last + 1
+        while b <= head:
+            e    = min(b + self.batch - 1, head)
+            logs = sort(self.source.logs(b, e))
+            with self.db:
+                for log in logs:
+                    self.db.execute("INSERT INTO logs VALUES (?,?,?,?)",
+                                    (log.block_number, log.log_index, log.event_name,
+                                     json.dumps({k: plain(v) for k, v in
+                                                 log.event_arguments.items()})))
+                    self.db.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?)",
+                                    (log.block_number, to_hex(log.block_hash)))
+                self.db.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?)",
+                                (e, self.source.block_hash(e)))
+                self.write(*self.apply(logs))
+                self.set_meta("last_block", e)
+                if e - self.store.meta("last_snapshot", -2**62) >= self.snapshot_every:
+                    self.snapshot(e)
+            b = e + 1
+        return self.store.last_block
+
+    def snapshot(self, block):
+        self.db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?)",
+                        (block, json.dumps(self.state())))
+        self.set_meta("last_snapshot", block)
+
+    ####################################################################
+    def check_reorg(self, head):
+        """
+        Rolls back to the newest stored block which is still on chain.
+        """
+        last = self.store.last_block
+        if last is None: return
+        for number, hash in self.db.execute(
+                "SELECT number, hash FROM blocks ORDER BY number DESC").fetchall():
+            if number <= head and self.source.block_hash(number) == hash:
+                if number < last: self.rollback(number)
+                return
+        self.rollback(self.start_block - 1)
+
+    def rollback(self, block):
+        """
+        Forgets everything after block.
+        """
+        with self.db:
+            for table, column in [("logs", "block_number"), ("blocks", "number"),
+                                  ("snapshots", "block")]:
+                self.db.execute(f"DELETE FROM {table} WHERE {column} > ?", (block,))
+            snap = self.db.execute("SELECT block, state FROM snapshots "
+                                   "ORDER BY block DESC LIMIT 1").fetchone()
+            since, state = (snap[0], json.loads(snap[1])) if snap else (
+                           self.start_block - 1, {"pools": [], "positions": [], "lp": []})
+            self.restore(state)
+            self.apply(self.store.logs(since + 1, block))
+            self.write(self.decoder.pools, self.decoder.positions, self.lps)
+            self.set_meta("last_block", block)
+            self.set_meta("last_snapshot", since)
+
+    def run(self, poll=2):
+        while True:
+            self.sync()
+            time.sleep(poll)
+
+########################################################################
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m tools.indexer",
+                                 description=__doc__.split("\n\n")[0].strip())
+    ap.add_argument("db",               help="SQLite file (created if missing)")
+    ap.add_argument("--core",           required=True, help="address of core")
+    ap.add_argument("--network",        default="::", help="ape network choice")
+    ap.add_argument("--start",          type=int, default=0, help="block core was deployed at")
+    ap.add_argument("--batch",          type=int, default=1_000, help="blocks per eth_getLogs")
+    ap.add_argument("--snapshot-every", type=int, default=1_000, help="blocks between snapshots")
+    ap.add_argument("--poll",           type=float, default=2, help="seconds between syncs")
+    args = ap.parse_args(argv)
+
+    from ape import networks, project
+    with networks.parse_network_choice(args.network):
+        source  = ApeSource(project.core.at(args.core))
+        indexer = Indexer(Store(args.db), source, args.start, args.batch, args.snapshot_every)
+        indexer.run(args.poll)
+
+if __name__ == "__main__":
+    main()
+
+# eof
@@ -0,0 +1,206 @@
+"""
+An index of open positions by liquidation price, so that a keeper can
+find the positions a new oracle price makes liquidatable without
+revaluing every open position.
+
+For a given block, a position's fees (and hence its remaining
+collateral) do not depend on the price, and its pnl is monotonic in the
+price: a long is liquidatable at or below some price, a short at or
+above some price (c.f. long_boundary and short_boundary, which solve
+positions.calc_pnl_* and params.is_liquidatable for it). Longs are kept
+in a max-heap and shorts in a min-heap by that price, so each new price
+pops exactly the entries it crossed: O(k log n) for k crossings.
+
+Fees keep accruing, which moves boundaries towards the current price.
+Rather than recomputing every boundary each block, an entry is computed
+with the most fees the position could pay over the next `horizon`
+blocks (at MAX_FEE for both borrowing and funding, whatever the pool
+does) and is refreshed when the horizon runs out, through a third heap
+ordered by expiry. Entries are therefore slightly early; what crossed()
+pops is checked against the exact valuation before being returned.
+Superseded entries are dropped when popped, and the heaps are rebuilt
+once they hold more than COMPACT entries per position.
+
+    index = LiquidationIndex(model, pool_id)
+    index.add(position_id)              # when a position is opened
+    index.crossed(price)                # at the current block
+    index.remove(position_id)           # when it is closed/liquidated
+
+The model is a tools.model.Core (or anything with the same positions,
+fees and params), kept up to date by the caller.
+"""
+import heapq
+
+from .model.math import DENOM, Revert
+from .model.positions import calc_pnl_short
+
+NEVER   = 2**256 # no price is this high
+PRICE   = 2**128 # prices are stored in 128 bits (c.f. positions.vy)
+COMPACT = 2      # heaps are rebuilt past this many entries per position
+
+########################################################################
+# boundaries (one = 10**base_decimals; c.f. math.base_to_quote)
+
+def required(collateral, leverage, threshold):
+    """
+    The remaining collateral at or below which a position is liquidatable
+    (c.f. params.is_liquidatable).
+    """
+    return collateral * (threshold * leverage) // 100
+
+def long_boundary(interest, entry_price, remaining, required, one):
+    """
+    The highest price at which a long is liquidatable (0 if none, NEVER
+    if all), given its remaining collateral after fees.
+
+    Below the entry price the pnl's remaining collateral is
+    remaining - (val0 - floor(interest * price / one)) (or 0), which is
+    at most required iff floor(interest * price / one) <= K below.
+    """
+    if remaining <= required: return NEVER
+    if interest == 0        : return 0
+    val0 = interest * entry_price // one
+    K    = required - remaining + val0
+    return 0 if K < 0 else ((K + 1) * one - 1) // interest
+
+def short_boundary(pos, remaining, required, liquidatable):
+    """
+    The lowest price at which a short is liquidatable (1 if all, NEVER
+    if none), given its remaining collateral after fees and
+    liquidatable(price), the exact predicate.
+
+    Ignoring rounding the pnl's remaining collateral, in base, is
+    (remaining * p - V * (p - entry)) / p with V = leverage * collateral,
+    which is at most required from V * entry / (V + required - remaining)
+    on; the rounding is corrected for by searching around that estimate.
+    """
+    if remaining <= required: return 1
+    V   = pos.leverage * pos.collateral
+    d   = V + required + 1 - remaining
+    if d <= 0: return NEVER
+    est = min(max(-(-V * pos.entry_price // d), 1), PRICE - 1)
+    # bracket the boundary: liquidatable(hi) and not liquidatable(lo)
+    if liquidatable(est):
+        hi, step = est, 1
+        while hi - step >= 1 and liquidatable(hi - step): step *= 2
+        lo = max(hi - step, 0)
+    else:
+        lo, step = est, 1
+        while lo + step < PRICE and not liquidatable(lo + step): step *= 2
+        if lo + step >= PRICE: return NEVER
+        hi = lo + step
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if liquidatable(mid): hi = mid
+        else                : lo = mid
+    return hi
+
+########################################################################
+class LiquidationIndex:
+
+    def __init__(self, model, pool, horizon=1_000):
+        self.model    = model
+        self.pool     = pool
+        self.horizon  = horizon
+        self.longs    = [] # (-boundary, id, version)
+        self.shorts   = [] # (boundary, id, version)
+        self.expiries = [] # (block, id, version)
+        self.versions = {} # id -> version of its current entries
+
+    def __len__(self):
+        return len(self.versions)
+
+    def ctx(self, price):
+        return self.model.ctx(self.pool, price)
+
+    def is_liquidatable(self, id, price):
+        try:
+            return self.model.positions.is_liquidatable(id, self.ctx(price))
+        except Revert:
+            return False
+
+    ####################################################################
+    def boundary(self, id, slack=0):
+        """
+        The price at or beyond which position id is liquidatable at the
+        current block, if it were to pay slack blocks' worth of fees at
+        MAX_FEE on top.
+        """
+        pos       = self.model.positions.lookup(id)
+        p         = self.model.params.PARAMS
+        remaining = self.model.positions.calc_fees(id).remaining
+        extra     = -(-pos.collateral * p.MAX_FEE * slack // DENOM)
+        remaining = max(remaining - 2 * extra, 0) # borrowing and funding
+        req       = required(pos.collateral, pos.leverage, p.LIQUIDATION_THRESHOLD)
+        if pos.long:
+            one = 10 ** self.ctx(pos.entry_price).base_decimals
+            return long_boundary(pos.interest, pos.entry_price, remaining, req, one)
+        def liquidatable(price):
+            try:
+                return not (calc_pnl_short(pos, self.ctx(price), remaining).remaining > req)
+            except Revert:
+                return False
+        return short_boundary(pos, remaining, req, liquidatable)
+
+    ####################################################################
+    def add(self, id):
+        """
+        Indexes (or re-indexes) open position id as of the current block.
+        """
+        version           = self.versions.get(id, 0) + 1
+        bound             = self.boundary(id, self.horizon)
+        self.versions[id] = version
+        if self.model.positions.lookup(id).long:
+            heapq.heappush(self.longs,  (-bound, id, version))
+        else:
+            heapq.heappush(self.shorts, (bound, id, version))
+        heapq.heappush(self.expiries, (self.model.block + self.horizon, id, version))
+
+    def remove(self, id):
+        # entries are dropped lazily
+        self.versions.pop(id, None)
+
+    def current(self, entry):
+        _, id, version = entry
+        return self.versions.get(id) == version
+
+    ####################################################################
+    def refresh(self):
+        """
+        Re-indexes the positions whose entries have expired.
+        """
+        while self.expiries and self.expiries[0][0] <= self.model.block:
+            entry = heapq.heappop(self.expiries)
+            if self.current(entry): self.add(entry[1])
+        if len(self.longs) + len(self.shorts) > COMPACT * len(self.versions) + 1:
+            self.compact()
+
+    def compact(self):
+        """
+        Drops the entries superseded by add() or remove(), which are
+        otherwise only dropped when popped.
+        """
+        for heap in [self.longs, self.shorts, self.expiries]:
+            heap[:] = [entry for entry in heap if self.current(entry)]
+            heapq.heapify(heap)
+
+    def crossed(self, price):
+        """
+        The indexed positions which are liquidatable at price (and the
+        current block), by id. They stay indexed until removed.
+        """
+        self.refresh()
+        popped = []
+        while self.longs and -self.longs[0][0] >= price:
+            popped.append((self.longs, heapq.heappop(self.longs)))
+        while self.shorts and self.shorts[0][0] <= price:
+            popped.append((self.shorts, heapq.heappop(self.shorts)))
+
+        res = []
+        for heap, entry in popped:
+            if not self.current(entry): continue
+            heapq.heappush(heap, entry)
+            if self.is_liquidatable(entry[1], price): res.append(entry[1])
+        return sorted(res)
+
+# eof
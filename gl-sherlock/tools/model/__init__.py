@@ -0,0 +1,27 @@
+"""
+An executable reference model of the contracts, in pure Python.
+
+Each module mirrors the contract of the same name (math, params, pools,
+fees, positions and core) with uint256 semantics: values which do not
+fit revert, as do divisions by zero, and divisions round down. It is
+meant for running many scenarios in-process (e.g. for risk analysis);
+tests/test_model.py checks it against the contracts.
+
+    >>> from tools.model import Core
+    >>> from tools.model.params import DEFAULTS as PARAMS
+    >>> m    = Core(PARAMS)
+    >>> pool = m.fresh("VEL-STX", "VEL", "STX", "LP")
+    >>> m.mint("lp", pool.id, 10_000_000, 50_000_000, price=5_000_000)
+    100000000
+    >>> m.mine()
+    >>> pos  = m.open("user", pool.id, True, 10_000_000, 2, price=5_000_000)
+    >>> pos.interest
+    3996000
+
+Operations which would revert raise Revert and leave the model unchanged.
+"""
+from .math import Revert
+from .core import Core
+from .types import *
+
+# eof
@@ -0,0 +1,43 @@
+"""
+The model's blockchain: the current block and a journal of storage
+writes, so that an operation which reverts leaves no trace.
+"""
+from .math import Revert
+
+MISSING = object()
+
+class Chain:
+
+    def __init__(self, block=1):
+        self.block   = block
+        self.journal = None
+
+    def mine(self, n=1):
+        self.block += n
+
+    def set(self, storage, key, value):
+        """
+        storage[key] = value, undone if the current transaction reverts.
+        """
+        if self.journal is not None:
+            self.journal.append((storage, key, storage.get(key, MISSING)))
+        storage[key] = value
+
+    def transact(self, fun, *args):
+        """
+        Runs fun(*args) as a transaction: if it raises Revert, all writes
+        made through set() are undone.
+        """
+        assert self.journal is None, "nested transaction"
+        self.journal = []
+        try:
+            return fun(*args)
+        except Revert:
+            for storage, key, old in reversed(self.journal):
+                if old is MISSING: del storage[key]
+                else             : storage[key] = old
+            raise
+        finally:
+            self.journal = None
+
+# eof
@@ -0,0 +1,206 @@
+"""
+Mirrors contracts/core.vy: the user operations, as seen through the api
+(i.e. with a context built from the pool's decimals and a price).
+
+Token transfers are reduced to core's balance of each token and the LP
+token balances, which is what the invariants need. Users are assumed to
+have enough tokens and to have approved core.
+"""
+from .math import u, require
+from .chain import Chain
+from .params import Params
+from .pools import Pools
+from .fees import Fees
+from .positions import Positions
+from .types import Ctx, Tokens, Liquidation
+
+class Core:
+
+    def __init__(self, params, block=1):
+        self.chain     = Chain(block)
+        self.params    = Params(params)
+        self.pools     = Pools(self.chain)
+        self.fees      = Fees(self.chain, self.params, self.pools)
+        self.positions = Positions(self.chain, self.params, self.pools, self.fees)
+        self.BALANCES  = {} # token -> core's balance
+        self.OWED      = {} # token -> reserves + collateral over all pools
+        self.COLLECTED = {} # token -> protocol fees
+        self.SUPPLY    = {} # lp_token -> total supply
+        self.LP        = {} # (lp_token, user) -> balance
+
+    @property
+    def block(self): return self.chain.block
+
+    def mine(self, n=1): self.chain.mine(n)
+
+    def ctx(self, id, price):
+        """
+        The context the api passes to core (the oracle rejects zero).
+        """
+        require(price > 0, "PRECONDITIONS")
+        bd, qd = self.pools.DECIMALS[self.pools.lookup(id).id]
+        return Ctx(price, bd, qd)
+
+    ####################################################################
+    # bookkeeping (c.f. core.vy/owe)
+    def transfer(self, token, amt):
+        """
+        Adds amt (negative for payouts) to core's balance of token.
+        """
+        if amt != 0: self.chain.set(self.BALANCES, token, u(self.BALANCES.get(token, 0) + amt))
+
+    def owe(self, token, delta):
+        if delta != 0: self.chain.set(self.OWED, token, u(self.OWED.get(token, 0) + delta))
+
+    def owe_deltas(self, pool, deltas):
+        self.owe(pool.base_token,  deltas.base_reserves  + deltas.base_collateral)
+        self.owe(pool.quote_token, deltas.quote_reserves + deltas.quote_collateral)
+
+    def INVARIANTS(self, id):
+        pool = self.pools.lookup(id)
+        for token in [pool.base_token, pool.quote_token]:
+            require(self.BALANCES.get(token, 0) >= self.OWED.get(token, 0), "INVARIANTS")
+        require(pool.base_reserves  >= pool.base_interest,  "INVARIANTS")
+        require(pool.quote_reserves >= pool.quote_interest, "INVARIANTS")
+
+    ####################################################################
+    def fresh(self, symbol, base_token, quote_token, lp_token,
+              base_decimals=6, quote_decimals=6):
+        return self.chain.transact(self._fresh, symbol, base_token, quote_token, lp_token,
+                                   base_decimals, quote_decimals)
+
+    def _fresh(self, symbol, base_token, quote_token, lp_token, base_decimals, quote_decimals):
+        require(not self.pools.exists_pair(base_token, quote_token), "PRECONDITIONS")
+        require(not self.pools.exists_pair(quote_token, base_token), "PRECONDITIONS")
+        require(lp_token not in self.SUPPLY,                         "PRECONDITIONS")
+        pool = self.pools.fresh(symbol, base_token, quote_token, lp_token,
+                                base_decimals, quote_decimals)
+        self.fees.fresh(pool.id)
+        self.chain.set(self.SUPPLY, lp_token, 0)
+        return pool
+
+    ####################################################################
+    # Each operation runs as a transaction: it either raises Revert and
+    # changes nothing, or applies all its changes.
+    def mint(self, user, id, base_amt, quote_amt, price):
+        return self.chain.transact(self._mint, user, id, base_amt, quote_amt, price)
+
+    def burn(self, user, id, lp_amt, price):
+        return self.chain.transact(self._burn, user, id, lp_amt, price)
+
+    def open(self, user, id, long, collateral0, leverage, price):
+        return self.chain.transact(self._open, user, id, long, collateral0, leverage, price)
+
+    def close(self, user, id, position_id, price):
+        return self.chain.transact(self._close, user, id, position_id, price)
+
+    def liquidate(self, user, id, position_id, price):
+        return self.chain.transact(self._liquidate, user, id, position_id, price)
+
+    ####################################################################
+    def _mint(self, user, id, base_amt, quote_amt, price):
+        ctx          = self.ctx(id, price)
+        pool         = self.pools.lookup(id)
+        total_supply = self.SUPPLY[pool.lp_token]
+        lp_amt       = self.pools.calc_mint(id, base_amt, quote_amt, total_supply, ctx)
+        require(base_amt > 0 or quote_amt > 0, "PRECONDITIONS")
+        require(lp_amt > 0,                    "PRECONDITIONS")
+
+        self.transfer(pool.base_token,  base_amt)
+        self.transfer(pool.quote_token, quote_amt)
+        self.chain.set(self.SUPPLY, pool.lp_token, u(total_supply + lp_amt))
+        self.chain.set(self.LP, (pool.lp_token, user),
+                       u(self.LP.get((pool.lp_token, user), 0) + lp_amt))
+
+        self.pools.mint(id, base_amt, quote_amt)
+        self.owe(pool.base_token,  base_amt)
+        self.owe(pool.quote_token, quote_amt)
+
+        self.fees.update(id)
+        self.INVARIANTS(id)
+        return lp_amt
+
+    def _burn(self, user, id, lp_amt, price):
+        ctx          = self.ctx(id, price)
+        pool         = self.pools.lookup(id)
+        total_supply = self.SUPPLY[pool.lp_token]
+        amts         = self.pools.calc_burn(id, lp_amt, total_supply, ctx)
+        require(amts.base > 0 or amts.quote > 0, "PRECONDITIONS")
+        require(lp_amt > 0,                      "PRECONDITIONS")
+
+        self.transfer(pool.base_token,  -amts.base)
+        self.transfer(pool.quote_token, -amts.quote)
+        self.chain.set(self.SUPPLY, pool.lp_token, u(total_supply - lp_amt))
+        self.chain.set(self.LP, (pool.lp_token, user),
+                       u(self.LP.get((pool.lp_token, user), 0) - lp_amt))
+
+        self.pools.burn(id, amts.base, amts.quote)
+        self.owe(pool.base_token,  -amts.base)
+        self.owe(pool.quote_token, -amts.quote)
+
+        self.fees.update(id)
+        self.INVARIANTS(id)
+        return amts
+
+    def _open(self, user, id, long, collateral0, leverage, price):
+        ctx        = self.ctx(id, price)
+        pool       = self.pools.lookup(id)
+        cf         = self.params.static_fees(collateral0)
+        collateral = cf.remaining
+        require(collateral > 0, "PRECONDITIONS")
+        require(cf.fee > 0,     "PRECONDITIONS")
+
+        # the protocol fee goes straight to the collector
+        token = pool.quote_token if long else pool.base_token
+        self.transfer(token, collateral)
+        self.chain.set(self.COLLECTED, token, self.COLLECTED.get(token, 0) + cf.fee)
+
+        position = self.positions.open(user, id, long, collateral, leverage, ctx)
+        self.pools.open(id, position.collateral_tagged, position.interest_tagged)
+        self.owe(pool.base_token,  position.collateral_tagged.base)
+        self.owe(pool.quote_token, position.collateral_tagged.quote)
+
+        self.fees.update(id)
+        self.INVARIANTS(id)
+        return position
+
+    def _close(self, user, id, position_id, price):
+        ctx   = self.ctx(id, price)
+        pool  = self.pools.lookup(id)
+        value = self.positions.close(position_id, ctx)
+        require(id   == value.position.pool, "PRECONDITIONS")
+        require(user == value.position.user, "PRECONDITIONS")
+        self.pools.close(id, value.deltas)
+        self.owe_deltas(pool, value.deltas)
+        self.transfer(pool.base_token,  -value.deltas.base_transfer)
+        self.transfer(pool.quote_token, -value.deltas.quote_transfer)
+
+        self.fees.update(id)
+        self.INVARIANTS(id)
+        return value
+
+    def _liquidate(self, user, id, position_id, price):
+        ctx   = self.ctx(id, price)
+        pool  = self.pools.lookup(id)
+        value = self.positions.liquidate(position_id, ctx)
+        require(id == value.position.pool, "PRECONDITIONS")
+        self.pools.close(id, value.deltas)
+        self.owe_deltas(pool, value.deltas)
+        self.fees.update(id)
+        # the liquidator gets the liquidation fee, the user the rest
+        self.transfer(pool.base_token,  -value.deltas.base_transfer)
+        self.transfer(pool.quote_token, -value.deltas.quote_transfer)
+
+        self.INVARIANTS(id)
+        return value
+
+    def liquidation(self, value):
+        """
+        How pay_liquidation() splits the payout of a liquidated position.
+        """
+        base  = self.params.liquidation_fees(value.deltas.base_transfer)
+        quote = self.params.liquidation_fees(value.deltas.quote_transfer)
+        return Liquidation(value.position.id, True,
+                           Tokens(base.fee, quote.fee), Tokens(base.remaining, quote.remaining))
+
+# eof
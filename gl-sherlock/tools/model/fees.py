@@ -0,0 +1,127 @@
+"""
+Mirrors contracts/fees.vy.
+"""
+from . import math
+from .math import u, div, Revert
+from .types import FeeState, Checkpoint, SumFees
+
+# 10^27 = max 18 decimals and 10^9 units
+ZEROS = 10**27
+
+class Fees:
+
+    def __init__(self, chain, params, pools):
+        self.chain       = chain
+        self.params      = params
+        self.pools       = pools
+        self.FEE_STORE   = {} # id -> FeeState
+        self.CHECKPOINTS = {} # (block, id) -> Checkpoint
+
+    def lookup(self, id):
+        return self.FEE_STORE[id]
+
+    def fees_at_block(self, height, id):
+        return self.CHECKPOINTS.get((height, id), EMPTY)
+
+    def checkpoint(self, id):
+        """
+        Record the sums for the current block (c.f. fees.vy).
+        """
+        fs = self.roll(self.FEE_STORE[id])
+        # packed into 128 bits each in storage
+        for x in fs[9:13]:
+            if x >= 2**128: raise Revert(None)
+        self.chain.set(self.CHECKPOINTS, (self.chain.block, id), sums(fs))
+
+    ####################################################################
+    def fresh(self, id):
+        block = self.chain.block
+        fs    = FeeState(id, block, block, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+        self.chain.set(self.FEE_STORE, id, fs)
+        return fs
+
+    ####################################################################
+    def update(self, id):
+        fs = self.current_fees(id)
+        self.chain.set(self.FEE_STORE, id, fs)
+        return fs
+
+    def current_fees(self, id):
+        # sums up to the current block
+        fs       = self.roll(self.FEE_STORE[id])
+        # current state
+        ps       = self.pools.lookup(id)
+        new_fees = self.params.dynamic_fees(ps)
+        return fs._replace(
+            borrowing_long   = new_fees.borrowing_long,
+            borrowing_short  = new_fees.borrowing_short,
+            funding_long     = new_fees.funding_long,
+            funding_short    = new_fees.funding_short,
+            long_collateral  = ps.quote_collateral,
+            short_collateral = ps.base_collateral)
+
+    def roll(self, fs):
+        """
+        Extend the sums in fs (the last updated state) up to the current
+        block (c.f. fees.vy for how funding receipts are computed).
+        """
+        new_terms = u(self.chain.block - fs.t1)
+        if new_terms == 0: return fs
+
+        paid_long_term      = apply(fs.long_collateral,  u(fs.funding_long  * new_terms))
+        received_short_term = divide(paid_long_term,     fs.short_collateral)
+        paid_short_term     = apply(fs.short_collateral, u(fs.funding_short * new_terms))
+        received_long_term  = divide(paid_short_term,    fs.long_collateral)
+
+        return fs._replace(
+            t1                  = self.chain.block,
+            borrowing_long_sum  = extend(fs.borrowing_long_sum,  fs.borrowing_long,  new_terms),
+            borrowing_short_sum = extend(fs.borrowing_short_sum, fs.borrowing_short, new_terms),
+            funding_long_sum    = extend(fs.funding_long_sum,    fs.funding_long,    new_terms),
+            funding_short_sum   = extend(fs.funding_short_sum,   fs.funding_short,   new_terms),
+            received_long_sum   = extend(fs.received_long_sum,   received_long_term,  1),
+            received_short_sum  = extend(fs.received_short_sum,  received_short_term, 1))
+
+    ####################################################################
+    def query(self, id, opened_at, fees_j):
+        """
+        The fees due from block opened_at to the block the sums in fees_j
+        were rolled to (a Checkpoint of differences).
+        """
+        fees_i = self.fees_at_block(opened_at, id)
+        return Checkpoint(*[u(j - i) for i, j in zip(fees_i, fees_j)])
+
+    def current_sums(self, id):
+        return sums(self.roll(self.FEE_STORE[id]))
+
+    def calc(self, id, long, collateral, opened_at):
+        return self.calc_at(id, long, collateral, opened_at, self.current_sums(id))
+
+    def calc_at(self, id, long, collateral, opened_at, sums):
+        period = self.query(id, opened_at, sums)
+        P_b    = apply(collateral, period.borrowing_long_sum if long else period.borrowing_short_sum)
+        P_f    = apply(collateral, period.funding_long_sum   if long else period.funding_short_sum)
+        R_f    = multiply(collateral, period.received_long_sum if long else period.received_short_sum)
+        return SumFees(funding_paid=P_f, funding_received=R_f, borrowing_paid=P_b)
+
+EMPTY = Checkpoint(0, 0, 0, 0, 0, 0)
+
+def sums(fs):
+    return Checkpoint(*fs[9:15])
+
+def extend(X, x_m, m):
+    """
+    Extend a sum X for m blocks during which x_m has not changed.
+    """
+    return u(X + u(m * x_m))
+
+def apply(amount, fee):
+    return math.apply(amount, fee).fee
+
+def divide(paid, collateral):
+    return 0 if collateral == 0 else div(u(paid * ZEROS), collateral)
+
+def multiply(ci, terms):
+    return u(ci * terms) // ZEROS
+
+# eof
@@ -0,0 +1,156 @@
+"""
+Mirrors contracts/math.vy, plus the uint256/int256 semantics the
+contracts rely on: results which do not fit revert (as do divisions by
+zero) and divisions round down.
+"""
+from .types import Tokens, Value, Fee
+
+class Revert(Exception):
+    """
+    A transaction would revert (args[0] is the reason, e.g.
+    PRECONDITIONS, or None for arithmetic errors).
+    """
+
+def require(cond, reason):
+    if not cond: raise Revert(reason)
+
+UINT256_MAX = 2**256 - 1
+INT256_MIN  = -2**255
+INT256_MAX  = 2**255 - 1
+
+def u(x):
+    """
+    Checks that x fits into a uint256.
+    """
+    if not 0 <= x <= UINT256_MAX: raise Revert(None)
+    return x
+
+def i(x):
+    """
+    Checks that x fits into an int256.
+    """
+    if not INT256_MIN <= x <= INT256_MAX: raise Revert(None)
+    return x
+
+def div(x, y):
+    if y == 0: raise Revert(None)
+    return x // y
+
+########################################################################
+# x = lower(lift(x))
+
+def lift(tokens, ctx):
+    """
+    Converts tokens to the same precision (number of decimals).
+    """
+    bd, qd = ctx.base_decimals, ctx.quote_decimals
+    s      = bd >= qd
+    m      = 10 ** (bd - qd if s else qd - bd)
+    return Tokens(tokens.base           if s else u(tokens.base * m),
+                  u(tokens.quote * m) if s else tokens.quote)
+
+def lower(tokens, ctx):
+    """
+    Converts lifted tokens back to their original representation.
+    """
+    bd, qd = ctx.base_decimals, ctx.quote_decimals
+    s      = bd >= qd
+    m      = 10 ** (bd - qd if s else qd - bd)
+    return Tokens(tokens.base        if s else tokens.base // m,
+                  tokens.quote // m if s else tokens.quote)
+
+def one(ctx):
+    """
+    Unit in the lifted representation for Ctx.
+    """
+    bd, qd = ctx.base_decimals, ctx.quote_decimals
+    return 10 ** bd if bd >= qd else 10 ** qd
+
+########################################################################
+# amount = price/one * volume
+
+def to_amount(price, volume, one1):
+    return u(price * volume) // one1
+
+def from_amount(amount, price, one1):
+    return div(u(amount * one1), price)
+
+########################################################################
+# base  = quote_to_base(base_to_quote(base))
+# quote = base_to_quote(quote_to_base(quote))
+
+def base_to_quote(tokens, ctx):
+    lifted = lift(Tokens(tokens, ctx.price), ctx)
+    amt0   = to_amount(lifted.quote, lifted.base, one(ctx))
+    return lower(Tokens(0, amt0), ctx).quote
+
+def quote_to_base(tokens, ctx):
+    l1   = lift(Tokens(0, tokens),    ctx)
+    l2   = lift(Tokens(0, ctx.price), ctx)
+    vol0 = from_amount(l1.quote, l2.quote, one(ctx))
+    return lower(Tokens(vol0, 0), ctx).base
+
+########################################################################
+def value(tokens, ctx):
+    """
+    Given a bag of tokens, computes various quantities we are interested
+    in in one place.
+    """
+    base, quote    = tokens.base, tokens.quote
+    base_as_quote  = base_to_quote(base, ctx)
+    quote_as_base  = quote_to_base(quote, ctx)
+    have_more_base = base_as_quote > quote
+    return Value(
+        base                  = base,
+        quote                 = quote,
+        base_as_quote         = base_as_quote,
+        quote_as_base         = quote_as_base,
+        total_as_base         = u(base + quote_as_base),
+        total_as_quote        = u(quote + base_as_quote),
+        have_more_base        = have_more_base,
+        base_excess_as_base   = u(base - quote_as_base) if have_more_base else 0,
+        base_excess_as_quote  = u(base_as_quote - quote) if have_more_base else 0,
+        quote_excess_as_base  = 0 if have_more_base else u(quote_as_base - base),
+        quote_excess_as_quote = 0 if have_more_base else u(quote - base_as_quote),
+    )
+
+########################################################################
+def balanced(state, burn_value, ctx):
+    """
+    A mix of tokens of total value burn_value which improves pool balance
+    (c.f. math.vy).
+    """
+    if state.have_more_base:
+        if state.base_excess_as_quote >= burn_value:
+            return Tokens(quote_to_base(burn_value, ctx), 0)
+        base1 = state.base_excess_as_base
+        left  = u(burn_value - state.base_excess_as_quote)
+        quote = left // 2
+        base2 = quote_to_base(quote, ctx)
+        return Tokens(u(base1 + base2), quote)
+    else:
+        if state.quote_excess_as_quote >= burn_value:
+            return Tokens(0, burn_value)
+        quote1 = state.quote_excess_as_quote
+        left   = u(burn_value - quote1)
+        quote2 = left // 2
+        base   = quote_to_base(quote2, ctx)
+        return Tokens(base, u(quote1 + quote2))
+
+########################################################################
+DENOM = 1_000_000_000
+
+def apply(x, numerator):
+    """
+    Computes x*fee capped at x.
+    """
+    fee = u(x * numerator) // DENOM
+    return Fee(x, fee if fee <= x else x, x - fee if fee <= x else 0)
+
+def add_delta(x, delta):
+    """
+    Applies a net change to a balance, reverts if the result is negative.
+    """
+    return u(i(i(x) + delta))
+
+# eof
@@ -0,0 +1,94 @@
+"""
+Mirrors contracts/params.vy.
+"""
+from .math import u, div
+from .types import Parameters, DynFees, Fee
+
+# the parameters the tests use (c.f. tests/conftest.py)
+DEFAULTS = {
+  'MIN_FEE'               : 1,
+  'MAX_FEE'               : 1,
+  'PROTOCOL_FEE'          : 1000,
+  'LIQUIDATION_FEE'       : 2,
+  'MIN_LONG_COLLATERAL'   : 1,
+  'MAX_LONG_COLLATERAL'   : 1_000_000_000,
+  'MIN_SHORT_COLLATERAL'  : 1,
+  'MAX_SHORT_COLLATERAL'  : 1_000_000_000,
+  'MIN_LONG_LEVERAGE'     : 1,
+  'MAX_LONG_LEVERAGE'     : 10,
+  'MIN_SHORT_LEVERAGE'    : 1,
+  'MAX_SHORT_LEVERAGE'    : 10,
+  'LIQUIDATION_THRESHOLD' : 1,
+}
+
+class Params:
+
+    def __init__(self, params):
+        self.set_params(params)
+
+    def set_params(self, params):
+        # accepts the dicts the tests pass to params.__init__2()
+        self.PARAMS = params if isinstance(params, Parameters) else Parameters(**params)
+
+    ####################################################################
+    # fee computation (borrowing & funding fees)
+    def dynamic_fees(self, pool):
+        min_fee, max_fee  = self.PARAMS.MIN_FEE, self.PARAMS.MAX_FEE
+        long_utilization  = utilization(pool.base_reserves,  pool.base_interest)
+        short_utilization = utilization(pool.quote_reserves, pool.quote_interest)
+        borrowing_long    = check_fee(scale(max_fee, long_utilization),  min_fee, max_fee)
+        borrowing_short   = check_fee(scale(max_fee, short_utilization), min_fee, max_fee)
+        funding_long      = funding_fee(borrowing_long,  long_utilization,  short_utilization,
+                                        min_fee, max_fee)
+        funding_short     = funding_fee(borrowing_short, short_utilization, long_utilization,
+                                        min_fee, max_fee)
+        return DynFees(borrowing_long, borrowing_short, funding_long, funding_short)
+
+    ####################################################################
+    # one-off protocol fee
+    def static_fees(self, collateral):
+        fee = div(collateral, self.PARAMS.PROTOCOL_FEE)
+        return Fee(collateral, fee, collateral - fee)
+
+    ####################################################################
+    # position properties
+    def is_legal_position(self, pool, position):
+        p = self.PARAMS
+        if position.long:
+            return (p.MIN_LONG_COLLATERAL <= position.collateral <= p.MAX_LONG_COLLATERAL and
+                    p.MIN_LONG_LEVERAGE   <= position.leverage   <= p.MAX_LONG_LEVERAGE)
+        else:
+            return (p.MIN_SHORT_COLLATERAL <= position.collateral <= p.MAX_SHORT_COLLATERAL and
+                    p.MIN_SHORT_LEVERAGE   <= position.leverage   <= p.MAX_SHORT_LEVERAGE)
+
+    def is_liquidatable(self, position, pnl):
+        percent  = u(self.PARAMS.LIQUIDATION_THRESHOLD * position.leverage)
+        required = u(position.collateral * percent) // 100
+        return not (pnl.remaining > required)
+
+    def liquidation_fees(self, amt):
+        fee = div(amt, self.PARAMS.LIQUIDATION_FEE)
+        return Fee(amt, fee, amt - fee)
+
+def utilization(reserves, interest):
+    """
+    Reserve utilization in percent (rounded down).
+    """
+    return 0 if (reserves == 0 or interest == 0) else div(interest, reserves // 100)
+
+def scale(fee, utilization):
+    return u(fee * utilization) // 100
+
+def check_fee(fee, min_fee, max_fee):
+    if min_fee <= fee <= max_fee: return fee
+    elif fee < min_fee          : return min_fee
+    else                        : return max_fee
+
+def imbalance(n, m):
+    return n - m if n >= m else 0
+
+def funding_fee(base_fee, col1, col2, min_fee, max_fee):
+    imb = imbalance(col1, col2)
+    return 0 if imb == 0 else check_fee(scale(base_fee, imb), min_fee, max_fee)
+
+# eof
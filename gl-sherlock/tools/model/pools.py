@@ -0,0 +1,125 @@
+"""
+Mirrors contracts/pools.vy.
+"""
+from . import math
+from .math import u, div, require
+from .types import PoolState, Tokens
+
+class Pools:
+
+    def __init__(self, chain):
+        self.chain      = chain
+        self.POOLS      = {} # id -> PoolState
+        self.PAIR_INDEX = {} # (base_token, quote_token) -> id
+        self.DECIMALS   = {} # id -> (base, quote)
+
+    def get_nr_pools(self):
+        return len(self.POOLS)
+
+    def exists(self, id):
+        return id in self.POOLS
+
+    def exists_pair(self, base_token, quote_token):
+        return (base_token, quote_token) in self.PAIR_INDEX
+
+    def lookup(self, id):
+        require(self.exists(id), "PRECONDITIONS")
+        return self.POOLS[id]
+
+    def lookup_pair(self, base_token, quote_token):
+        require(self.exists_pair(base_token, quote_token), "PRECONDITIONS")
+        return self.POOLS[self.PAIR_INDEX[(base_token, quote_token)]]
+
+    ####################################################################
+    def fresh(self, symbol, base_token, quote_token, lp_token, base_decimals, quote_decimals):
+        id   = len(self.POOLS) + 1
+        pool = PoolState(id, symbol, base_token, quote_token, lp_token, 0, 0, 0, 0, 0, 0)
+        self.chain.set(self.POOLS,      id,                        pool)
+        self.chain.set(self.PAIR_INDEX, (base_token, quote_token), id)
+        self.chain.set(self.DECIMALS,   id,                        (base_decimals, quote_decimals))
+        return pool
+
+    def total_reserves(self, id):
+        pool = self.lookup(id)
+        return Tokens(pool.base_reserves, pool.quote_reserves)
+
+    def unlocked_reserves(self, id):
+        return unlocked(self.lookup(id))
+
+    ####################################################################
+    def mint(self, id, base_amt, quote_amt):
+        pool = self.lookup(id)
+        self.chain.set(self.POOLS, id, pool._replace(
+            base_reserves  = u(pool.base_reserves  + base_amt),
+            quote_reserves = u(pool.quote_reserves + quote_amt)))
+
+    def calc_mint(self, id, base_amt, quote_amt, total_supply, ctx):
+        pv = math.value(self.total_reserves(id), ctx).total_as_quote
+        mv = math.value(Tokens(base_amt, quote_amt), ctx).total_as_quote
+        return f(mv, pv, total_supply)
+
+    def burn(self, id, base_amt, quote_amt):
+        pool = self.lookup(id)
+        self.chain.set(self.POOLS, id, pool._replace(
+            base_reserves  = u(pool.base_reserves  - base_amt),
+            quote_reserves = u(pool.quote_reserves - quote_amt)))
+
+    def max_burn(self, id, total_supply, ctx):
+        pv = math.value(self.total_reserves(id),    ctx).total_as_quote
+        uv = math.value(self.unlocked_reserves(id), ctx).total_as_quote
+        return u(div(u(uv * total_supply), pv) - 1)
+
+    def calc_burn(self, id, lp_amt, total_supply, ctx):
+        pv       = math.value(self.total_reserves(id), ctx).total_as_quote
+        bv       = g(lp_amt, total_supply, pv)
+        unlocked = self.unlocked_reserves(id)
+        value    = math.value(unlocked, ctx)
+        uv       = value.total_as_quote
+        amts     = math.balanced(value, bv, ctx)
+        require(uv         >= bv,             "PRECONDITIONS")
+        require(amts.base  <= unlocked.base,  "PRECONDITIONS")
+        require(amts.quote <= unlocked.quote, "PRECONDITIONS")
+        return amts
+
+    ####################################################################
+    def open(self, id, collateral, interest):
+        """
+        Update accounting to reflect a new position being opened.
+        """
+        pool     = self.lookup(id)
+        reserves = unlocked(pool)
+        require(reserves.base  >= interest.base,  "PRECONDITIONS")
+        require(reserves.quote >= interest.quote, "PRECONDITIONS")
+        self.chain.set(self.POOLS, id, pool._replace(
+            base_interest    = u(pool.base_interest    + interest.base),
+            quote_interest   = u(pool.quote_interest   + interest.quote),
+            base_collateral  = u(pool.base_collateral  + collateral.base),
+            quote_collateral = u(pool.quote_collateral + collateral.quote)))
+
+    def close(self, id, d):
+        """
+        Apply transfers resulting from a position close to pool state.
+        """
+        pool = self.lookup(id)
+        self.chain.set(self.POOLS, id, pool._replace(
+            base_reserves    = math.add_delta(pool.base_reserves,    d.base_reserves),
+            quote_reserves   = math.add_delta(pool.quote_reserves,   d.quote_reserves),
+            base_interest    = math.add_delta(pool.base_interest,    d.base_interest),
+            quote_interest   = math.add_delta(pool.quote_interest,   d.quote_interest),
+            base_collateral  = math.add_delta(pool.base_collateral,  d.base_collateral),
+            quote_collateral = math.add_delta(pool.quote_collateral, d.quote_collateral)))
+
+def unlocked(pool):
+    return Tokens(u(pool.base_reserves  - pool.base_interest),
+                  u(pool.quote_reserves - pool.quote_interest))
+
+# LP tokens represent shares of the pool reserves, c.f. pools.vy
+#   mint: lp = mv/pv * total_lp_tokens
+#   burn: bv = lp/total_lp_tokens * pv
+def f(mv, pv, ts):
+    return mv if ts == 0 else div(u(mv * ts), pv)
+
+def g(lp, ts, pv):
+    return div(u(lp * pv), ts)
+
+# eof
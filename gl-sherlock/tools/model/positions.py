@@ -0,0 +1,217 @@
+"""
+Mirrors contracts/positions.vy (without the UI lookups, but with the
+per-user limit on open positions).
+"""
+from . import math
+from .math import u, i, require, Revert
+from .types import (PositionState, PositionValue, FeesPaid, PnL, Deltas, Tokens,
+                    Ctx, OPEN, CLOSED, LIQUIDATABLE)
+
+MAX_POSITIONS = 500 # open positions per user
+
+class Positions:
+
+    def __init__(self, chain, params, pools, fees):
+        self.chain             = chain
+        self.params            = params
+        self.pools             = pools
+        self.fees              = fees
+        self.POSITIONS         = {} # id -> PositionState
+        self.NR_USER_POSITIONS = {} # user -> number of open positions
+
+    def get_nr_positions(self):
+        return len(self.POSITIONS)
+
+    def exists(self, id):
+        return id in self.POSITIONS
+
+    def lookup(self, id):
+        require(self.exists(id), "PRECONDITIONS")
+        return self.POSITIONS[id]
+
+    def get_nr_user_positions(self, user):
+        return self.NR_USER_POSITIONS.get(user, 0)
+
+    ####################################################################
+    def open(self, user, pool, long, collateral, leverage, ctx):
+        # longs buy base tokens with quote collateral and shorts buy quote
+        # tokens with base collateral
+        virtual_tokens = (math.quote_to_base(collateral, ctx) if long else
+                          math.base_to_quote(collateral, ctx))
+        interest       = u(virtual_tokens * leverage)
+        pos            = PositionState(
+            id                = len(self.POSITIONS) + 1,
+            pool              = pool,
+            user              = user,
+            status            = OPEN,
+            long              = long,
+            collateral        = collateral,
+            leverage          = leverage,
+            interest          = interest,
+            entry_price       = ctx.price,
+            exit_price        = 0,
+            opened_at         = self.chain.block,
+            closed_at         = 0,
+            collateral_tagged = Tokens(0, collateral) if long else Tokens(collateral, 0),
+            interest_tagged   = Tokens(interest, 0)   if long else Tokens(0, interest),
+        )
+        ps = self.pools.lookup(pool)
+        require(self.params.is_legal_position(ps, pos), None)
+
+        n = self.get_nr_user_positions(user)
+        require(n < MAX_POSITIONS, "PRECONDITIONS")
+        self.chain.set(self.NR_USER_POSITIONS, user, n + 1)
+        self.fees.checkpoint(pool)
+        # stored packed (c.f. positions.vy)
+        if max(collateral, interest, ctx.price) >= 2**128 or leverage >= 2**24:
+            raise Revert(None)
+        self.chain.set(self.POSITIONS, pos.id, pos)
+        return pos
+
+    ####################################################################
+    def value(self, id, ctx):
+        """
+        Value a position at a point in time (the current block).
+        """
+        return self._value(self.lookup(id), ctx)
+
+    def _value(self, pos, ctx):
+        fees = self._calc_fees(pos)
+        pnl  = self._calc_pnl(pos, ctx, fees.remaining)
+        # c.f. positions.vy for the accounting steps
+        if pos.long:
+            deltas = Deltas(
+                base_interest    = -pos.interest,
+                quote_interest   = 0,
+                base_transfer    = u(pnl.payout + fees.funding_received),
+                base_reserves    = -pnl.payout,
+                base_collateral  = -fees.funding_received,
+                quote_transfer   = 0,
+                quote_reserves   = i(pos.collateral - fees.funding_paid),
+                quote_collateral = i(fees.funding_paid - pos.collateral),
+            )
+        else:
+            deltas = Deltas(
+                base_interest    = 0,
+                quote_interest   = -pos.interest,
+                base_transfer    = 0,
+                base_reserves    = i(pos.collateral - fees.funding_paid),
+                base_collateral  = i(fees.funding_paid - pos.collateral),
+                quote_transfer   = u(pnl.payout + fees.funding_received),
+                quote_reserves   = -pnl.payout,
+                quote_collateral = -fees.funding_received,
+            )
+        return PositionValue(pos, fees, pnl, deltas)
+
+    ####################################################################
+    def calc_fees(self, id):
+        return self._calc_fees(self.lookup(id))
+
+    def _calc_fees(self, pos):
+        pool = self.pools.lookup(pos.pool)
+        fees = self.fees.calc(pos.pool, pos.long, pos.collateral, pos.opened_at)
+        return fees_paid(pos.collateral, fees,
+                         pool.base_collateral if pos.long else pool.quote_collateral)
+
+    ####################################################################
+    def calc_pnl(self, id, ctx, remaining):
+        return self._calc_pnl(self.lookup(id), ctx, remaining)
+
+    def _calc_pnl(self, pos, ctx, remaining):
+        return (calc_pnl_long(pos, ctx, remaining) if pos.long else
+                calc_pnl_short(pos, ctx, remaining))
+
+    ####################################################################
+    def is_liquidatable(self, id, ctx):
+        return self._is_liquidatable(self.lookup(id), ctx)
+
+    def _is_liquidatable(self, pos, ctx):
+        fees = self._calc_fees(pos)
+        pnl  = self._calc_pnl(pos, ctx, fees.remaining)
+        return self.params.is_liquidatable(pos, pnl)
+
+    def status(self, id, ctx):
+        pos = self.lookup(id)
+        return LIQUIDATABLE if self._is_liquidatable(pos, ctx) else pos.status
+
+    ####################################################################
+    def close(self, id, ctx):
+        return self._value(self._close(self.lookup(id), ctx), ctx)
+
+    def liquidate(self, id, ctx):
+        """
+        Like close() but the position must be liquidatable.
+        """
+        value = self._value(self._close(self.lookup(id), ctx), ctx)
+        require(self.params.is_liquidatable(value.position, value.pnl), "PRECONDITIONS")
+        return value
+
+    def _close(self, pos, ctx):
+        require(pos.status == OPEN,              "PRECONDITIONS")
+        require(self.chain.block > pos.opened_at, "PRECONDITIONS")
+        pos = pos._replace(status=CLOSED, exit_price=ctx.price, closed_at=self.chain.block)
+        if ctx.price >= 2**128: raise Revert(None)
+        self.chain.set(self.POSITIONS, pos.id, pos)
+        self.chain.set(self.NR_USER_POSITIONS, pos.user, self.NR_USER_POSITIONS[pos.user] - 1)
+        return pos
+
+########################################################################
+def deduct(x, y):
+    """
+    (remaining, deducted)
+    """
+    return (x - y, y) if x >= y else (0, x)
+
+def fees_paid(collateral, fees, avail):
+    # funding fees prioritized over borrowing fees
+    remaining1, funding_paid   = deduct(collateral, fees.funding_paid)
+    remaining,  borrowing_paid = deduct(remaining1, fees.borrowing_paid)
+    # negative positions get no funding, funding received is paid out
+    # first come first serve
+    funding_received = 0 if remaining == 0 else min(fees.funding_received, avail)
+    return FeesPaid(
+        funding_paid          = funding_paid,
+        funding_paid_want     = fees.funding_paid,
+        funding_received      = funding_received,
+        funding_received_want = fees.funding_received,
+        borrowing_paid        = borrowing_paid,
+        borrowing_paid_want   = fees.borrowing_paid,
+        remaining             = remaining,
+    )
+
+def final_value(remaining, loss, profit):
+    return (0                if remaining == 0 else
+            0                if loss > remaining else
+            remaining - loss if loss > 0 else
+            u(remaining + profit))
+
+def calc_pnl_long(pos, ctx, remaining):
+    ctx0    = Ctx(pos.entry_price, ctx.base_decimals, ctx.quote_decimals)
+    vtokens = pos.interest
+    val0    = math.base_to_quote(vtokens, ctx0)
+    val1    = math.base_to_quote(vtokens, ctx)
+    loss    = val0 - val1 if val0 > val1 else 0
+    profit  = val1 - val0 if val1 > val0 else 0
+    final   = final_value(remaining, loss, profit)
+    # accounting in quote, payout in base
+    payout  = math.quote_to_base(final, ctx)
+    require(payout <= pos.interest, "INVARIANTS")
+    return PnL(loss, profit, final - profit if final > profit else final, payout)
+
+def calc_pnl_short(pos, ctx, remaining_as_base):
+    ctx0      = Ctx(pos.entry_price, ctx.base_decimals, ctx.quote_decimals)
+    vtokens   = u(pos.leverage * pos.collateral)
+    val0      = math.base_to_quote(vtokens, ctx0)
+    val1      = math.base_to_quote(vtokens, ctx)
+    loss      = val1 - val0 if val1 > val0 else 0
+    profit    = val0 - val1 if val0 > val1 else 0
+    # the remaining collateral is valued at the current price
+    remaining = math.base_to_quote(remaining_as_base, ctx)
+    final     = final_value(remaining, loss, profit)
+    # accounting in quote, payout in quote
+    payout    = final
+    left      = math.quote_to_base(0 if loss > remaining else remaining - loss, ctx)
+    require(payout <= pos.interest, "INVARIANTS")
+    return PnL(loss, profit, left, payout)
+
+# eof
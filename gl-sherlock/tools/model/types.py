@@ -0,0 +1,49 @@
+"""
+Mirrors contracts/types.vy (the structs shared with tools/events.py are
+imported from there).
+"""
+from collections import namedtuple
+
+from ..events import (Ctx, Tokens, PoolState, PositionState, FeesPaid, PnL,
+                      Deltas, PositionValue, OPEN, CLOSED)
+
+# Status enum values (vyper enums are bit flags)
+LIQUIDATABLE = 4
+
+Value         = namedtuple("Value", [
+    "base", "quote",
+    "base_as_quote", "quote_as_base",
+    "total_as_base", "total_as_quote",
+    "have_more_base",
+    "base_excess_as_base", "base_excess_as_quote",
+    "quote_excess_as_base", "quote_excess_as_quote",
+])
+Fee           = namedtuple("Fee", "x fee remaining")
+Parameters    = namedtuple("Parameters", [
+    "MIN_FEE", "MAX_FEE",
+    "PROTOCOL_FEE", "LIQUIDATION_FEE",
+    "MIN_LONG_COLLATERAL", "MAX_LONG_COLLATERAL",
+    "MIN_SHORT_COLLATERAL", "MAX_SHORT_COLLATERAL",
+    "MIN_LONG_LEVERAGE", "MAX_LONG_LEVERAGE",
+    "MIN_SHORT_LEVERAGE", "MAX_SHORT_LEVERAGE",
+    "LIQUIDATION_THRESHOLD",
+])
+DynFees       = namedtuple("DynFees", "borrowing_long borrowing_short funding_long funding_short")
+FeeState      = namedtuple("FeeState", [
+    "id", "t0", "t1",
+    "borrowing_long", "borrowing_short",
+    "funding_long", "funding_short",
+    "long_collateral", "short_collateral",
+    "borrowing_long_sum", "borrowing_short_sum",
+    "funding_long_sum", "funding_short_sum",
+    "received_long_sum", "received_short_sum",
+])
+Checkpoint    = namedtuple("Checkpoint", [
+    "borrowing_long_sum", "borrowing_short_sum",
+    "funding_long_sum", "funding_short_sum",
+    "received_long_sum", "received_short_sum",
+])
+SumFees       = namedtuple("SumFees", "funding_paid funding_received borrowing_paid")
+Liquidation   = namedtuple("Liquidation", "position_id liquidated fees remaining")
+
+# eof
@@ -0,0 +1,423 @@
+"""
+Monte Carlo risk analysis of the fee and liquidation parameters.
+
+A portfolio of positions is opened against a fresh pool and then run over
+many simulated price paths at once: every quantity is a numpy array with
+one row per path (and one column per position), computed with the
+formulas from params.vy, fees.vy and positions.vy (c.f. tools/model for
+the exact version, one transaction at a time).
+
+Every `step` blocks the fee sums are rolled forward, all open positions
+are valued at the path's price and the liquidatable ones are liquidated
+(as if keepers were watching); whatever is still open at the end is
+closed. For each path we report
+
+  drawdown         largest fall of the LPs' mark-to-market value (the
+                   reserves after closing every open position, in quote)
+                   from its running peak, as a fraction of the peak
+  negative         liquidated positions whose loss exceeded their
+                   remaining collateral (i.e. which left bad debt)
+  bad_debt         the sum of those excess losses, in quote
+  liquidated       positions liquidated before the end
+  funding_want     funding owed to closed positions (funding_received_want)
+  funding_received funding actually paid out to them (capped by the other
+                   side's collateral, first come first serve)
+
+Arithmetic is float64 with the contracts' rounding (floor) applied, so
+results are exact for amounts below 2**53 and estimates beyond. Paths are
+simulated in chunks on a process pool and every parameter set sees the
+same paths.
+
+    $ python -m tools.risk --paths 10000 --vol 0.5 \\
+        --grid LIQUIDATION_THRESHOLD=1,5,10 --grid MAX_LONG_LEVERAGE=5,10
+"""
+import argparse
+import itertools
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .model.params import DEFAULTS
+from .model.types import Parameters
+
+DENOM = 1_000_000_000
+ZEROS = 1e27 # 10**27 does not fit an int64
+
+Pool      = namedtuple("Pool", "base_reserves quote_reserves base_decimals quote_decimals")
+Portfolio = namedtuple("Portfolio", "long collateral leverage")
+Report    = namedtuple("Report", [
+    "drawdown", "negative", "bad_debt", "liquidated",
+    "funding_want", "funding_received",
+])
+Value     = namedtuple("Value", [
+    "funding_paid", "funding_received_want", "borrowing_paid", "remaining",
+    "loss", "profit", "pnl_remaining", "payout",
+])
+
+########################################################################
+# math.vy (one = 10**base_decimals)
+
+def base_to_quote(tokens, price, one):
+    return np.floor(tokens * price / one)
+
+def quote_to_base(tokens, price, one):
+    return np.floor(tokens * one / price)
+
+def apply(x, fee):
+    return np.minimum(np.floor(x * fee / DENOM), x)
+
+########################################################################
+# params.vy
+
+def utilization(reserves, interest):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        util = np.floor(interest / np.floor(reserves / 100))
+    return np.where((reserves == 0) | (interest == 0), 0, util)
+
+def scale(fee, util):
+    return np.floor(fee * util / 100)
+
+def check_fee(fee, min_fee, max_fee):
+    return np.where(fee < min_fee, min_fee, np.where(fee > max_fee, max_fee, fee))
+
+def imbalance(n, m):
+    return np.where(n >= m, n - m, 0)
+
+def funding_fee(base_fee, col1, col2, min_fee, max_fee):
+    imb = imbalance(col1, col2)
+    return np.where(imb == 0, 0, check_fee(scale(base_fee, imb), min_fee, max_fee))
+
+def dynamic_fees(p, base_reserves, quote_reserves, base_interest, quote_interest):
+    """
+    (borrowing_long, borrowing_short, funding_long, funding_short)
+    """
+    long_utilization  = utilization(base_reserves,  base_interest)
+    short_utilization = utilization(quote_reserves, quote_interest)
+    borrowing_long    = check_fee(scale(p.MAX_FEE, long_utilization),  p.MIN_FEE, p.MAX_FEE)
+    borrowing_short   = check_fee(scale(p.MAX_FEE, short_utilization), p.MIN_FEE, p.MAX_FEE)
+    funding_long      = funding_fee(borrowing_long,  long_utilization,  short_utilization,
+                                    p.MIN_FEE, p.MAX_FEE)
+    funding_short     = funding_fee(borrowing_short, short_utilization, long_utilization,
+                                    p.MIN_FEE, p.MAX_FEE)
+    return borrowing_long, borrowing_short, funding_long, funding_short
+
+def is_legal_position(p, long, collateral, leverage):
+    return np.where(long,
+      (p.MIN_LONG_COLLATERAL  <= collateral) & (collateral <= p.MAX_LONG_COLLATERAL) &
+      (p.MIN_LONG_LEVERAGE    <= leverage)   & (leverage   <= p.MAX_LONG_LEVERAGE),
+      (p.MIN_SHORT_COLLATERAL <= collateral) & (collateral <= p.MAX_SHORT_COLLATERAL) &
+      (p.MIN_SHORT_LEVERAGE   <= leverage)   & (leverage   <= p.MAX_SHORT_LEVERAGE))
+
+def is_liquidatable(p, collateral, leverage, pnl_remaining):
+    required = np.floor(collateral * (p.LIQUIDATION_THRESHOLD * leverage) / 100)
+    return ~(pnl_remaining > required)
+
+########################################################################
+# fees.vy
+
+def divide(paid, collateral):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(collateral == 0, 0, np.floor(paid * ZEROS / collateral))
+
+def multiply(ci, terms):
+    return np.floor(ci * terms / ZEROS)
+
+def roll(sums, fees, base_collateral, quote_collateral, new_terms):
+    """
+    Extends the sums (borrowing_long, borrowing_short, funding_long,
+    funding_short, received_long, received_short) by new_terms blocks at
+    the given fees (longs have quote collateral, shorts base).
+    """
+    borrowing_long, borrowing_short, funding_long, funding_short = fees
+    paid_long  = apply(quote_collateral, funding_long  * new_terms)
+    paid_short = apply(base_collateral,  funding_short * new_terms)
+    return sums + np.stack([borrowing_long * new_terms, borrowing_short * new_terms,
+                            funding_long   * new_terms, funding_short   * new_terms,
+                            divide(paid_short, quote_collateral),
+                            divide(paid_long,  base_collateral)])
+
+########################################################################
+# positions.vy
+
+def value(long, collateral, leverage, interest, entry_price, price, one, sums):
+    """
+    Fees and pnl of positions opened when the sums were zero, given the
+    sums as of now (c.f. roll).
+    """
+    bl, bs, fl, fs, rl, rs = sums
+    P_b     = apply(collateral, np.where(long, bl, bs))
+    P_f     = apply(collateral, np.where(long, fl, fs))
+    R_f     = multiply(collateral, np.where(long, rl, rs))
+    # funding fees prioritized over borrowing fees
+    fp      = np.minimum(collateral, P_f)
+    bp      = np.minimum(collateral - fp, P_b)
+    rem     = collateral - fp - bp
+    # long: interest is in base, accounting in quote
+    # short: leverage * collateral is in base, remaining valued in quote
+    vtokens = np.where(long, interest, leverage * collateral)
+    val0    = base_to_quote(vtokens, entry_price, one)
+    val1    = base_to_quote(vtokens, price, one)
+    up      = np.where(long, val1 > val0, val0 > val1)
+    loss    = np.where(up, 0, np.abs(val1 - val0))
+    profit  = np.where(up, np.abs(val1 - val0), 0)
+    rem_q   = np.where(long, rem, base_to_quote(rem, price, one))
+    final   = np.where((rem_q == 0) | (loss > rem_q), 0,
+                       np.where(loss > 0, rem_q - loss, rem_q + profit))
+    payout  = np.where(long, quote_to_base(final, price, one), final)
+    left    = np.where(long,
+                np.where(final > profit, final - profit, final),
+                quote_to_base(np.where(loss > rem_q, 0, rem_q - loss), price, one))
+    return Value(fp, R_f, bp, rem, loss, profit, left, payout)
+
+def received(long, v, eligible, base_collateral, quote_collateral):
+    """
+    Funding paid out to the eligible positions with collateral left, in
+    portfolio order until the other side's collateral is gone (longs are
+    paid from the shorts' base collateral and vice versa).
+    """
+    want = np.where(eligible & (v.remaining > 0), v.funding_received_want, 0)
+    out  = np.zeros_like(want)
+    for side, avail in [(long, base_collateral), (~long, quote_collateral)]:
+        w      = np.where(side, want, 0)
+        before = np.cumsum(w, axis=1) - w
+        out   += np.clip(avail[:, None] - before, 0, w)
+    return out
+
+def deltas(long, collateral, interest, v, recv):
+    """
+    The changes to (base_reserves, quote_reserves, base_interest,
+    quote_interest, base_collateral, quote_collateral) when closing.
+    """
+    kept = collateral - v.funding_paid
+    return (np.where(long, -v.payout, kept),
+            np.where(long, kept, -v.payout),
+            np.where(long, -interest, 0),
+            np.where(long, 0, -interest),
+            np.where(long, -recv, -kept),
+            np.where(long, -kept, -recv))
+
+########################################################################
+def price_paths(price, vol, paths, steps, rng):
+    """
+    Geometric brownian motion without drift from price, with a standard
+    deviation of log prices of vol at the end.
+    """
+    sigma = vol / np.sqrt(steps)
+    z     = rng.standard_normal((paths, steps))
+    logs  = np.cumsum(sigma * z - sigma**2 / 2, axis=1)
+    logs  = np.concatenate([np.zeros((paths, 1)), logs], axis=1)
+    return np.maximum(np.floor(price * np.exp(logs)), 1)
+
+def random_portfolio(n, max_collateral, max_leverage, rng):
+    """
+    n positions, long or short with equal probability.
+    """
+    return Portfolio(long       = rng.random(n) < 0.5,
+                     collateral = rng.integers(max_collateral // 10, max_collateral + 1, n),
+                     leverage   = rng.integers(1, max_leverage + 1, n))
+
+def load_portfolio(path):
+    """
+    A JSON list of {"long": bool, "collateral": int, "leverage": int}.
+    """
+    with open(path) as f:
+        ps = json.load(f)
+    return Portfolio(np.array([p["long"]       for p in ps], bool),
+                     np.array([p["collateral"] for p in ps], np.int64),
+                     np.array([p["leverage"]   for p in ps], np.int64))
+
+########################################################################
+def open_positions(p, pool, portfolio, price):
+    """
+    The positions core.open would accept, one after another, at price:
+    (opened, collateral, leverage, interest).
+    """
+    one        = 10.0 ** pool.base_decimals
+    long       = np.asarray(portfolio.long, bool)
+    collateral = np.asarray(portfolio.collateral, float)
+    leverage   = np.asarray(portfolio.leverage, float)
+    # protocol fee
+    fee        = np.floor(collateral / p.PROTOCOL_FEE)
+    collateral = collateral - fee
+    interest   = leverage * np.where(long, quote_to_base(collateral, price, one),
+                                           base_to_quote(collateral, price, one))
+    ok         = (fee > 0) & (collateral > 0) & is_legal_position(p, long, collateral, leverage)
+    # unlocked reserves
+    opened     = np.zeros(len(long), bool)
+    locked     = {True: 0.0, False: 0.0}
+    reserves   = {True: pool.base_reserves, False: pool.quote_reserves}
+    for k in np.flatnonzero(ok):
+        side = bool(long[k])
+        if locked[side] + interest[k] <= reserves[side]:
+            locked[side] += interest[k]
+            opened[k]     = True
+    return opened, collateral, leverage, interest
+
+def simulate(p, pool, portfolio, prices, step):
+    """
+    Runs the portfolio over prices (paths x steps+1, prices[:, 0] is the
+    opening price) with step blocks between columns.
+    """
+    paths, steps = prices.shape[0], prices.shape[1] - 1
+    one          = 10.0 ** pool.base_decimals
+    price0       = prices[0, 0]
+    long         = np.asarray(portfolio.long, bool)
+    opened, collateral, leverage, interest = open_positions(p, pool, portfolio, price0)
+
+    def full(x): return np.full(paths, float(x))
+    base_reserves    = full(pool.base_reserves)
+    quote_reserves   = full(pool.quote_reserves)
+    base_interest    = full(interest[opened &  long].sum())
+    quote_interest   = full(interest[opened & ~long].sum())
+    base_collateral  = full(collateral[opened & ~long].sum())
+    quote_collateral = full(collateral[opened &  long].sum())
+    is_open          = np.tile(opened, (paths, 1))
+    sums             = np.zeros((6, paths))
+    fees             = dynamic_fees(p, base_reserves, quote_reserves, base_interest, quote_interest)
+
+    peak             = base_to_quote(base_reserves, price0, one) + quote_reserves
+    report           = Report(*[np.zeros(paths) for _ in Report._fields])
+
+    for t in range(1, steps + 1):
+        sums  = roll(sums, fees, base_collateral, quote_collateral, step)
+        price = prices[:, t][:, None]
+        v     = value(long, collateral, leverage, interest, price0, price, one, sums[:, :, None])
+        liq   = is_open & is_liquidatable(p, collateral, leverage, v.pnl_remaining)
+        close = is_open if t == steps else liq
+
+        # mark to market: as if every open position were closed now
+        recv  = received(long, v, is_open, base_collateral, quote_collateral)
+        d     = [(x * is_open).sum(1) for x in deltas(long, collateral, interest, v, recv)]
+        mtm   = base_to_quote(base_reserves + d[0], prices[:, t], one) + quote_reserves + d[1]
+        peak  = np.maximum(peak, mtm)
+        np.maximum(report.drawdown, (peak - mtm) / peak, out=report.drawdown)
+
+        # liquidate (at the end close everything)
+        recv  = received(long, v, close, base_collateral, quote_collateral)
+        d     = [(x * close).sum(1) for x in deltas(long, collateral, interest, v, recv)]
+        base_reserves    += d[0]
+        quote_reserves   += d[1]
+        base_interest    += d[2]
+        quote_interest   += d[3]
+        base_collateral  += d[4]
+        quote_collateral += d[5]
+        is_open          &= ~close
+
+        rem_q  = np.where(long, v.remaining, base_to_quote(v.remaining, price, one))
+        excess = np.maximum(v.loss - rem_q, 0) * liq
+        report.liquidated[:]       += (liq * (t < steps)).sum(1)
+        report.negative[:]         += (excess > 0).sum(1)
+        report.bad_debt[:]         += excess.sum(1)
+        report.funding_want[:]     += (v.funding_received_want * close).sum(1)
+        report.funding_received[:] += (recv * close).sum(1)
+
+        fees = dynamic_fees(p, base_reserves, quote_reserves, base_interest, quote_interest)
+
+    return report
+
+########################################################################
+def run(args):
+    """
+    Simulates one chunk of paths for one parameter set (a top-level
+    function so that it can be sent to a worker process).
+    """
+    params, pool, portfolio, price, vol, paths, steps, step, seed = args
+    prices = price_paths(price, vol, paths, steps, np.random.default_rng(seed))
+    return simulate(Parameters(**params), pool, portfolio, prices, step)
+
+def sweep(grid, params, pool, portfolio, price, vol, paths, steps, step,
+          seed=0, chunk=1_000, workers=None):
+    """
+    Simulates every combination of the values in grid (name -> values,
+    each overriding params) and yields (overrides, Report). Chunk k of
+    the paths is seeded with [seed, k] for every combination.
+    """
+    points = [dict(zip(grid, vs)) for vs in itertools.product(*grid.values())]
+    chunks = [(k, min(chunk, paths - k)) for k in range(0, paths, chunk)]
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [[executor.submit(run, ({**params, **point}, pool, portfolio,
+                                          price, vol, n, steps, step, [seed, k]))
+                    for k, n in chunks]
+                   for point in points]
+        for point, fs in zip(points, futures):
+            reports = [f.result() for f in fs]
+            yield point, Report(*[np.concatenate(xs) for xs in zip(*reports)])
+
+def summary(report):
+    want = report.funding_want.sum()
+    return {
+      'drawdown_mean'     : float(report.drawdown.mean()),
+      'drawdown_p99'      : float(np.percentile(report.drawdown, 99)),
+      'drawdown_max'      : float(report.drawdown.max()),
+      'negative_mean'     : float(report.negative.mean()),
+      'negative_paths'    : float((report.negative > 0).mean()),
+      'bad_debt_mean'     : float(report.bad_debt.mean()),
+      'liquidated_mean'   : float(report.liquidated.mean()),
+      'funding_shortfall' : 0.0 if want == 0 else float(1 - report.funding_received.sum() / want),
+    }
+
+########################################################################
+def parse_grid(arg):
+    name, _, values = arg.partition("=")
+    if name not in Parameters._fields or not values:
+        raise argparse.ArgumentTypeError(f"expected PARAM=v1,v2,... with PARAM one of "
+                                         f"{', '.join(Parameters._fields)}")
+    return name, [int(v) for v in values.split(",")]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m tools.risk",
+                                 description=__doc__.split("\n\n")[0].strip())
+    ap.add_argument("--params",         help="JSON file with parameters (default: the tests')")
+    ap.add_argument("--grid",           type=parse_grid, action="append", default=[],
+                    metavar="PARAM=v1,v2,...", help="parameter values to sweep (repeatable)")
+    ap.add_argument("--portfolio",      help="JSON file with positions (default: random)")
+    ap.add_argument("--positions",      type=int,   default=100)
+    ap.add_argument("--max-collateral", type=int,   default=100_000_000)
+    ap.add_argument("--max-leverage",   type=int,   default=10)
+    ap.add_argument("--base-reserves",  type=int,   default=10_000_000_000)
+    ap.add_argument("--quote-reserves", type=int,   default=50_000_000_000)
+    ap.add_argument("--base-decimals",  type=int,   default=6)
+    ap.add_argument("--quote-decimals", type=int,   default=6)
+    ap.add_argument("--price",          type=int,   default=5_000_000)
+    ap.add_argument("--vol",            type=float, default=0.5,
+                    help="standard deviation of log prices at the end")
+    ap.add_argument("--paths",          type=int,   default=1_000)
+    ap.add_argument("--steps",          type=int,   default=100)
+    ap.add_argument("--step",           type=int,   default=100, help="blocks per step")
+    ap.add_argument("--seed",           type=int,   default=0)
+    ap.add_argument("--chunk",          type=int,   default=1_000, help="paths per task")
+    ap.add_argument("--workers",        type=int,   default=os.cpu_count())
+    ap.add_argument("--json",           action="store_true", help="one JSON object per line")
+    args = ap.parse_args(argv)
+
+    params = dict(DEFAULTS)
+    if args.params:
+        with open(args.params) as f:
+            params.update(json.load(f))
+    pool      = Pool(args.base_reserves, args.quote_reserves,
+                     args.base_decimals, args.quote_decimals)
+    portfolio = (load_portfolio(args.portfolio) if args.portfolio else
+                 random_portfolio(args.positions, args.max_collateral, args.max_leverage,
+                                  np.random.default_rng(args.seed)))
+    grid      = dict(args.grid)
+
+    header = None
+    for point, report in sweep(grid, params, pool, portfolio, args.price, args.vol,
+                               args.paths, args.steps, args.step,
+                               args.seed, args.chunk, args.workers):
+        row = {**point, **summary(report)}
+        if args.json:
+            print(json.dumps(row), flush=True)
+            continue
+        if header is None:
+            header = list(row)
+            print("  ".join(f"{h:>{max(len(h), 10)}}" for h in header))
+        print("  ".join(f"{row[h]:>{max(len(h), 10)}.4g}" for h in header), flush=True)
+
+if __name__ == "__main__":
+    main()
+
+# eof